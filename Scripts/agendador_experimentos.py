@@ -0,0 +1,345 @@
+import os
+import sys
+import json
+import time
+import shlex
+import signal
+import argparse
+import subprocess
+
+from resultados_db import DB_NAME, run_exists
+
+# Agendador das varreduras de experimentos (substitui os laços dos servidorN_*.sh).
+#
+# A matriz ERs × VEs × TRs × cenários × métodos vira um DAG de tarefas:
+#   first_run (1 por rota/seed)  →  seleção (1 por método: todos os ERs)  →  second_run (1 por ER × TR)
+# O first_run só simula e grava as visitas no cache do controlador; as seleções
+# leem esse cache, então nenhuma rota é simulada duas vezes.
+#
+# O pool distribui os núcleos: cada tarefa reserva os núcleos que usa (--threads
+# do SUMO ou --grasp_workers) e só começa quando cabem no orçamento (--cores).
+# Cada tarefa concluída vai para um diário (JSON lines); ao rodar de novo com o
+# mesmo --state_dir, o que já terminou (e cujas saídas existem) é pulado.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER = os.path.join(SCRIPT_DIR, "controlador_pa_opt.py")
+WORKER = os.path.join(SCRIPT_DIR, "servidor_trabalho.py")  # <-- (S22) fork-server com a rede pré-carregada
+JOURNAL_NAME = "agendador.jsonl"
+KIND_PRIORITY = {"first_run": 0, "selecao": 1, "second_run": 2}  # destrava o DAG mais cedo
+POLL_SEC = 0.2
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def format_time(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class Task:
+    def __init__(self, task_id, kind, cmd, deps=(), cores=1, outputs=(), result=None, info=None):
+        self.id = task_id
+        self.kind = kind
+        self.cmd = cmd
+        self.deps = list(deps)
+        self.cores = cores
+        self.outputs = list(outputs)
+        self.result = result  # (banco, configuração) da linha que a tarefa grava nos resultados
+        self.info = info or {}
+
+    def log_name(self):
+        return self.id.replace("/", "__") + ".log"
+
+    def outputs_exist(self, work_dir):
+        if not all(os.path.isfile(os.path.join(work_dir, p)) for p in self.outputs):
+            return False
+        if self.result is not None:
+            db, config = self.result
+            return run_exists(os.path.join(work_dir, db), **config)
+        return True
+
+def stage_threads(cores, parallel_tasks):
+    """Threads por SUMO para que `parallel_tasks` instâncias ocupem os núcleos sem sobrar nem disputar."""
+    return max(1, cores // max(1, min(parallel_tasks, cores)))
+
+def build_tasks(args, first_threads, second_threads):
+    """
+    Monta o DAG da varredura na ordem dos laços do script bash. A seleção repete
+    o --threads do first_run: ele faz parte da chave do cache do first_run.
+    """
+    extra = shlex.split(args.controller_args)
+    out = args.out_dir
+    results_db = os.path.join(out, DB_NAME)
+    if "--results_db" in extra[:-1]:
+        results_db = extra[extra.index("--results_db") + 1]
+    run = [sys.executable, CONTROLLER]
+    if args.worker_socket:
+        # (S22) Cada tarefa vira um cliente do servidor de trabalho; o job roda num fork dele
+        run = [sys.executable, WORKER, "submit", "--socket", os.path.abspath(args.worker_socket), "--"]
+    tasks = []
+    for ve in args.ves:
+        for scenario, seed in zip(args.scenarios, args.seeds):
+            route = f"rotas_{ve}_{scenario}_mod.rou.xml"
+            base = route.replace("_mod.rou.xml", "")
+            common = run + ["--route_file", route, "--seed", str(seed),
+                            "--out_dir", out] + extra
+            first_common = common + ["--threads", str(first_threads)]
+            info = {"ve": ve, "scenario": scenario, "seed": seed, "route_file": route}
+
+            first_id = f"first_run/{base}/seed{seed}"
+            tasks.append(Task(first_id, "first_run", first_common + ["--mode", "first_run_multi", "--visits_only"],
+                              cores=first_threads, outputs=[os.path.join("output", f"lane_visits_{base}.npz")],
+                              info=info))
+            for method in args.methods:
+                add_files = {er: os.path.join(out, f"parking_areas_{method}_{base}_er{er}.add.xml") for er in args.ers}
+                select_id = f"selecao/{method}/{base}/seed{seed}"
+                tasks.append(Task(select_id, "selecao",
+                                  first_common + ["--mode", "first_run_multi", "--methods", method,
+                                            "--ers"] + [str(er) for er in args.ers]
+                                  + ["--capacity", str(args.capacity), "--grasp_workers", str(args.grasp_workers)],
+                                  deps=[first_id], cores=args.grasp_workers if method == "grasp" else 1,
+                                  outputs=list(add_files.values()), info=dict(info, method=method)))
+                for er in args.ers:
+                    for tr in args.trs:
+                        tasks.append(Task(f"second_run/{method}/{base}/seed{seed}/er{er}/tr{tr:g}", "second_run",
+                                          common + ["--threads", str(second_threads),
+                                                    "--mode", "second_run", "--method", method, "--er", str(er),
+                                                    "--tr_min", f"{tr:g}", "--rep", str(scenario),
+                                                    "--add_file", add_files[er]],
+                                          deps=[select_id], cores=second_threads,
+                                          result=(results_db, {"heuristic": method, "ER": er, "VE": ve, "TR": tr,
+                                                               "rep": scenario, "seed": seed, "route_file": route}),
+                                          info=dict(info, method=method, er=er, tr=tr)))
+    return tasks
+
+class Journal:
+    """Diário append-only das tarefas terminadas; a última linha de cada tarefa vale."""
+
+    def __init__(self, path):
+        self.path = path
+        self.status = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # linha cortada por uma queda no meio da escrita
+                    self.status[entry["id"]] = entry["status"]
+
+    def done(self, task, work_dir):
+        return self.status.get(task.id) == "ok" and task.outputs_exist(work_dir)
+
+    def record(self, task, status, rc, seconds):
+        self.status[task.id] = status
+        entry = {"id": task.id, "kind": task.kind, "status": status, "rc": rc,
+                 "seconds": round(seconds, 3), "end": time.strftime("%Y-%m-%d %H:%M:%S"), **task.info}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+class Scheduler:
+    """Executa o DAG num pool limitado por núcleos, registrando cada conclusão no diário."""
+
+    def __init__(self, tasks, cores, journal, work_dir, log_dir, fail_fast=False):
+        self.tasks = {t.id: t for t in tasks}
+        self.order = {t.id: k for k, t in enumerate(tasks)}
+        self.cores = cores
+        self.journal = journal
+        self.work_dir = work_dir
+        self.log_dir = log_dir
+        self.fail_fast = fail_fast
+        self.running = {}  # id -> (Popen, arquivo de log, início)
+        self.failed = set()
+        self.skipped = set()
+        self.times = {}
+
+    def run(self):
+        pending = {tid for tid, t in self.tasks.items() if not self.journal.done(t, self.work_dir)}
+        resumed = len(self.tasks) - len(pending)
+        total = len(pending)
+        if resumed:
+            print(f"♻️  {resumed} tarefa(s) já concluída(s) no diário; faltam {total}.")
+        t_start = time.time()
+        finished = 0
+        try:
+            while pending or self.running:
+                self._skip_blocked(pending)
+                self._launch_ready(pending)
+                for tid in self._reap():
+                    finished += 1
+                    elapsed = time.time() - t_start
+                    eta = format_time(elapsed / finished * (total - finished)) if finished else "--:--:--"
+                    print(f"[{finished}/{total}] {100.0 * finished / max(total, 1):6.2f}%  {tid}  "
+                          f"({'ok' if tid not in self.failed else 'FALHOU'})  "
+                          f"Elapsed: {format_time(elapsed)}  ETA: {eta}", flush=True)
+                if self.failed and self.fail_fast:
+                    print("❌ --fail_fast: interrompendo a varredura.")
+                    self._terminate()
+                    break
+                time.sleep(POLL_SEC)
+        except KeyboardInterrupt:
+            print("\n⏹️  Interrompido: encerrando as tarefas em execução (o diário mantém o que terminou).")
+            self._terminate()
+            raise
+        return not self.failed and not self.skipped
+
+    def _skip_blocked(self, pending):
+        """Dependentes (diretos ou não) de tarefas que falharam não rodam nesta passada."""
+        changed = True
+        while changed:
+            changed = False
+            for tid in sorted(pending):
+                if any(d in self.failed or d in self.skipped for d in self.tasks[tid].deps):
+                    pending.discard(tid)
+                    self.skipped.add(tid)
+                    changed = True
+
+    def _used_cores(self):
+        return sum(min(self.tasks[tid].cores, self.cores) for tid in self.running)
+
+    def _launch_ready(self, pending):
+        ready = [tid for tid in pending
+                 if all(d not in pending and d not in self.running and d not in self.failed and d not in self.skipped
+                        for d in self.tasks[tid].deps)]
+        ready.sort(key=lambda tid: (KIND_PRIORITY[self.tasks[tid].kind], self.order[tid]))
+        used = self._used_cores()
+        for tid in ready:
+            task = self.tasks[tid]
+            need = min(task.cores, self.cores)
+            if used + need > self.cores and self.running:
+                continue
+            log = open(os.path.join(self.log_dir, task.log_name()), "w")
+            proc = subprocess.Popen(task.cmd, cwd=self.work_dir, stdout=log, stderr=subprocess.STDOUT,
+                                    env=dict(os.environ, PYTHONHASHSEED="0"))
+            self.running[tid] = (proc, log, time.time())
+            pending.discard(tid)
+            used += need
+
+    def _reap(self):
+        done = []
+        for tid, (proc, log, t0) in list(self.running.items()):
+            rc = proc.poll()
+            if rc is None:
+                continue
+            log.close()
+            del self.running[tid]
+            seconds = time.time() - t0
+            task = self.tasks[tid]
+            ok = rc == 0 and task.outputs_exist(self.work_dir)
+            if not ok:
+                self.failed.add(tid)
+            self.journal.record(task, "ok" if ok else "failed", rc, seconds)
+            self.times.setdefault((task.kind, task.info.get("method")), []).append(seconds)
+            done.append(tid)
+        return done
+
+    def _terminate(self):
+        for proc, log, _ in self.running.values():
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        for proc, log, _ in self.running.values():
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+        self.running.clear()
+
+    def summary(self):
+        lines = [f"{'Etapa':<11} | {'Método':<8} | {'Exec.':>5} | {'Total':>8} | {'Médio':>8} | {'Mín.':>8} | {'Máx.':>8}"]
+        for (kind, method), values in sorted(self.times.items(), key=lambda kv: (KIND_PRIORITY[kv[0][0]], kv[0][1] or "")):
+            lines.append(f"{kind:<11} | {method or '-':<8} | {len(values):>5} | {format_time(sum(values)):>8} | "
+                         f"{sum(values) / len(values):>8.1f} | {min(values):>8.1f} | {max(values):>8.1f}")
+        return "\n".join(lines)
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Agendador (DAG + pool por núcleos + retomada) das varreduras do controlador.")
+    ap.add_argument("--ers", nargs="+", type=int, default=[10, 20, 30])
+    ap.add_argument("--ves", nargs="+", type=int, default=[5, 10, 20])
+    ap.add_argument("--trs", nargs="+", type=float, default=[0.2], help="Tempos de recarga (min)")
+    ap.add_argument("--methods", nargs="+", choices=["random", "greedy", "grasp", "celf", "pmedian"],
+                    default=["random", "greedy", "grasp"])
+    ap.add_argument("--scenarios", nargs="+", type=int, default=[0, 1, 2, 3, 4],
+                    help="Usa rotas_<VE>_<cenário>_mod.rou.xml")
+    ap.add_argument("--seeds", nargs="+", type=int, default=[2025, 2026, 2027, 2028, 2029],
+                    help="Seed de mesmo índice do cenário (mapeamento 1:1)")
+    ap.add_argument("--capacity", type=int, default=5)
+    ap.add_argument("--cores", type=int, default=None, help="Núcleos do pool (padrão: os disponíveis)")
+    ap.add_argument("--threads", type=int, default=None,
+                    help="--threads de cada SUMO (padrão: núcleos ÷ first_runs que cabem em paralelo)")
+    ap.add_argument("--grasp_workers", type=int, default=1, help="Processos do GRASP em cada seleção")
+    ap.add_argument("--out_dir", default="output_agendador")
+    ap.add_argument("--state_dir", default=None, help="Diário e logs das tarefas (padrão: <out_dir>/agendador)")
+    ap.add_argument("--controller_args", default="",
+                    help="Opções extras repassadas ao controlador, ex.: \"--backend libsumo --graph_backend csr\"")
+    ap.add_argument("--worker_socket", default=None,
+                    help="Roda as tarefas no servidor_trabalho.py que atende neste socket (suba-o com --max_jobs >= --cores)")
+    ap.add_argument("--restart", action="store_true", help="Ignora o diário e roda a varredura inteira")
+    ap.add_argument("--fail_fast", action="store_true", help="Para tudo na primeira tarefa que falhar")
+    ap.add_argument("--dry_run", action="store_true", help="Só lista as tarefas e dependências")
+    return ap.parse_args(argv)
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main(argv=None):
+    args = parse_args(argv)
+    if len(args.scenarios) != len(args.seeds):
+        sys.exit(f"❌ --scenarios e --seeds devem ter o mesmo tamanho ({len(args.scenarios)} × {len(args.seeds)}).")
+    work_dir = os.getcwd()
+    missing = [f"rotas_{ve}_{sc}_mod.rou.xml" for ve in args.ves for sc in args.scenarios
+               if not os.path.isfile(f"rotas_{ve}_{sc}_mod.rou.xml")]
+    if missing and not args.dry_run:
+        sys.exit(f"❌ Arquivos de rotas não encontrados: {', '.join(missing)}")
+
+    cores = args.cores or available_cores()
+    first_runs = len(args.ves) * len(args.scenarios)
+    second_runs = first_runs * len(args.methods) * len(args.ers) * len(args.trs)
+    first_threads = args.threads or stage_threads(cores, first_runs)
+    second_threads = args.threads or stage_threads(cores, second_runs)
+    tasks = build_tasks(args, first_threads, second_threads)
+
+    print(f"🗂️  {len(tasks)} tarefas: {first_runs} first_run, {first_runs * len(args.methods)} seleções, "
+          f"{second_runs} second_run")
+    print(f"🧮 {cores} núcleos; threads por SUMO: first_run {first_threads}, second_run {second_threads} "
+          f"(até {max(1, cores // second_threads)} second_runs em paralelo)")
+    if args.dry_run:
+        for task in tasks:
+            deps = f"  ← {', '.join(task.deps)}" if task.deps else ""
+            print(f"  [{task.cores}c] {task.id}{deps}")
+        return 0
+
+    state_dir = args.state_dir or os.path.join(args.out_dir, "agendador")
+    log_dir = os.path.join(state_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    journal_path = os.path.join(state_dir, JOURNAL_NAME)
+    if args.restart and os.path.isfile(journal_path):
+        os.replace(journal_path, journal_path + time.strftime(".%Y%m%d_%H%M%S"))
+    journal = Journal(journal_path)
+    print(f"📒 Diário: {journal_path} | Logs: {log_dir}")
+
+    scheduler = Scheduler(tasks, cores, journal, work_dir, log_dir, fail_fast=args.fail_fast)
+    # kill/SIGTERM também derruba os SUMOs filhos em vez de deixá-los órfãos
+    signal.signal(signal.SIGTERM, _interrupt)
+    t0 = time.time()
+    try:
+        ok = scheduler.run()
+    except KeyboardInterrupt:
+        return 130
+    print(f"\n⏱️  Tempo total: {format_time(time.time() - t0)}")
+    print(scheduler.summary())
+    if not ok:
+        print(f"❌ {len(scheduler.failed)} tarefa(s) falharam e {len(scheduler.skipped)} ficaram para trás "
+              f"(rode de novo para retomar). Logs em {log_dir}")
+        for tid in sorted(scheduler.failed):
+            print(f"   - {tid}")
+        return 1
+    print(f"✅ Varredura concluída. Resultados em {os.path.join(args.out_dir, 'resultados_execucoes.csv')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+import os
+import sys
+import csv
+import time
+import heapq
+import random
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from indice_rede import _string_array, _decode
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+    from oraculo_alt import free_flow_times
+except ImportError:
+    csr_matrix = None  # o controlador importa este módulo; só o avaliador precisa do scipy
+
+# Avaliador substituto das estações: estima D_estacao e T_espera de um conjunto
+# de PAs sem rodar o second_run.
+#
+# Entrada: os pontos de decisão do first_run (para cada VE de bateria baixa, a
+# primeira edge em que foi visto e o instante; é onde o second_run escolhe a
+# estação) e o conjunto de estações (lanes + vagas, ou um .add.xml).
+#
+#   D_estacao — a mesma escolha do second_run (--station_choice distance):
+#               estação mais próxima pela tabela edge × estação do controlador;
+#   T_espera  — viagem em fluxo livre (edge atual + caminho + edge da estação,
+#               × --congestion) mais a fila:
+#               cada estação é uma fila FIFO com `vagas` servidores e recarga de
+#               duração fixa (TR); a espera é o tempo até a primeira vaga livre.
+#
+# As colunas de distância e de tempo são calculadas uma vez por lane candidata
+# (Dijkstra reverso em lote); avaliar um conjunto é só um argmin sobre as colunas
+# e uma passada pela fila, então milhares de conjuntos cabem em segundos. O
+# comando `validar` confronta o substituto com os second_runs já gravados.
+
+DECISIONS_VERSION = 1
+DEFAULT_CAPACITY = 5
+# Nenhum VE alcança uma estação: pior que qualquer conjunto que atende alguém
+EMPTY_ESTIMATE = {"D_estacao": float("inf"), "T_espera": float("inf"), "T_viagem": float("inf"),
+                  "T_fila": float("inf"), "N_atendidos": 0}
+
+class DecisionPoints:
+    """Onde e quando cada VE de bateria baixa decide ir a uma estação, em ordem de tempo."""
+
+    def __init__(self, vehicles, edges, times, source="first_run"):
+        order = np.argsort(np.asarray(times, dtype=np.float64), kind="stable")
+        self.vehicles = [vehicles[i] for i in order]
+        self.edges = [edges[i] for i in order]
+        self.times = np.asarray(times, dtype=np.float64)[order]
+        self.source = source
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def save(self, path):
+        """Grava em .npz de forma atômica (arquivo temporário + rename)."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, version=np.int64(DECISIONS_VERSION), vehicles=_string_array(self.vehicles),
+                     edges=_string_array(self.edges), times=self.times)
+        os.replace(tmp, path)
+        return path
+
+def decision_points_from_dict(points):
+    """{vid: (edge, instante)} do run_simulation -> DecisionPoints."""
+    vehicles = list(points)
+    return DecisionPoints(vehicles, [points[v][0] for v in vehicles], [points[v][1] for v in vehicles])
+
+def load_decision_points(path):
+    with np.load(path) as data:
+        if int(data["version"]) != DECISIONS_VERSION:
+            raise ValueError(f"{path}: versão {int(data['version'])}, esperada {DECISIONS_VERSION}")
+        return DecisionPoints(_decode(data["vehicles"]), _decode(data["edges"]), data["times"])
+
+def decision_points_from_routes(route_file, vehicles=None):
+    """
+    Aproximação sem first_run gravado: a decisão acontece na partida (a bateria
+    é forçada abaixo do limiar na primeira leitura), na edge de origem da rota.
+    """
+    from metadados_rotas import load_route_metadata
+    meta = load_route_metadata(route_file)
+    mask = meta.type_mask("electric_vehicle")
+    ids, departs, origins = meta.vehicle_ids(mask), meta.depart[mask], meta.origins(mask)
+    keep = [i for i, v in enumerate(ids) if (vehicles is None or v in vehicles) and np.isfinite(departs[i])]
+    return DecisionPoints([ids[i] for i in keep], [origins[i] for i in keep], departs[keep].tolist(),
+                          source="rotas")
+
+def read_add_file(add_file):
+    """(lanes, vagas) dos <parkingArea> de um .add.xml, na ordem do arquivo."""
+    lanes, capacity = [], []
+    for _, elem in ET.iterparse(add_file, events=("end",)):
+        if elem.tag == "parkingArea":
+            lanes.append(elem.get("lane"))
+            capacity.append(int(elem.get("roadsideCapacity", 0)))
+        elem.clear()
+    return lanes, capacity
+
+def queue_waits(arrivals, capacity, charge_s):
+    """Espera FIFO de cada chegada numa estação com `capacity` vagas e recarga de charge_s."""
+    free = [0.0] * max(capacity, 1)
+    waits = np.zeros(len(arrivals))
+    for k in np.argsort(arrivals, kind="stable").tolist():
+        start = max(arrivals[k], free[0])
+        waits[k] = start - arrivals[k]
+        heapq.heapreplace(free, start + charge_s)
+    return waits
+
+class SurrogateEvaluator:
+    """
+    Substituto do second_run para uma rota: `evaluate(lanes)` devolve as métricas
+    estimadas; `screen(placements)` ordena muitos conjuntos pelo T_espera estimado.
+    """
+
+    def __init__(self, net_file, graph, decisions, tr_min, congestion=1.0):
+        if csr_matrix is None:
+            sys.exit("❌ scipy não encontrado. Instale-o (pip install scipy) para usar o avaliador substituto.")
+        # Import local: o controlador importa este módulo (pontos de decisão)
+        import controlador_pa_opt as ctrl
+        self.ctrl = ctrl
+        self.net_file = net_file
+        self.graph = graph
+        self.index = ctrl.get_net_index(net_file)
+        self.decisions = decisions
+        self.charge_s = tr_min * 60
+        self.congestion = congestion
+        self.rows = np.array([self.index.edge_position(e) for e in decisions.edges], dtype=np.intp)
+        self.valid = self.rows >= 0
+        self.times = decisions.times
+        self._col = {}  # lane -> coluna em _dist/_time
+        self._dist = np.empty((len(decisions), 0))
+        self._time = np.empty((len(decisions), 0))
+        self._reverse_ff = None
+        self._edge_ff = free_flow_times(self.index)
+
+    def _free_flow_reverse(self):
+        if self._reverse_ff is None:
+            n = len(self.index.node_ids)
+            src = np.asarray(self.index.array("graph_src"))
+            dst = np.asarray(self.index.array("graph_dst"))
+            weight = self._edge_ff[np.asarray(self.index.array("graph_edge"))]
+            self._reverse_ff = csr_matrix((weight, (dst, src)), shape=(n, n))
+        return self._reverse_ff
+
+    def prepare(self, lanes):
+        """Calcula (uma vez) as colunas de distância e de tempo das lanes ainda não vistas."""
+        new = [lane for lane in dict.fromkeys(lanes) if lane not in self._col and self.index.edge_of_lane(lane)]
+        if not new:
+            return
+        stations = [(lane, lane, self.index.edge_of_lane(lane)) for lane in new]
+        table = self.ctrl.build_station_distance_table(self.graph, self.net_file, stations)
+        dist = np.full((len(self.decisions), len(new)), np.inf)
+        dist[self.valid] = table.matrix[self.rows[self.valid]]
+
+        edge_to = np.asarray(self.index.array("edge_to"))
+        starts = np.array([self.index.edge_nodes(e)[0] for _, _, e in stations], dtype=object)
+        start_pos = np.array([self.index.node_position(n) if n else -1 for n in starts], dtype=np.intp)
+        travel = np.full(dist.shape, np.inf)
+        ok = start_pos >= 0
+        if ok.any():
+            # Tempo de cada nó ATÉ o início da edge da estação (grafo reverso, fluxo livre)
+            node_time = dijkstra(self._free_flow_reverse(), directed=True, indices=start_pos[ok])
+            ends = edge_to[self.rows[self.valid]]
+            block = np.full((self.valid.sum(), ok.sum()), np.inf)
+            has_end = ends >= 0
+            block[has_end] = node_time[:, ends[has_end]].T
+            # O VE ainda percorre a edge em que decidiu, e a PA fica na edge da estação
+            block += self._edge_ff[self.rows[self.valid]][:, None]
+            block += self._edge_ff[[self.index.edge_position(e) for _, _, e in stations]][ok][None, :]
+            sub = travel[self.valid]
+            sub[:, ok] = block
+            travel[self.valid] = sub
+        for k, lane in enumerate(new):
+            self._col[lane] = self._dist.shape[1] + k
+        self._dist = np.hstack([self._dist, dist])
+        self._time = np.hstack([self._time, travel])
+
+    def evaluate(self, lanes, capacity=None):
+        """
+        Métricas estimadas de um conjunto de estações (lanes na ordem do .add.xml):
+        D_estacao (km), T_espera (s) = T_viagem + T_fila, e quantos VEs acharam estação.
+        As médias são dos VEs atendidos; sem nenhum, os tempos e a distância são inf.
+        """
+        capacity = [DEFAULT_CAPACITY] * len(lanes) if capacity is None else list(capacity)
+        known = [(lane, cap) for lane, cap in zip(lanes, capacity) if self.index.edge_of_lane(lane)]
+        lanes = [lane for lane, _ in known]
+        capacity = [cap for _, cap in known]
+        self.prepare(lanes)
+        if not lanes:
+            return dict(EMPTY_ESTIMATE)
+        cols = [self._col[lane] for lane in lanes]
+        dist = self._dist[:, cols]
+        # Mais próxima; empate fica com a primeira da lista (ordem do registro no second_run)
+        choice = np.argmin(dist, axis=1)
+        picked = dist[np.arange(len(dist)), choice]
+        served = np.isfinite(picked)
+        travel = self._time[:, cols][np.arange(len(dist)), choice] * self.congestion
+        arrivals = self.times + travel
+        waits = np.zeros(len(dist))
+        for s in np.unique(choice[served]).tolist():
+            members = np.flatnonzero(served & (choice == s))
+            waits[members] = queue_waits(arrivals[members], capacity[s], self.charge_s)
+        n = int(served.sum())
+        if not n:
+            return dict(EMPTY_ESTIMATE)
+        return {
+            "D_estacao": float(picked[served].mean() / 1000.0),
+            "T_espera": float((travel[served] + waits[served]).mean()),
+            "T_viagem": float(travel[served].mean()),
+            "T_fila": float(waits[served].mean()),
+            "N_atendidos": n,
+        }
+
+    def screen(self, placements, top=None, key="T_espera"):
+        """
+        Avalia muitos conjuntos (listas de lanes); devolve [(métricas, conjunto)] do
+        melhor para o pior: primeiro quem atende mais VEs, depois o menor `key`.
+        """
+        self.prepare([lane for placement in placements for lane in placement])
+        scored = [(self.evaluate(p), list(p)) for p in placements]
+        scored.sort(key=lambda item: (-item[0]["N_atendidos"], item[0][key]))
+        return scored[:top] if top else scored
+
+# --- Correlação com o second_run
+def _ranks(values):
+    """Postos com média nos empates (para o Spearman)."""
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(values, kind="stable")
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(len(values))
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    sums = np.bincount(inverse, weights=ranks)
+    return sums[inverse] / counts[inverse]
+
+def correlation(x, y):
+    """(Pearson, Spearman, a, b) com y ≈ a + b·x; nan com menos de 3 pares ou variância zero."""
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if len(x) < 3 or x.std() == 0 or y.std() == 0:
+        return float("nan"), float("nan"), float("nan"), float("nan")
+    pearson = float(np.corrcoef(x, y)[0, 1])
+    spearman = float(np.corrcoef(_ranks(x), _ranks(y))[0, 1])
+    b, a = np.polyfit(x, y, 1)
+    return pearson, spearman, float(a), float(b)
+
+def decisions_file(route_file, directory="output"):
+    return os.path.join(directory, f"decisoes_{os.path.basename(route_file).replace('_mod.rou.xml', '.npz')}")
+
+def load_decisions(route_file, directory="output"):
+    """Pontos de decisão gravados pelo first_run; sem eles, aproxima pela partida das rotas."""
+    path = decisions_file(route_file, directory)
+    if os.path.isfile(path):
+        return load_decision_points(path)
+    print(f"⚠️  {path} não encontrado: usando a partida e a edge de origem de {route_file}.")
+    return decision_points_from_routes(route_file)
+
+def second_run_rows(out_dir):
+    """Linhas de resultados do second_run (do banco, se houver; senão do CSV)."""
+    from resultados_db import ResultsStore, DB_NAME
+    db = os.path.join(out_dir, DB_NAME)
+    if os.path.isfile(db):
+        with ResultsStore(db) as store:
+            return store.run_rows()[1]
+    csv_file = os.path.join(out_dir, "resultados_execucoes.csv")
+    if not os.path.isfile(csv_file):
+        sys.exit(f"❌ Nenhum resultado de second_run em {out_dir}")
+    with open(csv_file, newline="") as f:
+        return list(csv.DictReader(f))
+
+def validate(args, graph):
+    evaluators = {}
+    pairs = []
+    for row in second_run_rows(args.out_dir):
+        route_file, add_name = row.get("route_file"), row.get("add_file")
+        if not route_file or not add_name or (row.get("station_choice") or "distance") != "distance":
+            continue
+        add_file = os.path.join(args.out_dir, add_name)
+        if not os.path.isfile(add_file) or not os.path.isfile(route_file):
+            continue
+        tr = float(row["TR"])
+        key = (route_file, tr)
+        if key not in evaluators:
+            evaluators[key] = SurrogateEvaluator(args.net_file, graph, load_decisions(route_file, args.decisions_dir),
+                                                 tr, args.congestion)
+        lanes, capacity = read_add_file(add_file)
+        est = evaluators[key].evaluate(lanes, capacity)
+        pairs.append((row, est))
+
+    if not pairs:
+        sys.exit("❌ Nenhum second_run com .add.xml e arquivo de rotas disponíveis para comparar.")
+    print(f"{'heuristic':>10} | {'ER':>3} | {'D real':>7} | {'D est.':>7} | {'T real':>8} | {'T est.':>8}")
+    for row, est in pairs:
+        print(f"{row['heuristic']:>10} | {row['ER']:>3} | {float(row['D_estacao']):7.3f} | {est['D_estacao']:7.3f} | "
+              f"{float(row['T_espera']):8.2f} | {est['T_espera']:8.2f}")
+    # Conjuntos sem nenhum VE atendido (estimativa inf) ficam fora da correlação
+    served = [(row, est) for row, est in pairs if est["N_atendidos"]]
+    print(f"\n📈 Correlação com o second_run ({len(served)} de {len(pairs)} execuções):")
+    for metric in ("D_estacao", "T_espera"):
+        real = [float(row[metric]) for row, _ in served]
+        est = [e[metric] for _, e in served]
+        pearson, spearman, a, b = correlation(est, real)
+        print(f"   {metric}: Pearson={pearson:.3f} Spearman={spearman:.3f} | real ≈ {a:.3f} + {b:.3f}·estimado")
+
+def screen_random(args, graph):
+    """Sorteia --samples conjuntos de --er lanes entre as candidatas e mostra os melhores."""
+    from visitas_faixas import load_lane_visits
+    ctrl = sys.modules["controlador_pa_opt"]
+    decisions = load_decisions(args.route_file, args.decisions_dir)
+    evaluator = SurrogateEvaluator(args.net_file, graph, decisions, args.tr_min, args.congestion)
+    lane_visits = load_lane_visits(ctrl.lane_visits_file(args)).totals_dict()
+    candidates = ctrl.location_candidates(lane_visits, args.net_file)
+    rng = random.Random(args.seed)
+    placements = [rng.sample(candidates, min(args.er, len(candidates))) for _ in range(args.samples)]
+    for add_file in args.add_files or []:
+        placements.append(read_add_file(add_file)[0])
+    t0 = time.perf_counter()
+    ranked = evaluator.screen(placements, top=args.top)
+    elapsed = time.perf_counter() - t0
+    print(f"⚡ {len(placements)} conjuntos avaliados em {elapsed:.2f}s ({len(decisions)} decisões)")
+    for k, (est, lanes) in enumerate(ranked):
+        print(f"  {k + 1:>3}. {est['N_atendidos']}/{len(decisions)} VEs, "
+              f"T_espera≈{est['T_espera']:.1f}s D_estacao≈{est['D_estacao']:.3f}km "
+              f"(viagem {est['T_viagem']:.1f}s + fila {est['T_fila']:.1f}s): {lanes}")
+        if args.write_top:
+            base_name = os.path.basename(args.route_file).replace('_mod.rou.xml', '')
+            ctrl.generate_parking_areas_file(lanes, args.out_dir, f"substituto{k + 1}_{base_name}_er{args.er}",
+                                             args.capacity, net_file=args.net_file)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Estima D_estacao e T_espera de conjuntos de estações sem o second_run.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--net_file", default="cologne2.net.xml")
+    common.add_argument("--graph_backend", choices=["networkx", "csr"], default="csr")
+    common.add_argument("--out_dir", default="output")
+    common.add_argument("--decisions_dir", default="output", help="Onde estão os decisoes_*.npz do first_run")
+    common.add_argument("--congestion", type=float, default=1.0, help="Fator sobre o tempo de viagem em fluxo livre")
+    ap_val = sub.add_parser("validar", parents=[common], help="Correlação do substituto com os second_runs gravados")
+    ap_av = sub.add_parser("avaliar", parents=[common], help="Avalia .add.xml e/ou conjuntos sorteados")
+    ap_av.add_argument("--route_file", required=True)
+    ap_av.add_argument("--er", type=int, default=10)
+    ap_av.add_argument("--tr_min", type=float, default=10)
+    ap_av.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY)
+    ap_av.add_argument("--samples", type=int, default=1000, help="Conjuntos sorteados entre as lanes candidatas")
+    ap_av.add_argument("--add_files", nargs="*", help="Conjuntos já gerados, avaliados junto com os sorteados")
+    ap_av.add_argument("--top", type=int, default=5)
+    ap_av.add_argument("--write_top", action="store_true", help="Gera o .add.xml dos --top melhores")
+    ap_av.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    import controlador_pa_opt
+    graph = controlador_pa_opt.get_graph(args.net_file, args.graph_backend)
+    if args.cmd == "validar":
+        validate(args, graph)
+    else:
+        screen_random(args, graph)
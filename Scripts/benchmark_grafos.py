@@ -0,0 +1,96 @@
+import io
+import json
+import time
+import random
+import argparse
+import contextlib
+
+import networkx as nx
+
+import controlador_pa_opt as ctrl
+from grafo_csr import CSRGraph
+
+# Compara os backends de grafo (networkx × CSR/scipy) nas consultas que o
+# controlador faz: montagem do grafo, distância ponto a ponto, Dijkstra de uma
+# origem, tabela edge × estação do second_run e proximidade da LRC do GRASP.
+
+def timed(fn, *args, repeat=1, **kwargs):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def run_benchmarks(net_file, queries=200, sources=20, stations=30, lrc=250, seed=42, repeat=3):
+    rng = random.Random(seed)
+    t_index, index = timed(ctrl.get_net_index, net_file)
+    t_nx, g_nx = timed(index.to_networkx, repeat=repeat)
+    t_csr, g_csr = timed(CSRGraph, index, repeat=repeat)
+
+    lanes = [lid for lid in index.lane_ids if not lid.startswith(":")]
+    edges = sorted(index.edge_nodes_dict())
+    nodes = list(g_nx.nodes)
+    pairs = [(rng.choice(edges), rng.choice(edges)) for _ in range(queries)]
+    node_pairs = [(index.edge_nodes(a)[1], index.edge_nodes(b)[0]) for a, b in pairs]
+    src_nodes = rng.sample(nodes, min(sources, len(nodes)))
+    station_lanes = rng.sample(lanes, min(stations, len(lanes)))
+    station_list = [(f"pa_{lid}", lid, index.edge_of_lane(lid)) for lid in station_lanes]
+    lrc_lanes = rng.sample(lanes, min(lrc, len(lanes)))
+
+    def p2p(graph):
+        return [ctrl.compute_distance_to_station(graph, net_file, a, b) for a, b in pairs]
+
+    def single_source_nx():
+        return [nx.single_source_dijkstra_path_length(g_nx, s, weight="weight") for s in src_nodes]
+
+    def single_source_csr():
+        return g_csr.lengths_from([g_csr.node_index(s) for s in src_nodes])
+
+    rows = [
+        ("montagem do grafo", t_nx, t_csr),
+        (f"ponto a ponto ({queries} pares)", timed(p2p, g_nx)[0], timed(p2p, g_csr)[0]),
+        (f"ponto a ponto em lote ({queries} pares)", None, timed(g_csr.distances, node_pairs, repeat=repeat)[0]),
+        (f"uma origem ({len(src_nodes)} origens)", timed(single_source_nx)[0], timed(single_source_csr, repeat=repeat)[0]),
+        (f"tabela edge × estação ({len(station_list)} estações)",
+         timed(ctrl.build_station_distance_table, g_nx, net_file, station_list)[0],
+         timed(ctrl.build_station_distance_table, g_csr, net_file, station_list, repeat=repeat)[0]),
+        (f"proximidade GRASP (LRC={len(lrc_lanes)})",
+         timed(ctrl.build_proximity_matrix, g_nx, net_file, lrc_lanes)[0],
+         timed(ctrl.build_proximity_matrix, g_csr, net_file, lrc_lanes, repeat=repeat)[0]),
+    ]
+    meta = dict(index.meta, load_index_s=t_index)
+    return meta, rows
+
+def print_table(meta, rows):
+    print(f"Rede: {meta['net_file']} — {meta['nodes']} nós, {meta['edges']} edges, {meta['arcs']} arcos "
+          f"(índice aberto em {meta['load_index_s'] * 1000:.1f} ms)")
+    print(f"{'Consulta':<45} | {'networkx (s)':>12} | {'csr (s)':>10} | {'ganho':>8}")
+    print("-" * 85)
+    for name, t_nx, t_csr in rows:
+        nx_str = f"{t_nx:12.4f}" if t_nx is not None else f"{'—':>12}"
+        gain = f"{t_nx / t_csr:7.1f}x" if t_nx and t_csr else f"{'—':>8}"
+        print(f"{name:<45} | {nx_str} | {t_csr:10.4f} | {gain}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark networkx × CSR nas consultas de distância do controlador.")
+    ap.add_argument("--net_file", default="cologne2.net.xml")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--sources", type=int, default=20)
+    ap.add_argument("--stations", type=int, default=30)
+    ap.add_argument("--lrc", type=int, default=250)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=3, help="Repetições das medições CSR (vale o melhor tempo)")
+    ap.add_argument("--json", help="Grava os tempos também em JSON")
+    args = ap.parse_args()
+
+    meta, rows = run_benchmarks(args.net_file, args.queries, args.sources, args.stations,
+                                args.lrc, args.seed, args.repeat)
+    print_table(meta, rows)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "rows": [{"consulta": n, "networkx_s": a, "csr_s": b} for n, a, b in rows]},
+                      f, indent=1)
+        print(f"💾 Tempos salvos em {args.json}")
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+import numpy as np
+
+import controlador_pa_opt as ctrl
+from indice_rede import load_net_index
+from indice_geometrico import LaneGeometryIndex
+from benchmark_grafos import timed
+
+try:
+    from scipy.spatial import Delaunay  # rede planar aleatória (opcional)
+except ImportError:
+    Delaunay = None
+
+# Benchmark offline das etapas do controlador que não dependem do SUMO:
+# compilação do índice, montagem do grafo, matriz de proximidade do GRASP,
+# tabela edge × estação, cada método de seleção e a geração do .add.xml.
+#
+# As redes são sintéticas (grade e planar aleatória via Delaunay), escritas num
+# .net.xml mínimo no formato do SUMO, e as visitas por lane seguem uma cauda
+# pesada (Zipf), como no first_run. Cada etapa é medida em tempo (melhor de
+# --repeat) e em pico de memória (tracemalloc, numa execução à parte). Com
+# --baseline, os tempos são comparados com uma execução anterior e regressões
+# acima da tolerância fazem o script sair com código 1.
+# Etapas: indice_compilacao, grafo_*, indice_geometrico (STRtree das lanes),
+# geometria_raio (lanes a até PROXIMITY_RADIUS da LRC), proximidade_*,
+# tabela_estacoes_*, matriz_localizacao_* (candidato × demanda de celf/pmedian),
+# selecao_* e add_xml.
+
+LANE_WIDTH = 3.2
+DEFAULT_GRIDS = ["20x20", "50x50"]
+DEFAULT_PLANAR = [500, 2000]
+
+def _lane_shape(p, q, k):
+    """Shape reto de p a q, deslocado para a direita pela faixa k."""
+    (x1, y1), (x2, y2) = p, q
+    length = math.hypot(x2 - x1, y2 - y1) or 1.0
+    off = LANE_WIDTH * (k + 0.5)
+    dx, dy = (y2 - y1) / length * off, -(x2 - x1) / length * off
+    return f"{x1 + dx:.2f},{y1 + dy:.2f} {x2 + dx:.2f},{y2 + dy:.2f}"
+
+def write_net(path, nodes, links, lanes_per_edge=1, speed=13.89):
+    """
+    Grava um .net.xml mínimo: junctions com coordenadas e, para cada ligação
+    (u, v), as edges u→v e v→u com `lanes_per_edge` lanes cada.
+    """
+    xs = [x for x, _ in nodes]
+    ys = [y for _, y in nodes]
+    boundary = f"{min(xs):.2f},{min(ys):.2f},{max(xs):.2f},{max(ys):.2f}"
+    num_edges = 0
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<net version="1.9" junctionCornerDetail="5" limitTurnSpeed="5.50">\n')
+        f.write(f'    <location netOffset="0.00,0.00" convBoundary="{boundary}" '
+                f'origBoundary="{boundary}" projParameter="!"/>\n')
+        for u, v in links:
+            for a, b in ((u, v), (v, u)):
+                length = max(math.hypot(nodes[b][0] - nodes[a][0], nodes[b][1] - nodes[a][1]), 0.1)
+                f.write(f'    <edge id="e{a}_{b}" from="n{a}" to="n{b}" priority="1">\n')
+                for k in range(lanes_per_edge):
+                    f.write(f'        <lane id="e{a}_{b}_{k}" index="{k}" speed="{speed:.2f}" '
+                            f'length="{length:.2f}" shape="{_lane_shape(nodes[a], nodes[b], k)}"/>\n')
+                f.write('    </edge>\n')
+                num_edges += 1
+        for i, (x, y) in enumerate(nodes):
+            f.write(f'    <junction id="n{i}" type="priority" x="{x:.2f}" y="{y:.2f}" '
+                    f'incLanes="" intLanes="" shape=""/>\n')
+        f.write('</net>\n')
+    return {"nodes": len(nodes), "edges": num_edges, "lanes": num_edges * lanes_per_edge}
+
+def grid_network(cols, rows, spacing=100.0):
+    nodes = [(c * spacing, r * spacing) for r in range(rows) for c in range(cols)]
+    links = []
+    for r in range(rows):
+        for c in range(cols):
+            i = r * cols + c
+            if c + 1 < cols:
+                links.append((i, i + 1))
+            if r + 1 < rows:
+                links.append((i, i + cols))
+    return nodes, links
+
+def planar_network(n, rng, spacing=100.0):
+    """Pontos uniformes num quadrado (densidade ~ 1 nó por spacing²) ligados por Delaunay."""
+    side = spacing * math.sqrt(n)
+    points = rng.uniform(0, side, size=(n, 2))
+    links = set()
+    for a, b, c in Delaunay(points).simplices.tolist():
+        for u, v in ((a, b), (b, c), (a, c)):
+            links.add((min(u, v), max(u, v)))
+    return [tuple(p) for p in points.tolist()], sorted(links)
+
+def synthetic_visits(lane_ids, rng, visited_fraction=0.3, zipf_a=1.6):
+    """{lane: visitas} numa fração das lanes, contagens Zipf, em ordem aleatória de primeira visita."""
+    k = max(1, int(len(lane_ids) * visited_fraction))
+    chosen = rng.choice(len(lane_ids), size=k, replace=False)
+    counts = np.minimum(rng.zipf(zipf_a, size=k), 10**6)
+    return {lane_ids[i]: int(c) for i, c in zip(chosen.tolist(), counts.tolist())}
+
+def measure(fn, repeat=1, memory=True):
+    """(melhor tempo em s, pico de memória em MB, resultado) de fn()."""
+    best, result = timed(fn, repeat=repeat)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            timed(fn)
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return best, peak, result
+
+@contextlib.contextmanager
+def working_dir(path):
+    """create_graph_from_net e afins escrevem arquivos auxiliares no diretório atual."""
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+def run_scenario(name, net_file, args, graph_backends):
+    """Mede todas as etapas numa rede. Devolve {etapa: {"time_s", "peak_mb"}}."""
+    rng = np.random.default_rng(args.seed)
+    results = {}
+
+    def record(stage, fn, repeat=args.repeat):
+        t, peak, out = measure(fn, repeat, memory=not args.no_memory)
+        results[stage] = {"time_s": t, "peak_mb": peak}
+        return out
+
+    def compile_cold():
+        cache_dir = tempfile.mkdtemp(dir=os.path.dirname(net_file), prefix=".bench_index_")
+        try:
+            return load_net_index(net_file, cache_dir).meta
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    meta = record("indice_compilacao", compile_cold)
+    index = ctrl.get_net_index(net_file)
+    lanes = [lid for lid in index.lane_ids if not lid.startswith(":")]
+    lane_visits = synthetic_visits(lanes, rng, args.visited_fraction, args.zipf_a)
+
+    graphs = {}
+    for backend in graph_backends:
+        graphs[backend] = record(f"grafo_{backend}",
+                                 lambda: ctrl.create_graph_from_net(net_file, backend=backend))
+
+    lrc = sorted(lane_visits, key=lambda lane: lane_visits[lane], reverse=True)[:args.er * 5]
+    geo = record("indice_geometrico", lambda: LaneGeometryIndex(index))
+    record("geometria_raio", lambda: geo.within(lrc, ctrl.PROXIMITY_RADIUS))
+    station_lanes = lrc[:args.er]
+    stations = [(f"parking_area_{lid}", lid, index.edge_of_lane(lid)) for lid in station_lanes]
+    for backend, graph in graphs.items():
+        record(f"proximidade_{backend}", lambda: ctrl.build_proximity_matrix(graph, net_file, lrc))
+        record(f"tabela_estacoes_{backend}", lambda: ctrl.build_station_distance_table(graph, net_file, stations))
+
+    def select(method, graph):
+        def fn():
+            random.seed(args.seed)
+            if method == "random":
+                return ctrl.select_random_stations(lane_visits, min(args.er, len(lane_visits)))
+            if method == "greedy":
+                return ctrl.select_greedy_stations(lane_visits, args.er)
+            return ctrl.select_grasp_stations(lane_visits, args.er, graph, net_file,
+                                              alpha=args.grasp_alpha, iterations=args.grasp_iters)
+        return fn
+
+    first_graph = graphs[graph_backends[0]]
+    selected = None
+    for method in ("random", "greedy"):
+        selected = record(f"selecao_{method}", select(method, first_graph))
+    for backend, graph in graphs.items():
+        record(f"selecao_grasp_{backend}", select("grasp", graph))
+
+    # (S24) Matriz candidato × demanda medida à parte; a seleção reaproveita a do cache
+    candidates = ctrl.location_candidates(lane_visits, net_file)
+    for backend, graph in graphs.items():
+        record(f"matriz_localizacao_{backend}",
+               lambda: ctrl.build_location_matrix(graph, net_file, candidates, sorted(lane_visits)))
+    record("selecao_celf", lambda: ctrl.select_celf_stations(lane_visits, args.er, first_graph, net_file))
+    record("selecao_pmedian", lambda: ctrl.select_pmedian_stations(lane_visits, args.er, first_graph, net_file))
+
+    out_dir = os.path.join(os.path.dirname(net_file), "add")
+    record("add_xml", lambda: ctrl.generate_parking_areas_file(selected, out_dir, name, 5, net_file=net_file))
+
+    info = {"nodes": meta["nodes"], "edges": meta["edges"], "lanes": meta["lanes"],
+            "visited_lanes": len(lane_visits)}
+    return info, results
+
+def build_scenarios(args, work_dir):
+    """Escreve as redes pedidas em `work_dir`. Devolve [(nome, net_file)]."""
+    scenarios = []
+    for spec in args.grids:
+        cols, rows = (int(v) for v in spec.lower().split("x"))
+        name = f"grade_{cols}x{rows}"
+        net_file = os.path.join(work_dir, name, f"{name}.net.xml")
+        os.makedirs(os.path.dirname(net_file), exist_ok=True)
+        write_net(net_file, *grid_network(cols, rows), lanes_per_edge=args.lanes)
+        scenarios.append((name, net_file))
+    if args.planar and Delaunay is None:
+        print("⚠️  scipy não encontrado: redes planares ignoradas (pip install scipy).")
+    elif args.planar:
+        rng = np.random.default_rng(args.seed)
+        for n in args.planar:
+            name = f"planar_{n}"
+            net_file = os.path.join(work_dir, name, f"{name}.net.xml")
+            os.makedirs(os.path.dirname(net_file), exist_ok=True)
+            write_net(net_file, *planar_network(n, rng), lanes_per_edge=args.lanes)
+            scenarios.append((name, net_file))
+    return scenarios
+
+def compare_with_baseline(results, baseline, tolerance, mem_tolerance, min_abs):
+    """
+    Lista de (chave, medida, base, atual) que pioraram além da tolerância.
+    Diferenças de tempo abaixo de `min_abs` segundos são tratadas como ruído.
+    """
+    regressions = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if base["time_s"] and cur["time_s"] > base["time_s"] * (1 + tolerance) \
+                and cur["time_s"] - base["time_s"] > min_abs:
+            regressions.append((key, "time_s", base["time_s"], cur["time_s"]))
+        if base.get("peak_mb") and cur.get("peak_mb") and cur["peak_mb"] > base["peak_mb"] * (1 + mem_tolerance):
+            regressions.append((key, "peak_mb", base["peak_mb"], cur["peak_mb"]))
+    return regressions
+
+def print_table(name, info, results, baseline):
+    print(f"\nRede {name}: {info['nodes']} nós, {info['edges']} edges, {info['lanes']} lanes, "
+          f"{info['visited_lanes']} lanes visitadas")
+    print(f"{'Etapa':<28} | {'tempo (s)':>10} | {'pico (MB)':>10} | {'baseline (s)':>12} | {'variação':>9}")
+    print("-" * 82)
+    for stage, r in results.items():
+        base = baseline.get(f"{name}/{stage}")
+        peak = f"{r['peak_mb']:10.2f}" if r["peak_mb"] is not None else f"{'—':>10}"
+        base_str = f"{base['time_s']:12.4f}" if base else f"{'—':>12}"
+        delta = f"{(r['time_s'] / base['time_s'] - 1) * 100:+8.1f}%" if base and base["time_s"] else f"{'—':>9}"
+        print(f"{stage:<28} | {r['time_s']:10.4f} | {peak} | {base_str} | {delta}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark offline (sem SUMO) das etapas de seleção em redes sintéticas.")
+    ap.add_argument("--grids", nargs="*", default=DEFAULT_GRIDS, help="Redes em grade, como COLxLIN")
+    ap.add_argument("--planar", nargs="*", type=int, default=DEFAULT_PLANAR,
+                    help="Redes planares aleatórias (nº de nós; requer scipy)")
+    ap.add_argument("--lanes", type=int, default=1, help="Lanes por edge")
+    ap.add_argument("--visited_fraction", type=float, default=0.3, help="Fração das lanes com visitas")
+    ap.add_argument("--zipf_a", type=float, default=1.6, help="Expoente da distribuição Zipf das visitas")
+    ap.add_argument("--er", type=int, default=10, help="Nº de estações selecionadas")
+    ap.add_argument("--grasp_alpha", type=float, default=0.3)
+    ap.add_argument("--grasp_iters", type=int, default=10)
+    ap.add_argument("--graph_backends", nargs="+", choices=ctrl.GRAPH_BACKENDS, default=None,
+                    help="Padrão: networkx e, se o scipy estiver instalado, csr")
+    ap.add_argument("--repeat", type=int, default=3, help="Repetições por etapa (vale o melhor tempo)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--no_memory", action="store_true", help="Não mede o pico de memória (tracemalloc)")
+    ap.add_argument("--work_dir", default=None, help="Onde gravar as redes (padrão: diretório temporário)")
+    ap.add_argument("--json", help="Grava os resultados desta execução em JSON")
+    ap.add_argument("--baseline", help="Arquivo de baseline (JSON) para comparar")
+    ap.add_argument("--save_baseline", action="store_true", help="Grava esta execução como nova baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Piora de tempo tolerada (fração)")
+    ap.add_argument("--mem_tolerance", type=float, default=0.10, help="Piora de pico de memória tolerada (fração)")
+    ap.add_argument("--min_abs", type=float, default=0.02, help="Diferença mínima de tempo (s) para contar")
+    args = ap.parse_args()
+
+    graph_backends = args.graph_backends or (["networkx", "csr"] if ctrl.CSRGraph is not None else ["networkx"])
+    if "csr" in graph_backends and ctrl.CSRGraph is None:
+        sys.exit("❌ scipy não encontrado. Instale-o (pip install scipy) ou use --graph_backends networkx.")
+
+    baseline = {}
+    if args.baseline and os.path.isfile(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix="benchmark_sintetico_")
+    os.makedirs(work_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    all_results, networks = {}, {}
+    try:
+        with working_dir(work_dir):
+            for name, net_file in build_scenarios(args, work_dir):
+                info, results = run_scenario(name, net_file, args, graph_backends)
+                networks[name] = info
+                print_table(name, info, results, baseline)
+                all_results.update({f"{name}/{stage}": r for stage, r in results.items()})
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"\n⏱️  Benchmark concluído em {time.perf_counter() - t0:.1f}s")
+
+    report = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(),
+                 "processor": platform.processor(), "graph_backends": graph_backends,
+                 "seed": args.seed, "repeat": args.repeat, "er": args.er, "grasp_iters": args.grasp_iters},
+        "networks": networks,
+        "results": all_results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"💾 Resultados salvos em {args.json}")
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"💾 Baseline salva em {args.baseline}")
+    elif baseline:
+        regressions = compare_with_baseline(all_results, baseline, args.tolerance, args.mem_tolerance, args.min_abs)
+        if regressions:
+            print(f"❌ {len(regressions)} regressão(ões) em relação a {args.baseline}:")
+            for key, measure_name, base, cur in regressions:
+                print(f"   {key} [{measure_name}]: {base:.4f} → {cur:.4f}")
+            sys.exit(1)
+        print(f"✅ Nenhuma regressão em relação a {args.baseline}")
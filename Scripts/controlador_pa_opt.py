@@ -1,29 +1,95 @@
 import traci
+from traci import constants as tc
 import random
 import os
 import sys
 import xml.etree.ElementTree as ET
-from shapely.geometry import LineString
-import pickle
 import networkx as nx
 import argparse
 import time
-import csv
 import re
-from functools import lru_cache  # <-- (S2) cache
-
-# Garante que o caminho para as ferramentas do SUMO está no PYTHONPATH
+import json
+import fcntl
+import hashlib
+import heapq
+import contextlib
+import shutil
+import tempfile
+import numpy as np
+from indice_rede import load_net_index, file_digest, DEFAULT_EDGE_WEIGHT  # <-- (S3) índice compilado da rede
+import grasp_estacoes  # <-- (S8) motor GRASP
+import localizacao_estacoes  # <-- (S24) máxima cobertura (CELF) e p-medianas
+import perfilador  # <-- (S16) instrumentação opcional
+from metadados_rotas import load_route_metadata  # <-- (S11) metadados das rotas em cache
+from visitas_faixas import LaneVisitAccumulator, load_lane_visits, merge_lane_visits  # <-- (S12)
+import ingestao_saidas  # <-- (S17) saídas do SUMO em tabelas colunares
+import indice_geometrico  # <-- (S18) STRtree das lanes e cota euclidiana
+from resultados_db import ResultsStore, DB_NAME  # <-- (S23) banco de resultados (SQLite/WAL)
+from avaliador_substituto import decision_points_from_dict, load_decision_points, decisions_file  # <-- (S25) pontos de decisão do first_run
+try:
+    from grafo_csr import CSRGraph  # <-- (S9) backend CSR (scipy), opcional
+except ImportError:
+    CSRGraph = None
+try:
+    from oraculo_alt import ALTOracle  # <-- (S20) A* com landmarks (scipy), opcional
+except ImportError:
+    ALTOracle = None
+
+# Garante que o caminho para as ferramentas do SUMO está no PYTHONPATH.
+# Sem SUMO_HOME o módulo ainda pode ser importado (benchmarks offline); a
+# exigência fica no __main__, que sempre precisa do SUMO.
 if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
     sys.path.append(tools)
-else:
-    sys.exit("Declare a variável de ambiente 'SUMO_HOME'")
 
-# --- ADICIONADO (S1): índices globais e grafo para a função cacheada
-_graph = None
-_lane_to_edge = {}
-_edge_nodes = {}
-_lane_len_index = {}
+# --- ADICIONADO (S6): backend da simulação — TraCI (socket) ou libsumo (in-process)
+BACKENDS = ("traci", "libsumo")
+_backend_name = "traci"
+
+def load_backend(name):
+    """
+    Troca o módulo `traci` usado por todo o controlador. O libsumo expõe a mesma API
+    dentro do próprio processo, sem serialização nem troca de contexto por chamada.
+    """
+    global traci, _backend_name
+    if name == "libsumo":
+        try:
+            import libsumo as backend
+        except ImportError:
+            sys.exit("❌ libsumo não encontrado. Instale-o (pip install libsumo) ou use --backend traci.")
+    else:
+        import traci as backend
+    traci = backend
+    _backend_name = name
+    return backend
+
+# --- ADICIONADO (S16): instrumentação opcional (ver perfilador.py)
+_profiler = perfilador.NullProfiler()
+
+def enable_profiling(mode, sample_every=100):
+    """
+    Liga o perfilador do processo. No modo full, o `traci` do controlador vira um
+    proxy que conta as chamadas por tipo; por isso deve vir depois de load_backend.
+    """
+    global traci, _profiler
+    _profiler = perfilador.make_profiler(mode, sample_every)
+    traci = _profiler.instrument(traci)
+    return _profiler
+
+# --- ADICIONADO (S3): índice compilado da rede, aberto uma vez por processo
+_net_indexes = {}
+
+def get_net_index(net_file):
+    """
+    Devolve o índice binário (mmap) de `net_file`, compilando-o na primeira vez.
+    Todas as consultas à rede passam por aqui em vez de reparsear o XML.
+    """
+    key = os.path.abspath(net_file)
+    index = _net_indexes.get(key)
+    _profiler.cache("net_index", index is not None)
+    if index is None:
+        index = _net_indexes[key] = load_net_index(net_file)
+    return index
 
 # --- ADICIONADO (S1): Pré-indexa a rede UMA vez
 def build_net_indexes(net_file):
@@ -33,55 +99,8 @@ def build_net_indexes(net_file):
       - edge_nodes: edge_id -> (from_node, to_node)
       - lane_len: lane_id -> length
     """
-    net_tree = ET.parse(net_file)
-    net_root = net_tree.getroot()
-
-    lane_to_edge = {}
-    edge_nodes = {}
-    lane_len = {}
-
-    for edge in net_root.findall(".//edge"):
-        eid = edge.attrib.get("id")
-        f = edge.attrib.get("from")
-        t = edge.attrib.get("to")
-        if f and t:
-            edge_nodes[eid] = (f, t)
-        for lane in edge.findall("lane"):
-            lid = lane.attrib.get("id")
-            lane_to_edge[lid] = eid
-            lane_len[lid] = float(lane.attrib.get("length", "0"))
-
-    return lane_to_edge, edge_nodes, lane_len
-
-# --- ADICIONADO (S2): Proximidade cacheada sem reparse de XML
-@lru_cache(maxsize=None)
-def compute_lane_proximity_cached(lane1, lane2, distance_threshold=None):
-    """
-    Distância na rede entre lane1 e lane2 usando índices pré-computados + _graph.
-    Evita reparse do XML e usa cache para chamadas repetidas.
-    """
-    # lane -> edge
-    e1 = _lane_to_edge.get(lane1)
-    e2 = _lane_to_edge.get(lane2)
-    if not e1 or not e2:
-        return float('inf')
-
-    # edge -> (from, to)
-    f1, t1 = _edge_nodes.get(e1, (None, None))
-    f2, t2 = _edge_nodes.get(e2, (None, None))
-    if t1 is None or f2 is None:
-        return float('inf')
-
-    if (_graph is None) or (t1 not in _graph) or (f2 not in _graph):
-        return float('inf')
-
-    try:
-        dist = nx.shortest_path_length(_graph, source=t1, target=f2, weight="weight")
-        if distance_threshold is not None and dist >= distance_threshold:
-            return dist
-        return dist
-    except (nx.NodeNotFound, nx.NetworkXNoPath):
-        return float('inf')
+    index = get_net_index(net_file)
+    return index.lane_to_edge_dict(), index.edge_nodes_dict(), index.lane_length_dict()
 
 # --- ADICIONADO: Função para ler o log e extrair teleports
 def parse_teleports(log_path):
@@ -96,6 +115,24 @@ def parse_teleports(log_path):
         return 0
     return 0
 
+# --- ADICIONADO (S9): consultas de distância independentes do backend de grafo
+GRAPH_BACKENDS = ("networkx", "csr")
+
+def is_csr_graph(graph):
+    return getattr(graph, "is_csr", False)
+
+def shortest_distance(graph, source, target):
+    """Distância entre dois nós no networkx ou no CSR. Levanta as mesmas exceções do nx."""
+    _profiler.count("shortest_distance")
+    if is_csr_graph(graph):
+        if not graph.has_node(source) or not graph.has_node(target):
+            raise nx.NodeNotFound(f"Nó {source if not graph.has_node(source) else target} não está no grafo")
+        dist = graph.distance(source, target)
+        if dist == float('inf'):
+            raise nx.NetworkXNoPath(f"Sem caminho entre {source} e {target}")
+        return dist
+    return nx.shortest_path_length(graph, source=source, target=target, weight="weight")
+
 # --- ADICIONADO: Função para calcular a distância na rede
 def compute_distance_to_station(graph, net_file, start_edge_id, end_edge_id):
     try:
@@ -103,12 +140,231 @@ def compute_distance_to_station(graph, net_file, start_edge_id, end_edge_id):
         _, from_node_start = find_edge_nodes(net_file, start_edge_id)
         to_node_end, _ = find_edge_nodes(net_file, end_edge_id)
         if from_node_start and to_node_end and graph.has_node(from_node_start) and graph.has_node(to_node_end):
-            dist = nx.shortest_path_length(graph, source=from_node_start, target=to_node_end, weight="weight")
+            dist = shortest_distance(graph, from_node_start, to_node_end)
             return dist
     except (nx.NetworkXNoPath, nx.NodeNotFound):
         return float('inf') # Retorna infinito se não houver caminho
     return float('inf')
 
+# --- ADICIONADO (S4): Tabela edge × estação pré-computada no início do second_run
+class StationDistanceTable:
+    """
+    Distâncias de rede de qualquer edge até cada estação, no mesmo sentido de
+    compute_distance_to_station (nó final da edge atual -> nó inicial da edge da estação).
+    Escolher a estação mais próxima vira uma leitura de linha O(#estações).
+    """
+
+    def __init__(self, index, stations, matrix):
+        self.index = index
+        self.station_ids = [s[0] for s in stations]
+        self.station_lanes = [s[1] for s in stations]
+        self.station_edges = [s[2] for s in stations]
+        self.matrix = matrix
+
+    def row(self, edge_id):
+        e = self.index.edge_position(edge_id)
+        if e < 0:
+            return None
+        return self.matrix[e]
+
+def build_station_distance_table(graph, net_file, stations):
+    """
+    `stations`: lista de (parking_id, lane_id, edge_id).
+    Roda um Dijkstra reverso um-para-todos a partir do nó de entrada de cada estação
+    e monta a matriz edge × estação (inf onde não há caminho).
+    """
+    index = get_net_index(net_file)
+    node_ids = index.node_ids
+    edge_to = np.asarray(index.array("edge_to"))
+    has_to = edge_to >= 0
+
+    matrix = np.full((len(edge_to), len(stations)), np.inf)
+    _profiler.count("dijkstra_sources", len(stations))
+    if is_csr_graph(graph):
+        # (S9) Todos os Dijkstras reversos num único lote
+        cols, sources = [], []
+        for s, (_, _, station_edge) in enumerate(stations):
+            to_node_end, _ = index.edge_nodes(station_edge)
+            i = graph.node_index(to_node_end) if to_node_end else -1
+            if i >= 0:
+                cols.append(s)
+                sources.append(i)
+        if sources:
+            lengths = graph.lengths_from(sources, reverse=True)
+            matrix[np.ix_(has_to, cols)] = lengths[:, edge_to[has_to]].T
+        return StationDistanceTable(index, stations, matrix)
+
+    node_pos = {n: i for i, n in enumerate(node_ids)}
+    reverse = graph.reverse(copy=False)
+    for s, (_, _, station_edge) in enumerate(stations):
+        to_node_end, _ = index.edge_nodes(station_edge)
+        if not to_node_end or not graph.has_node(to_node_end):
+            continue
+        node_dist = np.full(len(node_ids), np.inf)
+        for node, dist in nx.single_source_dijkstra_path_length(reverse, to_node_end, weight="weight").items():
+            node_dist[node_pos[node]] = dist
+        matrix[has_to, s] = node_dist[edge_to[has_to]]
+    return StationDistanceTable(index, stations, matrix)
+
+# --- ADICIONADO (S15): registro estático das estações do second_run
+class StationRegistry:
+    """
+    Estações (PAs) carregadas no second_run: id, lane, edge, posições e capacidade,
+    montadas uma vez a partir do .add.xml e do índice da rede. A ocupação
+    (veículos parados em cada PA) vem de uma subscrição por estação e é lida
+    em lote com refresh().
+    """
+
+    def __init__(self, ids, lanes, edges, start_pos, end_pos, capacity):
+        self.ids = ids
+        self.lanes = lanes
+        self.edges = edges
+        self.start_pos = np.asarray(start_pos, dtype=np.float64)
+        self.end_pos = np.asarray(end_pos, dtype=np.float64)
+        self.capacity = np.asarray(capacity, dtype=np.int64)
+        self.occupancy = np.zeros(len(ids), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def stations(self):
+        """Lista de (parking_id, lane_id, edge_id), o formato de build_station_distance_table."""
+        return list(zip(self.ids, self.lanes, self.edges))
+
+    def subscribe(self):
+        for parking_id in self.ids:
+            traci.parkingarea.subscribe(parking_id, (tc.VAR_STOP_STARTING_VEHICLES_NUMBER,))
+
+    def refresh(self):
+        results = traci.parkingarea.getAllSubscriptionResults()
+        for k, parking_id in enumerate(self.ids):
+            self.occupancy[k] = results.get(parking_id, {}).get(tc.VAR_STOP_STARTING_VEHICLES_NUMBER, 0)
+
+    def choose(self, distances):
+        """Estação mais próxima (desempate: menor ocupação, depois a ordem do registro), ou None."""
+        candidates = np.flatnonzero(np.isfinite(distances))
+        if not candidates.size:
+            return None
+        order = np.lexsort((self.occupancy[candidates], distances[candidates]))
+        return int(candidates[order[0]])
+
+    def queue_delay(self, charge_s, pending=None):
+        """
+        (S20) Espera estimada (s) ao chegar em cada estação: com as vagas tomadas
+        (ocupação + VEs já a caminho), libera-se em média uma vaga a cada
+        charge_s / capacidade.
+        """
+        demand = self.occupancy + (0 if pending is None else pending)
+        return charge_s * np.maximum(demand - self.capacity + 1, 0) / np.maximum(self.capacity, 1)
+
+def load_station_registry(add_files, net_file, loaded_ids):
+    """
+    Lê os <parkingArea> dos .add.xml e mantém os que o SUMO carregou (`loaded_ids`,
+    na ordem do SUMO) e cuja lane existe na rede. A edge vem do índice da rede,
+    não do id da lane (lanes podem ter '_' no id da edge).
+    """
+    index = get_net_index(net_file)
+    found = {}
+    for add_file in add_files:
+        for _, elem in ET.iterparse(add_file, events=("end",)):
+            if elem.tag != "parkingArea":
+                continue
+            lane_id = elem.get("lane")
+            edge_id = index.edge_of_lane(lane_id)
+            if edge_id is not None:
+                lane_length = index.lane_length(lane_id, 0.0)
+                found[elem.get("id")] = (
+                    lane_id, edge_id,
+                    float(elem.get("startPos", 0.0)),
+                    float(elem.get("endPos", lane_length)),
+                    int(elem.get("roadsideCapacity", 0)),
+                )
+            elem.clear()
+
+    ids = [pid for pid in loaded_ids if pid in found]
+    lanes, edges, start_pos, end_pos, capacity = zip(*(found[pid] for pid in ids)) if ids else ([],) * 5
+    return StationRegistry(ids, list(lanes), list(edges), start_pos, end_pos, capacity)
+
+# --- ADICIONADO (S20): escolha da estação pelo tempo de viagem atual (oráculo ALT)
+STATION_CHOICES = ("distance", "traveltime")
+_alt_oracles = {}
+
+def get_alt_oracle(net_file, landmarks, seed):
+    """Landmarks e distâncias em fluxo livre, calculados uma vez por rede no processo."""
+    key = (os.path.abspath(net_file), landmarks, seed)
+    oracle = _alt_oracles.get(key)
+    _profiler.cache("alt_oracle", oracle is not None)
+    if oracle is None:
+        if ALTOracle is None:
+            sys.exit("❌ scipy não encontrado. Instale-o (pip install scipy) ou use --station_choice distance.")
+        oracle = _alt_oracles[key] = ALTOracle(get_net_index(net_file), landmarks, seed)
+    return oracle
+
+TRAVELTIME_CONTEXT_RANGE = 1e9  # raio da subscrição de contexto: a rede inteira
+
+def refresh_travel_times(oracle, anchor=None):
+    """
+    Lê o tempo de viagem atual das edges do grafo e troca os pesos do oráculo em lote.
+    Com `anchor` (uma junction), a leitura é uma subscrição de contexto aberta e fechada
+    aqui mesmo: as edges vêm numa só resposta e nada fica assinado entre os refreshes
+    (uma subscrição permanente mandaria a rede inteira em todo simulationStep).
+    Sem `anchor`, ou se o contexto falhar, lê edge a edge.
+    """
+    edge_ids = oracle.index.edge_ids
+    times = np.full(len(edge_ids), np.nan)
+    results = None
+    if anchor is not None:
+        try:
+            traci.junction.subscribeContext(anchor, tc.CMD_GET_EDGE_VARIABLE, TRAVELTIME_CONTEXT_RANGE,
+                                            (tc.VAR_CURRENT_TRAVELTIME,))
+            results = traci.junction.getContextSubscriptionResults(anchor) or {}
+            traci.junction.unsubscribeContext(anchor, tc.CMD_GET_EDGE_VARIABLE, TRAVELTIME_CONTEXT_RANGE)
+        except traci.exceptions.TraCIException as e:
+            print(f"⚠️  Subscrição de contexto do tempo de viagem falhou ({e}); lendo edge a edge.")
+            results = None
+    if results is not None:
+        for e in oracle.graph_edges.tolist():
+            times[e] = results.get(edge_ids[e], {}).get(tc.VAR_CURRENT_TRAVELTIME, np.nan)
+    else:
+        for e in oracle.graph_edges.tolist():
+            times[e] = traci.edge.getTraveltime(edge_ids[e])
+    oracle.update_weights(times)
+    _profiler.count("alt_refresh")
+    return results is not None
+
+class TravelTimeStationChooser:
+    """
+    Estação de menor tempo de viagem atual + espera estimada na estação. Os pesos
+    do oráculo são relidos no máximo a cada `refresh_s` segundos simulados, e só
+    quando há uma decisão a tomar.
+    """
+
+    def __init__(self, oracle, registry, refresh_s, charge_s):
+        self.oracle = oracle
+        self.registry = registry
+        self.refresh_s = refresh_s
+        self.charge_s = charge_s
+        # Mesmo sentido da tabela de distâncias: até o nó inicial da edge da estação
+        self.targets = [oracle.node_index(oracle.index.edge_nodes(e)[0]) for e in registry.edges]
+        self._last_refresh = None
+        # Âncora da subscrição de contexto (uma ida ao SUMO por refresh). No libsumo não há
+        # socket: o laço edge a edge só sobre as edges do grafo sai mais barato que o contexto,
+        # que traz todas as edges da rede (internas incluídas). None também depois de uma falha.
+        junctions = traci.junction.getIDList() if _backend_name != "libsumo" else ()
+        self.anchor = junctions[0] if junctions else None
+
+    def choose(self, now, edge_id, pending):
+        if self._last_refresh is None or now - self._last_refresh >= self.refresh_s:
+            with _profiler.phase("alt_refresh"):
+                if not refresh_travel_times(self.oracle, self.anchor):
+                    self.anchor = None
+            self._last_refresh = now
+        source = self.oracle.node_index(self.oracle.index.edge_nodes(edge_id)[1])
+        if source < 0:
+            return None
+        s, _ = self.oracle.nearest(source, self.targets, self.registry.queue_delay(self.charge_s, pending))
+        return s
+
 # Funções para os métodos de seleção
 def select_random_stations(lane_visits, num_stations):
     print("----- Método: Random -----")
@@ -126,64 +382,82 @@ def select_greedy_stations(lane_visits, num_stations):
     return selected_stations
 
 def get_lane_shape(net_file, lane_id):
-    tree = ET.parse(net_file)
-    root = tree.getroot()
-    for lane in root.findall(".//lane"):
-        if lane.attrib["id"] == lane_id:
-            shape_str = lane.attrib["shape"]
-            points = [tuple(map(float, point.split(","))) for point in shape_str.split()]
-            return points
-    return None
-
-def segment_distance(seg1, seg2):
-    line1 = LineString(seg1)
-    line2 = LineString(seg2)
-    return line1.distance(line2)
+    return get_net_index(net_file).lane_shape(lane_id)
+
+# --- ADICIONADO (S18): índice geométrico (STRtree) e cota euclidiana, um por rede
+_geometry_indexes = {}
+_distance_bounds = {}
+
+def get_geometry_index(net_file):
+    """LineStrings de todas as lanes numa STRtree, montadas uma vez por processo."""
+    key = os.path.abspath(net_file)
+    geo = _geometry_indexes.get(key)
+    _profiler.cache("geometry_index", geo is not None)
+    if geo is None:
+        if not indice_geometrico.SHAPELY_2:
+            sys.exit("❌ O índice geométrico requer shapely >= 2.0 (pip install -U shapely).")
+        geo = _geometry_indexes[key] = indice_geometrico.LaneGeometryIndex(get_net_index(net_file))
+    return geo
+
+def get_distance_bound(net_file):
+    key = os.path.abspath(net_file)
+    bound = _distance_bounds.get(key)
+    if bound is None:
+        bound = _distance_bounds[key] = indice_geometrico.NodeDistanceBound(get_net_index(net_file))
+    return bound
 
 def distance_between_lanes(net_file, lane1_id, lane2_id):
-    shape1 = get_lane_shape(net_file, lane1_id)
-    shape2 = get_lane_shape(net_file, lane2_id)
-    if not shape1 or not shape2:
-        return float('inf')
-    min_distance = float('inf')
-    for i in range(len(shape1) - 1):
-        for j in range(len(shape2) - 1):
-            seg1 = (shape1[i], shape1[i+1])
-            seg2 = (shape2[j], shape2[j+1])
-            distance = segment_distance(seg1, seg2)
-            min_distance = min(min_distance, distance)
-    return min_distance
-
-def create_graph_from_net(net_file, lane_visits=None):
-    net_tree = ET.parse(net_file)
-    net_root = net_tree.getroot()
-    graph = nx.DiGraph()
-    added_edges = set()
-    for edge in net_root.findall(".//edge"):
-        edge_id = edge.attrib.get("id")
-        from_node = edge.attrib.get("from")
-        to_node = edge.attrib.get("to")
-        if from_node and to_node:
-            length = float(edge.attrib.get("length", "1000"))
-            weight = length
-            graph.add_edge(from_node, to_node, id=edge_id, weight=weight)
-            added_edges.add(edge_id)
-            if not edge.attrib.get("function") == "internal":
-                graph.add_edge(to_node, from_node, id=f"-{edge_id}", weight=weight)
-    with open("edges_no_grafo.txt", "w") as f:
+    # Mesma distância mínima entre os segmentos das duas shapes, calculada pelo GEOS.
+    # Lanes internas (":") ficam fora da STRtree: a distância sai das shapes do índice da rede
+    if lane1_id.startswith(":") or lane2_id.startswith(":"):
+        return indice_geometrico.shape_distance(get_lane_shape(net_file, lane1_id), get_lane_shape(net_file, lane2_id))
+    return get_geometry_index(net_file).distance(lane1_id, lane2_id)
+
+def create_graph_from_net(net_file, lane_visits=None, backend="networkx"):
+    index = get_net_index(net_file)
+    if backend == "csr":
+        if CSRGraph is None:
+            sys.exit("❌ scipy não encontrado. Instale-o (pip install scipy) ou use --graph_backend networkx.")
+        graph = CSRGraph(index)
+    else:
+        graph = index.to_networkx()
+    return graph
+
+def dump_graph_edges(net_file, path="edges_no_grafo.txt"):
+    """(S22) Lista de depuração das edges do grafo; só com --dump_graph_edges."""
+    added_edges = get_net_index(net_file).graph_edge_ids()
+    with open(path, "w") as f:
         f.write(f"Total de edges adicionadas ao grafo: {len(added_edges)}\n")
         for edge in sorted(added_edges):
             f.write(f"{edge}\n")
+    return path
+
+_graphs = {}
+
+def get_graph(net_file, backend="networkx"):
+    """
+    (S22) Grafo da rede montado uma vez por processo. O servidor de trabalho
+    pré-carrega aqui e os forks herdam (copy-on-write). Somente leitura.
+    """
+    key = (os.path.abspath(net_file), backend)
+    graph = _graphs.get(key)
+    _profiler.cache("graph", graph is not None)
+    if graph is None:
+        graph = _graphs[key] = create_graph_from_net(net_file, backend=backend)
     return graph
 
+def forget_net(net_file):
+    """(S22) Descarta índice, grafos e estruturas derivadas de `net_file` (a rede mudou no disco)."""
+    key = os.path.abspath(net_file)
+    _net_indexes.pop(key, None)
+    _geometry_indexes.pop(key, None)
+    _distance_bounds.pop(key, None)
+    for cache in (_graphs, _alt_oracles, _location_matrices):
+        for k in [k for k in cache if k[0] == key]:
+            del cache[k]
+
 def get_edge_from_lane(net_file, lane_id):
-    tree = ET.parse(net_file)
-    root = tree.getroot()
-    for edge in root.findall(".//edge"):
-        for lane in edge.findall(".//lane"):
-            if lane.attrib["id"] == lane_id:
-                return edge.attrib["id"]
-    return None
+    return get_net_index(net_file).edge_of_lane(lane_id)
 
 def distance_between_edges_nx(graph, net_file, edge1_id, edge2_id):
     try:
@@ -192,7 +466,7 @@ def distance_between_edges_nx(graph, net_file, edge1_id, edge2_id):
         if from1 is None or to2 is None:
             print(f"Aviso: Não foi possível encontrar nós para as arestas {edge1_id} ou {edge2_id}")
             return float('inf')
-        path_length = nx.shortest_path_length(graph, source=to1, target=from2, weight="weight")
+        path_length = shortest_distance(graph, to1, from2)
         return path_length
     except nx.NetworkXNoPath:
         print(f"Aviso: Não há caminho entre {edge1_id} e {edge2_id}")
@@ -202,87 +476,231 @@ def distance_between_edges_nx(graph, net_file, edge1_id, edge2_id):
         return float('inf')
 
 def find_edge_nodes(net_file, edge_id):
-    tree = ET.parse(net_file)
-    root = tree.getroot()
-    for edge in root.findall(".//edge"):
-        if edge.attrib["id"] == edge_id:
-            return edge.attrib.get("from"), edge.attrib.get("to")
-    return None, None
+    return get_net_index(net_file).edge_nodes(edge_id)
 
 def select_best_lane_in_edge(net_file, edge_id, lane_visits):
-    tree = ET.parse(net_file)
-    root = tree.getroot()
     best_lane = None
     best_score = -1
-    for edge in root.findall(".//edge"):
-        if edge.attrib["id"] == edge_id:
-            lanes = edge.findall("lane")
-            for lane in lanes:
-                lane_id = lane.attrib["id"]
-                score = lane_visits.get(lane_id, 0)
-                if score > best_score:
-                    best_score = score
-                    best_lane = lane_id
+    for lane_id in get_net_index(net_file).lanes_of_edge(edge_id):
+        score = lane_visits.get(lane_id, 0)
+        if score > best_score:
+            best_score = score
+            best_lane = lane_id
     return best_lane
 
-def select_grasp_stations(lane_visits, num_stations, graph, net_file):
-    print("----- Método: GRASP (Ultra Otimizado) -----")
-    best_solution = []
-    best_score = -1
+# --- ADICIONADO (S7): proximidade da LRC com Dijkstra limitado (substitui o lru_cache par a par)
+PROXIMITY_RADIUS = 500
+
+def build_proximity_matrix(graph, net_file, lanes, radius=PROXIMITY_RADIUS):
+    """
+    Matriz booleana n×n sobre os índices de `lanes`: prox[i, j] é True quando a
+    distância na rede do fim da lane i até o início da lane j é menor que `radius`.
+    Cada nó de saída recebe UM Dijkstra com corte em `radius`, em vez de uma
+    consulta sem limite por par.
+    """
+    index = get_net_index(net_file)
+    n = len(lanes)
+    prox = np.zeros((n, n), dtype=bool)
+
+    end_nodes = []
+    lanes_by_start = {}
+    for j, lane in enumerate(lanes):
+        edge = index.edge_of_lane(lane)
+        from_node, to_node = index.edge_nodes(edge) if edge else (None, None)
+        if not from_node or not to_node:
+            end_nodes.append(None)
+            continue
+        end_nodes.append(to_node)
+        lanes_by_start.setdefault(from_node, []).append(j)
+
+    # (S18) Pré-filtro euclidiano: nós de saída sem nenhuma entrada da LRC ao
+    # alcance da cota inferior não precisam de Dijkstra (a linha fica toda False)
+    start_nodes = list(lanes_by_start)
+    maybe = get_distance_bound(net_file).candidate_pairs(
+        [index.node_position(t) if t else -1 for t in end_nodes],
+        [index.node_position(s) for s in start_nodes], radius
+    ).any(axis=1)
+    _profiler.count("prefilter_skipped", int(sum(1 for i, t in enumerate(end_nodes) if t and not maybe[i])))
+
+    if is_csr_graph(graph):
+        # (S9) Um Dijkstra limitado por nó de saída distinto, todos num lote
+        end_idx = np.array([graph.node_index(t) if t and maybe[i] else -1 for i, t in enumerate(end_nodes)],
+                           dtype=np.intp)
+        starts = [(graph.node_index(node), js) for node, js in lanes_by_start.items()]
+        sources, rows = np.unique(end_idx[end_idx >= 0], return_inverse=True)
+        _profiler.cache("proximity_reach", True, len(rows) - len(sources))
+        _profiler.cache("proximity_reach", False, len(sources))
+        _profiler.count("dijkstra_sources", len(sources))
+        lengths = graph.lengths_from(sources, cutoff=radius)
+        col_nodes = np.full(n, -1, dtype=np.intp)
+        for node, js in starts:
+            col_nodes[js] = node
+        valid_cols = np.flatnonzero(col_nodes >= 0)
+        near = lengths[:, col_nodes[valid_cols]] < radius
+        prox[np.ix_(np.flatnonzero(end_idx >= 0), valid_cols)] = near[rows]
+        return prox
+
+    reach_cache = {}
+    for i, end_node in enumerate(end_nodes):
+        if end_node is None or not maybe[i] or end_node not in graph:
+            continue
+        reach = reach_cache.get(end_node)
+        _profiler.cache("proximity_reach", reach is not None)
+        if reach is None:
+            _profiler.count("dijkstra_sources")
+            lengths = nx.single_source_dijkstra_path_length(graph, end_node, cutoff=radius, weight="weight")
+            reach = [j for node, dist in lengths.items() if dist < radius for j in lanes_by_start.get(node, ())]
+            reach = reach_cache[end_node] = np.array(reach, dtype=np.intp)
+        prox[i, reach] = True
+    return prox
+
+def select_grasp_stations(lane_visits, num_stations, graph, net_file, alpha=0.3, iterations=10,
+                          time_limit=None, workers=1):
+    print("----- Método: GRASP -----")
     visited_lanes = list(lane_visits.keys())
     print("Lanes visitadas (elétricos):", visited_lanes)
     lrc = sorted(visited_lanes, key=lambda lane: lane_visits.get(lane, 0), reverse=True)[:num_stations * 5]
     print("LRC (GRASP):", lrc)
+    if not lrc:
+        print("LRC vazia, nenhuma estação selecionada.")
+        return []
+
+    # (S7) Proximidade calculada uma vez por seleção
+    prox = build_proximity_matrix(graph, net_file, lrc)
+    visits = np.array([lane_visits.get(lane, 0) for lane in lrc], dtype=np.float64)
+
+    # (S8) Construção com RCL por alpha + busca local por trocas, iterações em paralelo
+    base_seed = random.randrange(2**31)
+    selected, best_score, done = grasp_estacoes.grasp(
+        visits, prox, num_stations, alpha=alpha, iterations=iterations,
+        time_limit=time_limit, workers=workers, base_seed=base_seed
+    )
+    best_solution = [lrc[k] for k in selected]
+
+    print(f"GRASP: {done} iterações, alpha={alpha}, score={best_score:.0f}")
+    print("Lanes selecionadas (GRASP):", best_solution)
+    return best_solution
 
-    for _ in range(10):  # Número de iterações ajustável
-        current_solution = []
-        tabu_set = set()
-
-        if not lrc:
-            print("LRC vazia, saindo do loop.")
-            break
-
-        most_visited_lane = lrc[0]
-        current_solution.append(most_visited_lane)
-        tabu_set.add(most_visited_lane)
-
-        # (S2) Usa versão cacheada
-        for lane in lrc:
-            if lane != most_visited_lane and compute_lane_proximity_cached(most_visited_lane, lane) < 500:
-                tabu_set.add(lane)
-
-        while len(current_solution) < num_stations:
-            valid_lanes = [lane for lane in lrc if lane not in tabu_set]
-            if not valid_lanes:
-                print("Não há mais lanes válidas para adicionar à solução.")
-                break
-
-            selected_lane = random.choice(valid_lanes)
-            current_solution.append(selected_lane)
-            tabu_set.add(selected_lane)
-
-            # (S2) Usa versão cacheada
-            for lane in lrc:
-                if lane != selected_lane and compute_lane_proximity_cached(selected_lane, lane) < 500:
-                    tabu_set.add(lane)
-
-        current_score = sum(lane_visits[lane] for lane in current_solution if lane in lane_visits)
-
-        if current_score > best_score:
-            best_score = current_score
-            best_solution = current_solution
-
-    print("Lanes selecionadas (GRASP Ultra Otimizado):", best_solution)
+# --- ADICIONADO (S24): seleção por localização (celf, pmedian) sobre a matriz candidato × demanda
+# Distâncias do grafo são pesos de edge, não metros: sem "length" no .net.xml cada
+# edge pesa DEFAULT_EDGE_WEIGHT. O raio é contado em edges intermediárias entre a
+# edge da demanda e a da candidata; 1 foi o melhor D_estacao do celf com 2, 4 e 8 PAs.
+COVERAGE_HOPS = 1
+LOCATION_CANDIDATES = 2000
+PA_MIN_LANE_LENGTH = 8.0  # lanes até este comprimento não recebem PA (MIN_SPAN de generate_parking_areas_file)
+LOCATION_BATCH = 256      # origens por lote de Dijkstra no CSR
+_location_matrices = {}
+
+def location_candidates(lane_visits, net_file, limit=LOCATION_CANDIDATES):
+    """Lanes visitadas que comportam PA, das mais visitadas para as menos (até `limit`)."""
+    index = get_net_index(net_file)
+    lanes = [lane for lane in sorted(lane_visits, key=lambda lane: lane_visits[lane], reverse=True)
+             if not lane.startswith(":") and index.lane_length(lane, 0.0) > PA_MIN_LANE_LENGTH]
+    return lanes[:limit] if limit else lanes
+
+def build_location_matrix(graph, net_file, candidates, demand):
+    """
+    Matriz candidato × demanda com a distância de rede do fim da edge de cada
+    lane de demanda até o início da edge de cada candidata (o sentido de
+    compute_distance_to_station); demanda na mesma edge da candidata fica com 0.
+    Um Dijkstra reverso por nó de entrada distinto; no CSR, em lotes.
+    """
+    index = get_net_index(net_file)
+    cand_edges = [index.edge_of_lane(lane) for lane in candidates]
+    dem_edges = [index.edge_of_lane(lane) for lane in demand]
+    cand_nodes = [index.edge_nodes(e)[0] if e else None for e in cand_edges]
+    dem_nodes = [index.edge_nodes(e)[1] if e else None for e in dem_edges]
+    dist = np.full((len(candidates), len(demand)), np.inf)
+
+    sources = sorted({n for n in cand_nodes if n and graph.has_node(n)})
+    rows_of = {}
+    for i, node in enumerate(cand_nodes):
+        rows_of.setdefault(node, []).append(i)
+    _profiler.count("dijkstra_sources", len(sources))
+    if is_csr_graph(graph):
+        dem_idx = np.array([graph.node_index(n) if n else -1 for n in dem_nodes], dtype=np.intp)
+        cols = np.flatnonzero(dem_idx >= 0)
+        for b in range(0, len(sources), LOCATION_BATCH):
+            batch = sources[b:b + LOCATION_BATCH]
+            lengths = graph.lengths_from([graph.node_index(n) for n in batch], reverse=True)
+            for k, node in enumerate(batch):
+                dist[np.ix_(rows_of[node], cols)] = lengths[k, dem_idx[cols]]
+    else:
+        reverse = graph.reverse(copy=False)
+        cols_of = {}
+        for j, node in enumerate(dem_nodes):
+            if node:
+                cols_of.setdefault(node, []).append(j)
+        for node in sources:
+            rows = rows_of[node]
+            for other, length in nx.single_source_dijkstra_path_length(reverse, node, weight="weight").items():
+                cols = cols_of.get(other)
+                if cols:
+                    dist[np.ix_(rows, cols)] = length
+
+    edge_pos = {e: j for j, e in enumerate(dem_edges)}
+    same = [(i, edge_pos[e]) for i, e in enumerate(cand_edges) if e in edge_pos]
+    if same:
+        rows, cols = zip(*same)
+        dist[list(rows), list(cols)] = 0.0
+    return dist
+
+def get_location_matrix(lane_visits, net_file, graph, limit=LOCATION_CANDIDATES):
+    """
+    (candidatas, pesos da demanda, matriz), montados uma vez por conjunto de
+    visitas; o first_run_multi reaproveita entre ERs e entre celf/pmedian.
+    As distâncias saem do grafo CSR quando o scipy existe (mesmos valores do
+    networkx, com os Dijkstras em lote).
+    """
+    demand = sorted(lane_visits)
+    candidates = location_candidates(lane_visits, net_file, limit)
+    key = (os.path.abspath(net_file), tuple(candidates), tuple(demand))
+    entry = _location_matrices.get(key)
+    _profiler.cache("location_matrix", entry is not None)
+    if entry is None:
+        if CSRGraph is not None and not is_csr_graph(graph):
+            graph = get_graph(net_file, "csr")
+        with _profiler.phase("location_matrix"):
+            dist = build_location_matrix(graph, net_file, candidates, demand)
+        weights = np.array([lane_visits[lane] for lane in demand], dtype=np.float64)
+        entry = _location_matrices[key] = (candidates, weights, dist)
+    return entry
+
+def fill_with_greedy(selected, candidates, num_stations):
+    """Completa a seleção com as candidatas mais visitadas ainda de fora."""
+    chosen = set(selected)
+    extra = [k for k in range(len(candidates)) if k not in chosen][:num_stations - len(selected)]
+    return list(selected) + extra
+
+def select_celf_stations(lane_visits, num_stations, graph, net_file, radius=COVERAGE_HOPS * DEFAULT_EDGE_WEIGHT,
+                         limit=LOCATION_CANDIDATES):
+    print("----- Método: CELF (máxima cobertura) -----")
+    candidates, weights, dist = get_location_matrix(lane_visits, net_file, graph, limit)
+    if not candidates:
+        print("Nenhuma lane candidata, nenhuma estação selecionada.")
+        return []
+    selected, covered, evaluations = localizacao_estacoes.celf(weights, dist, num_stations, radius)
+    print(f"CELF: {len(candidates)} candidatas × {len(weights)} demandas, raio={radius:g}, "
+          f"cobertura={covered / weights.sum():.1%} das visitas, {evaluations} avaliações")
+    if len(selected) < num_stations:
+        print(f"⚠️  Cobertura saturou com {len(selected)} estações; completando pelas mais visitadas.")
+        selected = fill_with_greedy(selected, candidates, num_stations)
+    best_solution = [candidates[k] for k in selected]
+    print("Lanes selecionadas (CELF):", best_solution)
     return best_solution
 
-def get_edge_from_lane(net_file, lane_id):
-    tree = ET.parse(net_file)
-    root = tree.getroot()
-    for edge in root.findall(".//edge"):
-        for lane in edge.findall(".//lane"):
-            if lane.attrib["id"] == lane_id:
-                return edge.attrib["id"]
-    return None
+def select_pmedian_stations(lane_visits, num_stations, graph, net_file, limit=LOCATION_CANDIDATES):
+    print("----- Método: p-medianas -----")
+    candidates, weights, dist = get_location_matrix(lane_visits, net_file, graph, limit)
+    if not candidates:
+        print("Nenhuma lane candidata, nenhuma estação selecionada.")
+        return []
+    selected, cost, swaps = localizacao_estacoes.pmedian(weights, dist, num_stations)
+    print(f"p-medianas: {len(candidates)} candidatas × {len(weights)} demandas, {swaps} trocas, "
+          f"distância média ponderada={cost / weights.sum():.1f}")
+    best_solution = [candidates[k] for k in selected]
+    print("Lanes selecionadas (p-medianas):", best_solution)
+    return best_solution
 
 def compute_lane_proximity(graph, net_file, lane1, lane2):
     edge1 = get_edge_from_lane(net_file, lane1)
@@ -302,7 +720,7 @@ def compute_lane_proximity(graph, net_file, lane1, lane2):
             f.write(f"🚨 Erro: Nó {to1} ou {from2} NÃO está no grafo!\n")
         return float('inf')
     try:
-        return nx.shortest_path_length(graph, source=to1, target=from2, weight="weight")
+        return shortest_distance(graph, to1, from2)
     except nx.NetworkXNoPath:
         return float('inf')
 
@@ -310,14 +728,7 @@ def generate_parking_areas_file(selected_lanes, output_dir, base_filename, capac
     os.makedirs(output_dir, exist_ok=True)
     add_file = os.path.abspath(os.path.join(output_dir, f"parking_areas_{base_filename}.add.xml"))
 
-    net_tree = ET.parse(net_file)
-    net_root = net_tree.getroot()
-
-    lane_len = {}
-    for lane in net_root.findall(".//lane"):
-        lid = lane.attrib.get("id")
-        length = float(lane.attrib.get("length", "0"))
-        lane_len[lid] = length
+    index = get_net_index(net_file)
 
     root = ET.Element("additional")
     skipped = []
@@ -327,7 +738,7 @@ def generate_parking_areas_file(selected_lanes, output_dir, base_filename, capac
     MARGIN = 1.0
 
     for lane_id in selected_lanes:
-        L = lane_len.get(lane_id, 0.0)
+        L = index.lane_length(lane_id, 0.0)
         if L <= MIN_SPAN or lane_id.startswith(":"):
             skipped.append((lane_id, L))
             continue
@@ -360,28 +771,224 @@ def generate_parking_areas_file(selected_lanes, output_dir, base_filename, capac
         print(f"⚠️  Lanes sem PA (curtas ou inválidas): {len(skipped)}. Veja parking_areas_skipped.txt")
     return add_file
 
+# --- ADICIONADO (S5): camada de estado por subscrição TraCI
+BATTERY_PARAM = "device.battery.actualBatteryCapacity"
+VEHICLE_STATE_VARS = (tc.VAR_ROAD_ID, tc.VAR_LANE_ID, tc.VAR_POSITION)
+SIMULATION_EVENT_VARS = (tc.VAR_ARRIVED_VEHICLES_IDS, tc.VAR_STOP_STARTING_VEHICLES_IDS)
+
+class VehicleStateLayer:
+    """
+    Inscreve cada VE acompanhado (bateria, lane, edge e posição) quando ele parte e
+    lê o estado de todos com um único getAllSubscriptionResults por passo.
+    O resto do controlador consulta o snapshot em vez de fazer um get* por veículo.
+    O libsumo não aceita subscrição de parâmetros; nesse caso a bateria é lida sob
+    demanda (chamada local, sem socket) e guardada no snapshot do passo.
+    (S11) Com `depart_times` (horário de partida previsto de cada VE), a lista de
+    partidas só é consultada a partir da menor partida pendente, e nunca mais
+    depois que todos os VEs acompanhados partiram.
+    (S13) Os eventos do passo também vêm daqui: `departed` (VEs acompanhados que
+    partiram), `arrived` e `stops_started` (subscrição da simulação, sem chamada extra).
+    """
+
+    def __init__(self, tracked_vehicles, subscribe_battery=True, depart_times=None):
+        self.tracked = set(tracked_vehicles)
+        self.subscribe_battery = subscribe_battery
+        self.snapshot = {}
+        self._pending = None
+        if depart_times is not None:
+            # Partida não numérica (nan) entra como 0: consulta desde o início
+            self._pending = [(0.0 if d != d else d, vid) for vid, d in depart_times.items()
+                             if vid in self.tracked]
+            heapq.heapify(self._pending)
+        self._departed = set()
+        self.departed = []
+        self.arrived = ()
+        self.stops_started = ()
+        traci.simulation.subscribe(SIMULATION_EVENT_VARS)
+
+    def _departures_due(self, now):
+        if self._pending is None:
+            return True
+        while self._pending and self._pending[0][1] in self._departed:
+            heapq.heappop(self._pending)
+        # A inserção pode atrasar, nunca adiantar: antes da menor partida pendente não há o que ler
+        return bool(self._pending) and now >= self._pending[0][0]
+
+    def update(self, now=None):
+        events = traci.simulation.getSubscriptionResults()
+        self.arrived = events.get(tc.VAR_ARRIVED_VEHICLES_IDS, ())
+        self.stops_started = events.get(tc.VAR_STOP_STARTING_VEHICLES_IDS, ())
+        self.departed = []
+        if now is not None and not self._departures_due(now):
+            self.snapshot = traci.vehicle.getAllSubscriptionResults()
+            return
+        for vid in traci.simulation.getDepartedIDList():
+            if vid in self.tracked:
+                self._departed.add(vid)
+                self.departed.append(vid)
+                if self.subscribe_battery:
+                    traci.vehicle.subscribe(vid, VEHICLE_STATE_VARS + (tc.VAR_PARAMETER,),
+                                            parameters={tc.VAR_PARAMETER: ("s", BATTERY_PARAM)})
+                else:
+                    traci.vehicle.subscribe(vid, VEHICLE_STATE_VARS)
+        self.snapshot = traci.vehicle.getAllSubscriptionResults()
+
+    def __contains__(self, vid):
+        return vid in self.snapshot
+
+    def vehicles(self):
+        return self.snapshot.keys()
+
+    def battery(self, vid):
+        values = self.snapshot[vid]
+        value = values.get(tc.VAR_PARAMETER)
+        if value is None:
+            value = values[tc.VAR_PARAMETER] = traci.vehicle.getParameter(vid, BATTERY_PARAM)
+        return float(value)
+
+    def set_battery(self, vid, value):
+        traci.vehicle.setParameter(vid, BATTERY_PARAM, str(value))
+        self.snapshot[vid][tc.VAR_PARAMETER] = str(value)
+
+    def lane(self, vid):
+        return self.snapshot[vid][tc.VAR_LANE_ID]
+
+    def road(self, vid):
+        return self.snapshot[vid][tc.VAR_ROAD_ID]
+
+    def position(self, vid):
+        return self.snapshot[vid][tc.VAR_POSITION]
+
+# --- ADICIONADO (S14): agendador preditivo das leituras de bateria
+BATTERY_THRESHOLD_WH = 15000     # abaixo disso o VE procura uma PA
+LOW_BATTERY_OVERRIDE_WH = 12000  # carga imposta aos VEs de bateria baixa no second_run
+BATTERY_PROBE_INTERVAL = 10      # s entre leituras enquanto não há consumo medido
+
+class BatteryScheduler:
+    """
+    Lê a bateria de cada VE só quando a leitura vence, em vez de todo passo.
+    A cada leitura estima o consumo (Wh/s: maior entre a última queda e a média
+    móvel) e agenda a próxima para quando a carga deve chegar a threshold + margin.
+    `max_interval` limita o intervalo entre leituras (0 = lê todo passo).
+    Fila com remoção preguiçosa: cada VE tem uma única entrada válida (pelo seq).
+    """
+
+    def __init__(self, threshold, margin=500.0, max_interval=60.0):
+        self.threshold = threshold
+        self.margin = margin
+        self.max_interval = max_interval
+        self.reads = 0
+        self._heap = []
+        self._valid = {}
+        self._last = {}
+        self._rate = {}
+        self._seq = 0
+
+    def schedule(self, vid, t):
+        self._seq += 1
+        self._valid[vid] = self._seq
+        heapq.heappush(self._heap, (t, self._seq, vid))
+
+    def discard(self, vid):
+        self._valid.pop(vid, None)
+        self._last.pop(vid, None)
+        self._rate.pop(vid, None)
+
+    def due(self, now):
+        """VEs cuja leitura venceu até `now`, na ordem de agendamento."""
+        out = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, vid = heapq.heappop(self._heap)
+            if self._valid.get(vid) == seq:
+                del self._valid[vid]
+                out.append(vid)
+        return out
+
+    def observe(self, vid, now, wh):
+        """Registra uma leitura e agenda a próxima."""
+        self.reads += 1
+        last = self._last.get(vid)
+        self._last[vid] = (now, wh)
+        rate = self._rate.get(vid)
+        if last is not None and now > last[0]:
+            slope = max((last[1] - wh) / (now - last[0]), 0.0)
+            rate = slope if rate is None else max(slope, 0.5 * (rate + slope))
+            self._rate[vid] = rate
+
+        if wh < self.threshold:
+            delay = self.max_interval  # já cruzou: só acompanha (override)
+        elif not rate:
+            # Sem consumo medido ainda (parado, recém-inserido): sonda de novo em breve
+            delay = min(BATTERY_PROBE_INTERVAL, self.max_interval)
+        else:
+            delay = min(max((wh - self.threshold - self.margin) / rate, 0.0), self.max_interval)
+        self.schedule(vid, now + delay)
+
 # Define a porcentagem de veículos com bateria baixa
 LOW_BATTERY_PERCENTAGE = 100
 
 def set_low_battery_percentage(route_file, percentage):
-    tree = ET.parse(route_file)
-    root = tree.getroot()
-    vehicles = [v.get('id') for v in root.findall(".//vehicle") if v.get('type') == 'electric_vehicle']
+    """
+    VEs de bateria baixa (os primeiros `percentage`% do arquivo) e o horário de
+    partida previsto de cada um, lidos dos metadados em cache do arquivo de rotas.
+    """
+    vehicles, departs = load_route_metadata(route_file).vehicles_of_type('electric_vehicle')
     num_low_battery = int(len(vehicles) * percentage / 100)
     low_battery_vehicles = set(vehicles[:num_low_battery])
-    print(f"Veículos com bateria baixa definidos: {low_battery_vehicles}")
-    return low_battery_vehicles
+    depart_times = dict(zip(vehicles[:num_low_battery], departs[:num_low_battery].tolist()))
+    print(f"Veículos com bateria baixa definidos: {len(low_battery_vehicles)}")
+    return low_battery_vehicles, depart_times
 
-def run_simulation(args, graph, add_file=None):
-    import traci, os
-    trip_info_file = "output/tripinfo.xml"
+# --- ADICIONADO (S17): saídas do SUMO com nome por execução (execuções em paralelo não colidem)
+def run_tag(args, suffix=""):
     base_name = os.path.basename(args.route_file).replace('_mod.rou.xml', '')
-    log_file = f"output/{args.method}_{args.mode}_{base_name}.log"
+    tag = f"{args.method}_{args.mode}_{base_name}"
+    if args.mode == "second_run":
+        # (S21) ERs/TRs/réplicas do mesmo cenário rodam em paralelo no agendador
+        tag += f"_er{args.er}_tr{args.tr_min:g}_rep{args.rep}_seed{args.seed}"
+        if getattr(args, "station_choice", "distance") != "distance":
+            tag += f"_{args.station_choice}"
+    return tag + suffix
+
+def sumo_output_files(args, suffix=""):
+    tag = run_tag(args, suffix)
+    return {
+        "tripinfo": f"output/tripinfo_{tag}.xml",
+        "battery": f"output/battery_{tag}.xml",
+        "chargingstations": f"output/chargingstations_{tag}.xml",
+    }
 
+def ingest_outputs(args, warm=None, suffix=""):
+    """
+    Converte as saídas XML da execução em .npz (<out_dir>/saidas/<execução>/) e
+    devolve as métricas derivadas para a linha de resultados. (S19) Com warm
+    start, as saídas do prefixo salvo entram antes das da continuação.
+    """
+    base_name = os.path.basename(args.route_file).replace('_mod.rou.xml', '')
+    choice = "" if args.station_choice == "distance" else f"_{args.station_choice}"
+    run_dir = os.path.join(args.out_dir, "saidas",
+                           f"{args.method}_{base_name}_er{args.er}_tr{args.tr_min:g}_rep{args.rep}_seed{args.seed}{choice}{suffix}")
+    params = {"method": args.method, "route_file": os.path.basename(args.route_file), "ER": args.er,
+              "TR": args.tr_min, "rep": args.rep, "seed": args.seed, "step_length": args.step_length,
+              "add_file": os.path.basename(args.add_file) if args.add_file else None,
+              "warm_start": warm["time"] if warm else None, "station_choice": args.station_choice}
+    outputs = sumo_output_files(args, suffix)
+    sources = {k: [warm["outputs"][k], path] if warm else path for k, path in outputs.items()}
+    metrics = ingestao_saidas.ingest_run(sources, run_dir, params, battery_every=args.battery_every)
+    print(f"🗃️  Saídas do SUMO ingeridas em {run_dir}")
+    if args.drop_sumo_xml:
+        for path in outputs.values():
+            if os.path.isfile(path):
+                os.remove(path)
+    return metrics
+
+def sumo_command(args, add_file, outputs, log_file):
     sumoCmd = [
         "sumo", "-c", "cologne.sumocfg",
         "--route-files", args.route_file,
-        "--tripinfo-output", trip_info_file,
+        "--tripinfo-output", outputs["tripinfo"],
+        "--battery-output", outputs["battery"],
+        "--chargingstations-output", outputs["chargingstations"],
         "--duration-log.statistics", "--log", log_file, "--verbose",
         "--step-length", str(args.step_length),
         "--threads", str(args.threads),
@@ -391,94 +998,286 @@ def run_simulation(args, graph, add_file=None):
         sumoCmd += ["--additional-files", f"cologne.poly.xml,{add_file}"]
     else:
         sumoCmd += ["--additional-files", "cologne.poly.xml"]
+    if getattr(args, "warm_start", False):
+        sumoCmd += WARM_START_SUMO_OPTS
+    return sumoCmd
+
+# --- ADICIONADO (S19): warm start do second_run a partir do estado salvo antes da 1ª intervenção
+WARM_START_VERSION = 1
+# Rotas todas carregadas no início (o sorteio de speedFactor etc. não depende de
+# quando a rota é lida) e estado salvo com RNG e precisão total: sem intervenções
+# a continuação é idêntica à execução a frio com as mesmas opções. Com paradas em
+# PA pode divergir (o loadState do SUMO não restaura a ocupação das vagas à beira
+# da via), por isso o warm start é opcional e --warm_start_check confere.
+WARM_START_SUMO_OPTS = ["--route-steps", "0", "--save-state.rng", "--save-state.precision", "10"]
+
+def warm_start_time(args):
+    """
+    Até quando todas as variantes do cenário simulam exatamente o mesmo: antes da
+    partida do primeiro VE de bateria baixa não há nenhuma intervenção (e as PAs
+    carregadas não influem). Fica um passo de folga antes da menor partida prevista.
+    """
+    _, depart_times = set_low_battery_percentage(args.route_file, LOW_BATTERY_PERCENTAGE)
+    departs = list(depart_times.values())
+    if not departs or any(d != d for d in departs):
+        return 0.0  # partida não numérica: não dá para garantir o prefixo
+    return max(0.0, (int(np.ceil(min(departs) / args.step_length)) - 2) * args.step_length)
+
+def warm_start_key(args, cache_dir):
+    parts = {
+        "version": WARM_START_VERSION,
+        "route": file_digest(args.route_file, cache_dir),
+        "net": get_net_index(args.net_file).digest,
+        "config": file_digest("cologne.sumocfg", cache_dir),
+        "poly": file_digest("cologne.poly.xml", cache_dir),
+        "seed": args.seed, "step_length": args.step_length, "threads": args.threads,
+        "low_battery_percentage": LOW_BATTERY_PERCENTAGE,
+    }
+    key = hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:20]
+    return key, parts
 
-    t0 = time.time()
-    traci.start(sumoCmd)
+def save_warm_start(args, entry_dir, snap_time, parts):
+    """
+    Roda o prefixo comum (sem PAs) até `snap_time` e salva o estado do SUMO junto
+    com as saídas e o nº de teleports do prefixo. Se algum VE acompanhado partir
+    antes do previsto, o estado não é salvo.
+    """
+    cache_dir = os.path.dirname(entry_dir)
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".build_")
+    outputs = {k: os.path.join(tmp_dir, f"{k}.xml") for k in ("tripinfo", "battery", "chargingstations")}
+    log_file = os.path.join(tmp_dir, "prefixo.log")
+    tracked, _ = set_low_battery_percentage(args.route_file, LOW_BATTERY_PERCENTAGE)
+
+    print(f"🧊 Salvando o prefixo comum do cenário até t={snap_time:.1f}s ...")
+    traci.start(sumo_command(args, None, outputs, log_file))
+    saved = True
+    while traci.simulation.getTime() < snap_time:
+        traci.simulationStep()
+        if tracked.intersection(traci.simulation.getDepartedIDList()):
+            saved = False
+            break
+    now = traci.simulation.getTime()
+    if saved:
+        traci.simulation.saveState(os.path.join(tmp_dir, "state.xml.gz"))
+    traci.close()
 
-    lane_visits = {}
-    low_battery_vehicles = set_low_battery_percentage(args.route_file, LOW_BATTERY_PERCENTAGE)
+    meta = dict(parts, saved=saved, time=now, teleports=parse_teleports(log_file),
+                route_file=os.path.abspath(args.route_file),
+                state=os.path.join(entry_dir, "state.xml.gz"),
+                outputs={k: os.path.join(entry_dir, os.path.basename(v)) for k, v in outputs.items()})
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    os.rename(tmp_dir, entry_dir)
+    return meta
+
+def load_or_save_warm_start(args):
+    """
+    Estado salvo do prefixo comum (metadados) para retomar o second_run, ou None
+    quando não compensa ou não é seguro (aí a execução é a frio). O lock faz as
+    variantes lançadas em paralelo esperarem o primeiro prefixo.
+    """
+    snap_time = warm_start_time(args)
+    if snap_time < args.warm_start_min:
+        print(f"🧊 Warm start ignorado: prefixo comum de {snap_time:.1f}s (< {args.warm_start_min:g}s).")
+        return None
+    cache_dir = args.warm_start_dir or os.path.join(args.out_dir, "warm_start")
+    os.makedirs(cache_dir, exist_ok=True)
+    key, parts = warm_start_key(args, cache_dir)
+    entry_dir = os.path.join(cache_dir, key)
+    meta_file = os.path.join(entry_dir, "meta.json")
+
+    with file_lock(entry_dir + ".lock"):
+        _profiler.cache("warm_start", os.path.isfile(meta_file))
+        if os.path.isfile(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+        else:
+            with _profiler.phase("warm_start_prefix"):
+                meta = save_warm_start(args, entry_dir, snap_time, parts)
+    if not meta["saved"]:
+        print("⚠️  Warm start indisponível: um VE acompanhado partiu antes do previsto no prefixo.")
+        return None
+    print(f"♻️  Retomando do estado salvo em t={meta['time']:.1f}s ({meta['state']})")
+    return meta
+
+def check_warm_start(args, graph, results, metrics):
+    """
+    Roda o mesmo second_run a frio (mesmas opções do SUMO) e compara as métricas
+    com as da execução retomada. Devolve a lista de divergências.
+    """
+    print("🔍 Conferindo o warm start contra uma execução a frio ...")
+    cold = run_simulation(args, graph, add_file=args.add_file, suffix="_frio")
+    cold_metrics = {} if args.no_ingest else ingest_outputs(args, suffix="_frio")
+    diverged = []
+    for key in ("T_espera", "D_estacao", "N_teleport"):
+        if not np.isclose(results[key], cold[key], rtol=1e-9, atol=1e-9):
+            diverged.append((key, results[key], cold[key]))
+    for key, value in cold_metrics.items():
+        if not np.isclose(metrics.get(key, np.nan), value, rtol=1e-6, atol=1e-9):
+            diverged.append((key, metrics.get(key), value))
+    return diverged
+
+def run_simulation(args, graph, add_file=None, warm=None, suffix=""):
+    outputs = sumo_output_files(args, suffix)
+    log_file = f"output/{run_tag(args, suffix)}.log"
+    sumoCmd = sumo_command(args, add_file, outputs, log_file)
+
+    t0 = time.time()
+    with _profiler.phase("start"):
+        traci.start(sumoCmd)
+        if warm:
+            # (S19) Continua do prefixo salvo; o .add.xml desta variante já está carregado
+            traci.simulation.loadState(warm["state"])
+
+    # (S12) Visitas por lane (× janela de tempo) em matriz, só no first_run
+    visit_acc = None
+    next_visit_flush = None
+    decisions = None
+    if args.mode == "first_run":
+        visit_acc = LaneVisitAccumulator(get_net_index(args.net_file), bin_seconds=args.visit_bin)
+        # (S25) Primeira edge conhecida de cada VE: onde o second_run escolheria a estação
+        decisions = {}
+        if args.visit_flush:
+            next_visit_flush = args.visit_flush
+    low_battery_vehicles, depart_times = set_low_battery_percentage(args.route_file, LOW_BATTERY_PERCENTAGE)
     visited_parking = {}
+    # (S13) Conjuntos incrementais, alimentados pelos eventos de partida/chegada/parada:
+    # active = VEs em circulação ainda sem PA (ordem de partida); waiting = a caminho da PA
+    active = {}
+    waiting = {}
+
+    # (S4) Estações são fixas depois que o .add.xml é carregado: distâncias calculadas uma vez
+    # (S15) Registro das estações montado do .add.xml + índice da rede; ocupação por subscrição
+    station_table = None
+    station_registry = None
+    station_chooser = None
+    if args.mode == "second_run":
+        with _profiler.phase("station_setup"):
+            station_registry = load_station_registry([add_file] if add_file else [], args.net_file,
+                                                     traci.parkingarea.getIDList())
+            station_registry.subscribe()
+            station_table = build_station_distance_table(graph, args.net_file, station_registry.stations())
+            # (S20) Distância fica só para a métrica D_estacao; a escolha usa o tempo atual
+            if args.station_choice == "traveltime":
+                station_chooser = TravelTimeStationChooser(
+                    get_alt_oracle(args.net_file, args.alt_landmarks, args.seed), station_registry,
+                    refresh_s=args.alt_refresh_steps * args.step_length, charge_s=args.tr_min * 60)
+
+    # (S14) Bateria só é lida no second_run, e só quando o agendador manda
+    battery_scheduler = None
+    if args.mode == "second_run":
+        battery_scheduler = BatteryScheduler(BATTERY_THRESHOLD_WH, margin=args.battery_margin,
+                                             max_interval=args.battery_max_interval)
+
+    # (S5) Estado dos VEs via subscrição: um lote de resultados por passo.
+    # Com leituras esparsas a bateria sai da subscrição e é lida sob demanda.
+    subscribe_battery = (battery_scheduler is not None and args.battery_max_interval == 0
+                         and _backend_name != "libsumo")
+    state = VehicleStateLayer(low_battery_vehicles, subscribe_battery=subscribe_battery,
+                              depart_times=depart_times)
 
     while traci.simulation.getMinExpectedNumber() > 0:
-        traci.simulationStep()
-
-        if args.mode == "second_run":
-            for vehicle_id in traci.vehicle.getIDList():
-                if vehicle_id in low_battery_vehicles:
+        _profiler.begin_step()
+        with _profiler.phase("sumo_step"):
+            traci.simulationStep()
+        with _profiler.phase("events"):
+            now = traci.simulation.getTime()
+            state.update(now)
+            for vid in state.departed:
+                active[vid] = None
+                if battery_scheduler is not None:
+                    battery_scheduler.schedule(vid, now)
+            for vid in state.arrived:
+                active.pop(vid, None)
+                waiting.pop(vid, None)
+                if battery_scheduler is not None:
+                    battery_scheduler.discard(vid)
+
+        low_battery_now = []
+        with _profiler.phase("battery"):
+            if battery_scheduler is not None:
+                for vehicle_id in battery_scheduler.due(now):
+                    if vehicle_id not in state or vehicle_id not in low_battery_vehicles:
+                        continue  # recarregado: sai da fila
                     try:
-                        current_battery = float(traci.vehicle.getParameter(vehicle_id, "device.battery.actualBatteryCapacity"))
-                        if current_battery > 12000:
-                            traci.vehicle.setParameter(vehicle_id, "device.battery.actualBatteryCapacity", "12000")
-                            print(f"🔋 Veículo {vehicle_id} definido com bateria baixa (12000 Wh).")
+                        current_battery = state.battery(vehicle_id)
+                        if current_battery > LOW_BATTERY_OVERRIDE_WH:
+                            state.set_battery(vehicle_id, LOW_BATTERY_OVERRIDE_WH)
+                            print(f"🔋 Veículo {vehicle_id} definido com bateria baixa ({LOW_BATTERY_OVERRIDE_WH} Wh).")
+                            current_battery = LOW_BATTERY_OVERRIDE_WH
                     except traci.exceptions.TraCIException:
                         continue
-
-        for vid in list(visited_parking.keys()):
-            data = visited_parking[vid]
-            if vid not in traci.vehicle.getIDList():
-                continue
-            if data["state"] == "waiting":
+                    battery_scheduler.observe(vehicle_id, now, current_battery)
+                    if vehicle_id in active and current_battery < BATTERY_THRESHOLD_WH:
+                        low_battery_now.append((vehicle_id, current_battery))
+
+        # waiting -> recharged quando a parada na PA começa (evento), sem olhar a lane de cada um.
+        # Veículo estacionado fica fora da lane (""), então a PA é conferida na própria parada.
+        with _profiler.phase("stops"):
+            for vid in state.stops_started:
+                data = waiting.get(vid)
+                if data is None:
+                    continue
                 try:
-                    current_lane = traci.vehicle.getLaneID(vid)
-                    if current_lane == data["parking_lane"] and "t_arrive_lane" not in data:
-                        data["t_arrive_lane"] = traci.simulation.getTime()
-                        data["t_queue"] = data["t_arrive_lane"] - data["t_dec"]
-                        print(f"✅ Veículo {vid} chegou à PA. T_fila: {data['t_queue']:.2f}s.")
-                        orig_target = data.get("original_target")
-                        if orig_target:
-                            traci.vehicle.changeTarget(vid, orig_target)
-                        visited_parking[vid]["state"] = "recharged"
-                        if vid in low_battery_vehicles:
-                            low_battery_vehicles.remove(vid)
-                        print(f"🔋 Veículo {vid} recarregado e marcado como 'recharged'.")
+                    stops = traci.vehicle.getStops(vid, 1)
+                    if not stops or stops[0].stoppingPlaceID != data["parking_id"]:
+                        continue
+                    del waiting[vid]
+                    data["t_arrive_lane"] = now
+                    data["t_queue"] = data["t_arrive_lane"] - data["t_dec"]
+                    print(f"✅ Veículo {vid} chegou à PA. T_fila: {data['t_queue']:.2f}s.")
+                    orig_target = data.get("original_target")
+                    if orig_target:
+                        traci.vehicle.changeTarget(vid, orig_target)
+                    data["state"] = "recharged"
+                    low_battery_vehicles.discard(vid)
+                    print(f"🔋 Veículo {vid} recarregado e marcado como 'recharged'.")
                 except traci.exceptions.TraCIException:
                     continue
 
-        active_low_battery_vehicles = {v for v in low_battery_vehicles if v not in visited_parking}
-
-        for vehicle_id in active_low_battery_vehicles:
-            if vehicle_id not in traci.vehicle.getIDList():
-                continue
-            try:
-                battery_level = float(traci.vehicle.getParameter(vehicle_id, "device.battery.actualBatteryCapacity"))
-                vehicle_position = traci.vehicle.getPosition(vehicle_id)
-            except traci.exceptions.TraCIException:
-                continue
-
-            if battery_level < 15000 and args.mode == "second_run":
+        with _profiler.phase("station_choice"):
+            pending = None
+            if low_battery_now:
+                station_registry.refresh()
+                if station_chooser is not None:
+                    # VEs já a caminho de cada estação contam como demanda
+                    pending = np.zeros(len(station_registry), dtype=np.int64)
+                    for data in waiting.values():
+                        if data["parking_id"] in station_registry.ids:
+                            pending[station_registry.ids.index(data["parking_id"])] += 1
+            for vehicle_id, battery_level in low_battery_now:
                 print(f"⚡ Veículo {vehicle_id} com bateria baixa ({battery_level:.0f} Wh), procurando Parking Area...")
-                available_parkings = []
-                current_edge = traci.vehicle.getRoadID(vehicle_id)
-
-                for parking_id in traci.parkingarea.getIDList():
-                    try:
-                        parking_lane_id = traci.parkingarea.getLaneID(parking_id)
-                        if parking_lane_id not in traci.lane.getIDList():
-                            continue
-                        station_edge = parking_lane_id.split('_')[0]
-                        network_distance = compute_distance_to_station(graph, args.net_file, current_edge, station_edge)
-                        if network_distance != float('inf'):
-                            available_parkings.append((parking_id, parking_lane_id, network_distance))
-                    except traci.exceptions.TraCIException:
-                        continue
-
-                available_parkings.sort(key=lambda x: (x[2], traci.parkingarea.getVehicleCount(x[0])))
-
-                if available_parkings:
-                    chosen_parking, parking_lane_id, min_distance = available_parkings[0]
+                current_edge = state.road(vehicle_id)
+
+                distances = station_table.row(current_edge)
+                _profiler.cache("station_table_row", distances is not None)
+                if distances is None:
+                    s = None
+                elif station_chooser is not None:
+                    s = station_chooser.choose(now, current_edge, pending)
+                else:
+                    s = station_registry.choose(distances)
+
+                if s is not None:
+                    chosen_parking = station_registry.ids[s]
+                    parking_lane_id = station_registry.lanes[s]
+                    station_edge = station_registry.edges[s]
+                    min_distance = float(distances[s])
                     print(f"🚗 Veículo {vehicle_id} indo para Parking Area {chosen_parking}, a {int(min_distance)}m de distância.")
-                    current_edge = traci.vehicle.getRoadID(vehicle_id)
-                    station_edge = parking_lane_id.split('_')[0]
-                    dist_to_station = compute_distance_to_station(graph, args.net_file, current_edge, station_edge)
+                    dist_to_station = min_distance
                     original_target = traci.vehicle.getRoute(vehicle_id)[-1]
-                    visited_parking[vehicle_id] = {
+                    visited_parking[vehicle_id] = waiting[vehicle_id] = {
                         "state": "waiting",
                         "parking_id": chosen_parking,
                         "parking_lane": parking_lane_id,
                         "original_target": original_target,
-                        "t_dec": traci.simulation.getTime(),
+                        "t_dec": now,
                         "d_to_station": dist_to_station
                     }
+                    del active[vehicle_id]
+                    if pending is not None:
+                        pending[s] += 1
                     try:
                         traci.vehicle.changeTarget(vehicle_id, station_edge)
                         charge_duration_s = int(args.tr_min * 60)
@@ -488,18 +1287,39 @@ def run_simulation(args, graph, add_file=None):
                         print(f"Erro ao configurar PA para veículo {vehicle_id}: {e}")
                         continue
 
-            if vehicle_id in traci.vehicle.getIDList():
-                try:
-                    lane_id = traci.vehicle.getLaneID(vehicle_id)
+                if vehicle_id in active:
+                    # Sem PA alcançável agora (ex.: em junção): tenta de novo no próximo passo
+                    battery_scheduler.schedule(vehicle_id, now)
+
+        with _profiler.phase("visits"):
+            if visit_acc is not None:
+                for vehicle_id in active:
+                    if vehicle_id not in state:
+                        continue
+                    lane_id = state.lane(vehicle_id)
                     if lane_id and not lane_id.startswith(":"):
-                        lane_visits[lane_id] = lane_visits.get(lane_id, 0) + 1
-                except traci.exceptions.TraCIException:
-                    continue
+                        visit_acc.add(lane_id, now)
+                    if vehicle_id not in decisions:
+                        road = state.road(vehicle_id)
+                        if road and visit_acc.index.edge_position(road) >= 0:
+                            decisions[vehicle_id] = (road, now)
+
+            if next_visit_flush is not None and now >= next_visit_flush:
+                visit_acc.flush(lane_visits_file(args))
+                next_visit_flush += args.visit_flush
+        _profiler.end_step()
 
     T_exec = time.time() - t0
-    traci.close()
+    with _profiler.phase("close"):
+        traci.close()
+    if battery_scheduler is not None:
+        print(f"🔋 Leituras de bateria: {battery_scheduler.reads}")
+        _profiler.count("battery_reads", battery_scheduler.reads)
 
     N_teleport = parse_teleports(log_file)
+    if warm:
+        # Os contadores do SUMO recomeçam no loadState: soma os do prefixo
+        N_teleport += warm["teleports"]
     t_esperas = [d["t_queue"] for d in visited_parking.values() if "t_queue" in d]
     d_estacoes = [d["d_to_station"] for d in visited_parking.values() if "d_to_station" in d and d["d_to_station"] != float('inf')]
 
@@ -510,13 +1330,147 @@ def run_simulation(args, graph, add_file=None):
         "T_exec": T_exec, "N_teleport": N_teleport,
         "T_espera": T_espera_mean, "D_estacao": D_estacao_mean
     }
-    return (lane_visits, results) if args.mode == 'first_run' else results
+    if decisions is not None:
+        results["decision_points"] = decision_points_from_dict(decisions)
+    return (visit_acc.result(), results) if args.mode == 'first_run' else results
 
-if __name__ == "__main__":
+# --- ADICIONADO (S10): cache do first_run, compartilhado entre métodos e ERs
+METHODS = ["random", "greedy", "grasp", "celf", "pmedian"]  # (S24) celf e pmedian
+DEFAULT_METHODS = ["random", "greedy", "grasp"]
+FIRST_RUN_CACHE_VERSION = 1  # muda quando a contagem de visitas muda
+
+def first_run_cache_key(args, cache_dir):
+    """
+    O first_run não depende de --method nem de --er: lane_visits vem só da rota,
+    da rede, da seed, do passo e das threads.
+    """
+    parts = {
+        "version": FIRST_RUN_CACHE_VERSION,
+        "route": file_digest(args.route_file, cache_dir),
+        "net": get_net_index(args.net_file).digest,
+        "seed": args.seed, "step_length": args.step_length, "threads": args.threads,
+        "low_battery_percentage": LOW_BATTERY_PERCENTAGE, "visit_bin": args.visit_bin,
+    }
+    key = hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:20]
+    return key, parts
+
+@contextlib.contextmanager
+def file_lock(path):
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def load_or_run_first_run(args, graph):
+    """
+    Devolve as visitas (LaneVisits) do cache quando já existe uma entrada para a
+    mesma chave; senão roda o SUMO e grava a entrada. O lock faz métodos do mesmo cenário
+    lançados em paralelo esperarem a primeira simulação em vez de repeti-la.
+    """
+    sim_args = argparse.Namespace(**vars(args))
+    sim_args.mode = "first_run"
+    sim_args.method = args.method or "multi"
+    if args.no_first_run_cache:
+        visits, results = run_simulation(sim_args, graph)
+        results["decision_points"].save(decision_points_file(args))
+        return visits
+
+    cache_dir = args.first_run_cache or os.path.join(args.out_dir, "first_run_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    key, parts = first_run_cache_key(args, cache_dir)
+    entry = os.path.join(cache_dir, f"{key}.npz")
+    decisions_entry = os.path.join(cache_dir, f"{key}_decisoes.npz")
+
+    with file_lock(entry + ".lock"):
+        _profiler.cache("first_run", os.path.isfile(entry))
+        if os.path.isfile(entry):
+            print(f"♻️  FIRST RUN reaproveitado do cache ({entry}); SUMO não será executado.")
+            if os.path.isfile(decisions_entry):
+                load_decision_points(decisions_entry).save(decision_points_file(args))
+            return load_lane_visits(entry)
+
+        visits, results = run_simulation(sim_args, graph)
+        results["decision_points"].save(decisions_entry)
+        results["decision_points"].save(decision_points_file(args))
+        visits.save(entry)
+        with open(os.path.join(cache_dir, f"{key}.json"), "w") as f:
+            json.dump(dict(parts, route_file=os.path.abspath(args.route_file),
+                           net_file=os.path.abspath(args.net_file)), f, indent=1)
+        print(f"💾 FIRST RUN salvo no cache: {entry}")
+    return visits
+
+def select_stations(method, lane_visits, num_stations, graph, args):
+    with _profiler.phase(f"selection_{method}"):
+        if method == "random":
+            return select_random_stations(lane_visits, num_stations)
+        elif method == "greedy":
+            return select_greedy_stations(lane_visits, num_stations)
+        elif method == "grasp":
+            return select_grasp_stations(lane_visits, num_stations, graph, args.net_file,
+                                         alpha=args.grasp_alpha, iterations=args.grasp_iters,
+                                         time_limit=args.grasp_time, workers=args.grasp_workers)
+        elif method == "celf":
+            return select_celf_stations(lane_visits, num_stations, graph, args.net_file,
+                                        radius=args.coverage_hops * DEFAULT_EDGE_WEIGHT,
+                                        limit=args.location_candidates)
+        elif method == "pmedian":
+            return select_pmedian_stations(lane_visits, num_stations, graph, args.net_file,
+                                           limit=args.location_candidates)
+    raise ValueError(f"Método desconhecido: {method}")
+
+# --- ADICIONADO (S23): resultados e perfis num banco SQLite; os CSVs são exportados dele
+def open_results_store(args):
+    return ResultsStore(args.results_db or os.path.join(args.out_dir, DB_NAME),
+                        legacy_csv=os.path.join(args.out_dir, "resultados_execucoes.csv"),
+                        legacy_profiles_csv=os.path.join(args.out_dir, "perfil_execucoes.csv"))
+
+def save_profile(args, run_id=None):
+    """Grava o perfil da execução em JSON e no banco de resultados (perfil_execucoes.csv é reexportado)."""
+    base_name = os.path.basename(args.route_file).replace('_mod.rou.xml', '')
+    json_file = os.path.join(args.out_dir, f"perfil_{args.method or 'multi'}_{args.mode}_{base_name}.json")
+    extra = {"method": args.method or "multi", "mode": args.mode, "route_file": os.path.basename(args.route_file),
+             "ER": args.er, "rep": args.rep, "backend": args.backend, "graph_backend": args.graph_backend}
+    _profiler.save(json_file, extra=extra)
+    with open_results_store(args) as store:
+        store.add_profile(_profiler.to_dict(), extra, run_id=run_id)
+        store.flush()
+        store.export_csv(profiles_path=os.path.join(args.out_dir, "perfil_execucoes.csv"))
+    print(f"⏱️  Perfil salvo em {json_file}")
+
+def lane_visits_file(args):
+    return f"output/lane_visits_{os.path.basename(args.route_file).replace('_mod.rou.xml', '.npz')}"
+
+def decision_points_file(args):
+    # (S25) Lido pelo avaliador_substituto
+    return decisions_file(args.route_file)
+
+def first_run_visits(args, graph):
+    """
+    Visitas que guiam a seleção: as réplicas de --visits_from somadas, se
+    informadas; senão as do first_run (cache ou SUMO). Grava o .npz em output/.
+    """
+    if args.visits_from:
+        visits = merge_lane_visits(args.visits_from)
+        print(f"📊 Visitas somadas de {len(args.visits_from)} arquivo(s): {len(visits)} lanes")
+    else:
+        visits = load_or_run_first_run(args, graph)
+    visits_file = visits.save(lane_visits_file(args))
+    print(f"💾 Dados de visitas salvos em {visits_file}")
+    return visits.totals_dict()
+
+# --- ADICIONADO (S22): ponto de entrada reutilizável (o servidor de trabalho chama main(argv) num fork)
+def build_arg_parser():
     ap = argparse.ArgumentParser(description="Controlador de simulação SUMO para alocação de PAs.")
     ap.add_argument("--route_file", required=True)
-    ap.add_argument("--method", choices=["random", "greedy", "grasp"], required=True)
-    ap.add_argument("--mode", choices=["first_run", "second_run"], required=True)
+    ap.add_argument("--method", choices=METHODS, help="Obrigatório em first_run e second_run")
+    ap.add_argument("--mode", choices=["first_run", "second_run", "first_run_multi"], required=True,
+                    help="first_run_multi: simula uma vez e gera os .add.xml de --methods × --ers")
+    ap.add_argument("--methods", nargs="+", choices=METHODS, default=DEFAULT_METHODS, help="Métodos do first_run_multi")
+    ap.add_argument("--ers", nargs="+", type=int, help="ERs do first_run_multi (padrão: --er)")
+    ap.add_argument("--visits_only", action="store_true",
+                    help="first_run_multi: só simula (ou lê do cache) e grava as visitas, sem seleção")
     ap.add_argument("--add_file", help="Arquivo .add.xml para o second_run.")
     ap.add_argument("--net_file", default="cologne2.net.xml")
     ap.add_argument("--er", type=int, default=10, help="Nº de estações (ER)")
@@ -527,64 +1481,162 @@ if __name__ == "__main__":
     ap.add_argument("--threads", type=int, default=24) #Qtde. de processos por ciclo
     ap.add_argument("--step_length", type=float, default=1.5)
     ap.add_argument("--out_dir", default="output")
-    args = ap.parse_args()
+    ap.add_argument("--results_db", default=None,
+                    help=f"Banco de resultados (padrão: <out_dir>/{DB_NAME}); os CSVs são exportados dele")
+    ap.add_argument("--backend", choices=BACKENDS, default="traci",
+                    help="traci (socket TCP) ou libsumo (in-process, sem IPC por passo)")
+    ap.add_argument("--graph_backend", choices=GRAPH_BACKENDS, default="networkx",
+                    help="Motor de caminhos mínimos: networkx ou csr (scipy.sparse.csgraph)")
+    ap.add_argument("--grasp_alpha", type=float, default=0.3, help="GRASP: alpha da RCL (0 = guloso, 1 = aleatório)")
+    ap.add_argument("--grasp_iters", type=int, default=10,
+                    help="GRASP: orçamento de iterações (0 = sem limite; exige --grasp_time)")
+    ap.add_argument("--grasp_time", type=float, default=None, help="GRASP: orçamento de tempo (s)")
+    ap.add_argument("--grasp_workers", type=int, default=1, help="GRASP: processos em paralelo")
+    ap.add_argument("--coverage_hops", type=int, default=COVERAGE_HOPS,
+                    help="celf: edges intermediárias (no máximo) entre a demanda e a estação para contar como coberta; "
+                         "0 = mesma edge ou a seguinte")
+    ap.add_argument("--location_candidates", type=int, default=LOCATION_CANDIDATES,
+                    help="celf/pmedian: nº máximo de lanes candidatas (as mais visitadas; 0 = todas)")
+    ap.add_argument("--first_run_cache", default=None,
+                    help="Diretório do cache do first_run (padrão: <out_dir>/first_run_cache)")
+    ap.add_argument("--no_first_run_cache", action="store_true", help="Sempre roda o SUMO no first_run")
+    ap.add_argument("--profile", choices=perfilador.PROFILE_MODES, default="off",
+                    help="Instrumentação: full (fases, chamadas TraCI, histogramas) ou sample (1 a cada N passos)")
+    ap.add_argument("--profile_every", type=int, default=100, help="Modo sample: cronometra 1 a cada N passos")
+    ap.add_argument("--battery_margin", type=float, default=500,
+                    help="Margem (Wh) acima do limiar em que a próxima leitura de bateria é agendada")
+    ap.add_argument("--battery_max_interval", type=float, default=60,
+                    help="Intervalo máximo (s) entre leituras de bateria de um VE (0 = todo passo)")
+    ap.add_argument("--visit_bin", type=float, default=0,
+                    help="Largura (s) das janelas de tempo das visitas por lane (0 = sem janelas)")
+    ap.add_argument("--visit_flush", type=float, default=0,
+                    help="Grava o .npz parcial de visitas a cada N segundos simulados (0 = só no fim)")
+    ap.add_argument("--visits_from", nargs="+",
+                    help="Seleciona a partir da soma destes lane_visits_*.npz (réplicas) em vez de simular")
+    ap.add_argument("--no_ingest", action="store_true",
+                    help="second_run: não converte tripinfo/battery/chargingstations em .npz nem calcula as métricas")
+    ap.add_argument("--battery_every", type=float, default=60,
+                    help="Amostragem (s) da série de bateria ingerida (0 = só agregados por VE)")
+    ap.add_argument("--drop_sumo_xml", action="store_true", help="Apaga os XMLs de saída do SUMO depois da ingestão")
+    ap.add_argument("--warm_start", action="store_true",
+                    help="second_run: retoma do estado salvo antes da 1ª intervenção (prefixo comum a métodos/ERs)")
+    ap.add_argument("--warm_start_dir", default=None, help="Diretório dos estados salvos (padrão: <out_dir>/warm_start)")
+    ap.add_argument("--warm_start_min", type=float, default=30,
+                    help="Prefixo mínimo (s simulados) para valer a pena o warm start")
+    ap.add_argument("--warm_start_check", action="store_true",
+                    help="Roda também a frio e confere se as métricas batem (sai com erro se divergirem)")
+    ap.add_argument("--station_choice", choices=STATION_CHOICES, default="distance",
+                    help="second_run: estação mais próxima (distance) ou de menor tempo de viagem atual + fila (traveltime)")
+    ap.add_argument("--alt_landmarks", type=int, default=8, help="traveltime: nº de landmarks do oráculo ALT")
+    ap.add_argument("--alt_refresh_steps", type=int, default=40,
+                    help="traveltime: relê o tempo de viagem das edges a cada N passos (em lote)")
+    ap.add_argument("--dump_graph_edges", action="store_true",
+                    help="Grava edges_no_grafo.txt (lista das edges do grafo, para depuração)")
+    return ap
+
+def main(argv=None):
+    ap = build_arg_parser()
+    args = ap.parse_args(argv)
+    if args.mode != "first_run_multi" and not args.method:
+        ap.error("--method é obrigatório nos modos first_run e second_run")
+    if args.grasp_iters < 1 and not args.grasp_time:
+        ap.error("--grasp_iters deve ser >= 1 (0 só junto com --grasp_time)")
+    if 'SUMO_HOME' not in os.environ:
+        sys.exit("Declare a variável de ambiente 'SUMO_HOME'")
+
+    load_backend(args.backend)
+    enable_profiling(args.profile, args.profile_every)
 
     os.makedirs(args.out_dir, exist_ok=True)
     random.seed(args.seed)
 
     # Grafo para GRASP e métricas de D_estacao
-    graph = create_graph_from_net(args.net_file)
-
-    # (S1) Pré-indexa a rede UMA vez e exporta para globais usadas no cache
-    _lane_to_edge, _edge_nodes, _lane_len_index = build_net_indexes(args.net_file)
-    _graph = graph  # torna o grafo acessível à função cacheada
+    with _profiler.phase("graph_build"):
+        graph = get_graph(args.net_file, args.graph_backend)
+    if args.dump_graph_edges:
+        dump_graph_edges(args.net_file)
 
+    run_id = None  # (S23) execução no banco de resultados, só no second_run
     if args.mode == "first_run":
         print(f"🚀 FIRST RUN: Rota={args.route_file}, Método={args.method}")
-        lane_visits, _ = run_simulation(args, graph)
-
-        visits_file = f"output/lane_visits_{os.path.basename(args.route_file).replace('_mod.rou.xml', '.pkl')}"
-        with open(visits_file, "wb") as f:
-            pickle.dump(lane_visits, f)
-        print(f"💾 Dados de visitas salvos em {visits_file}")
+        lane_visits = first_run_visits(args, graph)
 
         base_name = os.path.basename(args.route_file).replace('_mod.rou.xml', '')
         num_stations = args.er
-        if args.method == "random":
-            selected_lanes = select_random_stations(lane_visits, num_stations)
-        elif args.method == "greedy":
-            selected_lanes = select_greedy_stations(lane_visits, num_stations)
-        elif args.method == "grasp":
-            selected_lanes = select_grasp_stations(lane_visits, num_stations, graph, args.net_file)
+        selected_lanes = select_stations(args.method, lane_visits, num_stations, graph, args)
 
         base_filename = f"{args.method}_{base_name}_er{args.er}"
         add_file = generate_parking_areas_file(selected_lanes, args.out_dir, base_filename, args.capacity, net_file=args.net_file)
         print(f"📄 Arquivo .add.xml gerado: {add_file}")
 
+    elif args.mode == "first_run_multi":
+        ers = args.ers or [args.er]
+        print(f"🚀 FIRST RUN (multi): Rota={args.route_file}, Métodos={args.methods}, ERs={ers}")
+        lane_visits = first_run_visits(args, graph)
+        if args.visits_only:
+            # (S21) Seleção fica para outras invocações, que leem o cache do first_run
+            print("📊 --visits_only: visitas gravadas, nenhuma seleção feita.")
+            args.methods = []
+
+        base_name = os.path.basename(args.route_file).replace('_mod.rou.xml', '')
+        for method in args.methods:
+            for er in ers:
+                # Mesma sequência aleatória de uma invocação isolada com --method/--er
+                random.seed(args.seed)
+                selected_lanes = select_stations(method, lane_visits, er, graph, args)
+                base_filename = f"{method}_{base_name}_er{er}"
+                add_file = generate_parking_areas_file(selected_lanes, args.out_dir, base_filename, args.capacity, net_file=args.net_file)
+                print(f"📄 Arquivo .add.xml gerado: {add_file}")
+
     elif args.mode == "second_run":
         if not args.add_file:
             print("❌ Erro: .add.xml é obrigatório para a SECOND RUN.")
             sys.exit(1)
 
         print(f"🚀 SECOND RUN: Rota={args.route_file}, Método={args.method}")
-        results = run_simulation(args, graph, add_file=args.add_file)
+        warm = load_or_save_warm_start(args) if args.warm_start else None
+        results = run_simulation(args, graph, add_file=args.add_file, warm=warm)
         print(f"✅ SECOND RUN concluída!")
 
         ve_percent_str = re.search(r"rotas_(\d+)", args.route_file)
         ve_percent = int(ve_percent_str.group(1)) if ve_percent_str else 0
 
+        metrics = {}
+        if not args.no_ingest:
+            with _profiler.phase("ingest"):
+                metrics = ingest_outputs(args, warm)
+
+        if warm and args.warm_start_check:
+            diverged = check_warm_start(args, graph, results, metrics)
+            if diverged:
+                print("❌ Warm start divergiu da execução a frio:")
+                for key, warm_value, cold_value in diverged:
+                    print(f"   {key}: warm={warm_value} frio={cold_value}")
+                sys.exit(1)
+            print("✅ Warm start confere com a execução a frio.")
+
         output_csv_file = os.path.join(args.out_dir, "resultados_execucoes.csv")
         row = {
             "heuristic": args.method, "ER": args.er, "VE": ve_percent, "TR": args.tr_min,
             "rep": args.rep, "T_espera": round(results["T_espera"], 2),
             "D_estacao": round(results["D_estacao"], 3), "N_teleport": results["N_teleport"],
             "T_exec": round(results["T_exec"], 3),
-            "route_file": os.path.basename(args.route_file), "add_file": os.path.basename(args.add_file)
+            **{k: round(v, 3) if isinstance(v, float) else v for k, v in metrics.items()},
+            "route_file": os.path.basename(args.route_file), "add_file": os.path.basename(args.add_file),
+            "station_choice": args.station_choice
         }
-        file_exists = os.path.isfile(output_csv_file)
-        with open(output_csv_file, "a", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=row.keys())
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(row)
-        print(f"📈 Resultados salvos em {output_csv_file}")
+        # (S23) Várias execuções do agendador gravam no mesmo banco; o CSV é reexportado
+        # inteiro a cada linha nova, então nunca fica com linhas intercaladas
+        with open_results_store(args) as store:
+            store.add_run(row, params={"seed": args.seed, "backend": args.backend,
+                                       "graph_backend": args.graph_backend, "step_length": args.step_length,
+                                       "warm_start": warm["time"] if warm else None})
+            run_id = store.flush()[0]
+            store.export_csv(output_csv_file)
+        print(f"📈 Resultados salvos em {store.path} e {output_csv_file}")
+
+    if _profiler.enabled:
+        save_profile(args, run_id)
+
+if __name__ == "__main__":
+    main()
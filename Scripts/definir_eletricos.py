@@ -1,84 +1,193 @@
 import xml.etree.ElementTree as ET
+import argparse
 import random
 
+# Geração das variantes de rotas (porcentagem de VEs × réplica) em streaming.
+#
+# O arquivo de rotas é percorrido com iterparse, sem montar o DOM inteiro: uma
+# passada leve conta os veículos (e vê quais vTypes já existem), os sorteios de
+# TODAS as variantes são feitos como conjuntos de índices, e uma segunda passada
+# escreve todas as variantes ao mesmo tempo. Cada veículo é serializado só duas
+# vezes (elétrico / normal), qualquer que seja o número de variantes; a memória
+# por variante é uma máscara de 1 byte por veículo.
+
+PORCENTAGENS = [0.05, 0.10, 0.20]
+REPLICAS = 10
+TYPE_PLACEHOLDER = "__tipo_definir_eletricos__"
+
+def vtype_normal():
+    return ET.Element("vType", attrib={
+        "id": "veiculo_normal",
+        "length": "5",
+        "accel": "2.6",
+        "decel": "5.0",
+        "tau": "1.5",
+        "sigma": "0.5",
+        "maxSpeed": "60",
+        "color": "1,1,0"
+    })
+
+def vtype_eletrico():
+    vtype = ET.Element("vType", attrib={
+        "id": "electric_vehicle",
+        "length": "4.5",
+        "minGap": "2.50",
+        "maxSpeed": "60",
+        "color": "white",
+        "accel": "2.6",
+        "decel": "5.0",
+        "tau": "1.5",
+        "sigma": "0.5",
+        "emissionClass": "Energy/unknown"
+    })
+    # Parâmetros do soulEV65
+    for key, value in [
+        ("has.battery.device", "true"),
+        ("device.battery.capacity", "64000"),
+        ("airDragCoefficient", "0.35"),
+        ("constantPowerIntake", "100"),
+        ("frontSurfaceArea", "2.6"),
+        ("internalMomentOfInertia", "40"),  # Substituído por rotatingMass
+        ("maximumPower", "150000"),
+        ("propulsionEfficiency", ".98"),
+        ("radialDragCoefficient", "0.1"),
+        ("recuperationEfficiency", ".96"),  # Valor alto, ajuste se necessário
+        ("rollDragCoefficient", "0.01"),
+        ("stoppingThreshold", "0.1"),
+        ("mass", "1830"),
+    ]:
+        ET.SubElement(vtype, "param", attrib={"key": key, "value": value})
+    return vtype
+
+DEFAULT_VTYPES = {"veiculo_normal": vtype_normal, "electric_vehicle": vtype_eletrico}
+
+def _top_level(input_file, events=("start", "end")):
+    """
+    Percorre os filhos diretos da raiz com iterparse, liberando cada um depois
+    de usado. Gera ("root", raiz, nsmap) uma vez e depois ("child", elem, None).
+    """
+    root = None
+    depth = 0
+    nsmap = []
+    for event, item in ET.iterparse(input_file, events=events + ("start-ns",)):
+        if event == "start-ns":
+            nsmap.append(item)
+            continue
+        if event == "start":
+            if root is None:
+                root = item
+                yield "root", root, nsmap
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            yield "child", item, None
+            root.clear()
+
+def scan_routes(input_file):
+    """Primeira passada: número de veículos e ids de vType já definidos."""
+    num_vehicles = 0
+    vtypes = set()
+    for kind, elem, _ in _top_level(input_file):
+        if kind != "child":
+            continue
+        if elem.tag == "vehicle":
+            num_vehicles += 1
+        elif elem.tag == "vType":
+            vtypes.add(elem.get("id"))
+    return num_vehicles, vtypes
+
+def _qualified(name, prefixes):
+    if name.startswith("{"):
+        uri, local = name[1:].split("}", 1)
+        return f"{prefixes[uri]}:{local}" if prefixes.get(uri) else local
+    return name
+
+def _root_start_tag(root, nsmap):
+    prefixes = {uri: prefix for prefix, uri in nsmap}
+    attrs = [f'xmlns:{p}="{u}"' if p else f'xmlns="{u}"' for p, u in nsmap]
+    attrs += [f'{_qualified(k, prefixes)}="{v}"' for k, v in root.attrib.items()]
+    return f"<{_qualified(root.tag, prefixes)}{''.join(' ' + a for a in attrs)}>".encode()
+
+def _serialize(elem):
+    elem.tail = None
+    return ET.tostring(elem, encoding="unicode").encode()
+
+def gerar_variantes(input_file, variants, rng=random):
+    """
+    Escreve várias variantes do arquivo de rotas numa única passada de escrita.
+    `variants`: lista de (output_file, electric_percentage). Os sorteios seguem a
+    ordem da lista e usam `rng` (por padrão o módulo random), como a versão antiga
+    que chamava definir_eletricos uma vez por variante.
+    """
+    num_vehicles, existing_vtypes = scan_routes(input_file)
+
+    # Sorteio de todas as variantes antes de escrever: máscara por variante
+    masks = []
+    for _, electric_percentage in variants:
+        mask = bytearray(num_vehicles)
+        for i in rng.sample(range(num_vehicles), int(num_vehicles * electric_percentage)):
+            mask[i] = 1
+        masks.append(mask)
+
+    outputs = [open(output_file, "wb") for output_file, _ in variants]
+    try:
+        vehicle = 0
+        for kind, elem, nsmap in _top_level(input_file):
+            if kind == "root":
+                header = b'<?xml version="1.0" encoding="UTF-8"?>\n' + _root_start_tag(elem, nsmap) + b"\n"
+                # Definições de vType na frente, se ainda não existirem
+                for vid, factory in DEFAULT_VTYPES.items():
+                    if vid not in existing_vtypes:
+                        header += b"    " + _serialize(factory()) + b"\n"
+                for out in outputs:
+                    out.write(header)
+                root_end = f"</{elem.tag.split('}')[-1]}>\n".encode()
+                continue
+
+            if elem.tag != "vehicle":
+                chunk = b"    " + _serialize(elem) + b"\n"
+                for out in outputs:
+                    out.write(chunk)
+                continue
+
+            elem.set("type", TYPE_PLACEHOLDER)
+            chunk = b"    " + _serialize(elem) + b"\n"
+            placeholder = TYPE_PLACEHOLDER.encode()
+            as_electric = chunk.replace(placeholder, b"electric_vehicle")
+            as_normal = chunk.replace(placeholder, b"veiculo_normal")
+            for out, mask in zip(outputs, masks):
+                out.write(as_electric if mask[vehicle] else as_normal)
+            vehicle += 1
+
+        for out in outputs:
+            out.write(root_end)
+    finally:
+        for out in outputs:
+            out.close()
+    return num_vehicles
+
 def definir_eletricos(input_file, output_file, electric_percentage):
     """
     Modifica um arquivo de rotas para definir uma porcentagem de viagens como elétricas,
     selecionando-as aleatoriamente.
     """
-    tree = ET.parse(input_file)
-    root = tree.getroot()
-
-    # Adiciona as definições de vType, se não existirem
-    if not root.find('vType[@id="veiculo_normal"]'):
-        vtype_normal = ET.Element("vType", attrib={
-            "id": "veiculo_normal",
-            "length": "5",
-            "accel": "2.6",
-            "decel": "5.0",
-            "tau": "1.5",
-            "sigma": "0.5",
-            "maxSpeed": "60",
-            "color": "1,1,0"
-        })
-        root.insert(0, vtype_normal)
-
-    if not root.find('vType[@id="electric_vehicle"]'):
-        vtype_eletrico = ET.Element("vType", attrib={
-            "id": "electric_vehicle",
-            "length": "4.5", 
-            "minGap": "2.50",
-            "maxSpeed": "60", 
-            "color": "white",
-            "accel": "2.6", 
-            "decel": "5.0",
-            "tau": "1.5" ,
-            "sigma": "0.5", 
-            "emissionClass": "Energy/unknown"
-        })
-        # Parâmetros do soulEV65
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "has.battery.device", "value": "true"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "device.battery.capacity", "value": "64000"})) 
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "airDragCoefficient", "value": "0.35"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "constantPowerIntake", "value": "100"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "frontSurfaceArea", "value": "2.6"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "internalMomentOfInertia", "value": "40"})) # Substituído por rotatingMass
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "maximumPower", "value": "150000"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "propulsionEfficiency", "value": ".98"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "radialDragCoefficient", "value": "0.1"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "recuperationEfficiency", "value": ".96"})) # Valor alto, ajuste se necessário
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "rollDragCoefficient", "value": "0.01"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "stoppingThreshold", "value": "0.1"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "mass", "value": "1830"}))
-        vtype_eletrico.append(ET.Element("param", attrib={"key": "mass", "value": "1830"}))
-        root.insert(1, vtype_eletrico)
-
-    # Coleta todos os veículos
-    all_vehicles = root.findall('vehicle')
-
-    # Calcula o número de veículos elétricos
-    num_vehicles = len(all_vehicles)
-    num_electric = int(num_vehicles * electric_percentage)
-
-    # Seleciona aleatoriamente os veículos para serem elétricos
-    electric_vehicles = random.sample(all_vehicles, num_electric)
-
-    # Define o 'type' dos veículos selecionados como 'electric_vehicle'
-    for vehicle in electric_vehicles:
-        vehicle.set("type", "electric_vehicle")
-
-    # Define os veículos restantes como 'veiculo_normal'
-    for vehicle in all_vehicles:
-        if vehicle not in electric_vehicles:
-            vehicle.set("type", "veiculo_normal")
-
-    tree.write(output_file)
+    gerar_variantes(input_file, [(output_file, electric_percentage)])
 
 if __name__ == "__main__":
-    porcentagens = [0.05, 0.10, 0.20]
-    for i in range(10): #Gera 10 arquivos para cada porcentagem
-        for porcentagem in porcentagens:
-            input_file = "rotas.rou.xml"
-            output_file = f"rotas_{porcentagem * 100:.0f}_{i}_mod.rou.xml"
-            definir_eletricos(input_file, output_file, porcentagem)
-            print(f"Arquivo '{output_file}' gerado com {porcentagem * 100:.0f}% de carros elétricos.")
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="Gera as variantes de rotas com porcentagens de veículos elétricos.")
+    ap.add_argument("--input", default="rotas.rou.xml")
+    ap.add_argument("--porcentagens", nargs="+", type=float, default=PORCENTAGENS)
+    ap.add_argument("--replicas", type=int, default=REPLICAS, help="Arquivos gerados por porcentagem")
+    ap.add_argument("--seed", type=int, default=None, help="Seed dos sorteios (padrão: aleatória)")
+    args = ap.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    # Mesma ordem de sorteio do laço antigo: réplica por fora, porcentagem por dentro
+    variants = [(f"rotas_{porcentagem * 100:.0f}_{i}_mod.rou.xml", porcentagem)
+                for i in range(args.replicas) for porcentagem in args.porcentagens]
+    gerar_variantes(args.input, variants)
+    for output_file, porcentagem in variants:
+        print(f"Arquivo '{output_file}' gerado com {porcentagem * 100:.0f}% de carros elétricos.")
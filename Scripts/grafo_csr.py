@@ -0,0 +1,106 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# Backend de grafo em CSR para as consultas de caminho mínimo.
+#
+# Nós e arcos viram inteiros (posições do índice compilado da rede) e as
+# distâncias saem de scipy.sparse.csgraph.dijkstra, em C, em vez do
+# nx.shortest_path_length em Python puro. Os arcos e pesos são exatamente os do
+# nx.DiGraph montado por create_graph_from_net.
+
+class CSRGraph:
+    """
+    Grafo ponderado da rede em CSR. Aceita ids de nós (strings) como o networkx,
+    mas responde consultas de uma origem, de várias origens e em lote.
+    """
+
+    is_csr = True
+
+    def __init__(self, index):
+        self.index = index
+        self.node_ids = index.node_ids
+        self._node_pos = {n: i for i, n in enumerate(self.node_ids)}
+        n = len(self.node_ids)
+        src = np.asarray(index.array("graph_src"))
+        dst = np.asarray(index.array("graph_dst"))
+        weight = np.asarray(index.array("graph_weight"))
+        self.matrix = csr_matrix((weight, (src, dst)), shape=(n, n))
+        self._reverse = None
+        self._in_graph = np.zeros(n, dtype=bool)
+        self._in_graph[src] = True
+        self._in_graph[dst] = True
+
+    @property
+    def reverse_matrix(self):
+        if self._reverse is None:
+            self._reverse = self.matrix.T.tocsr()
+        return self._reverse
+
+    def node_index(self, node):
+        i = self._node_pos.get(node, -1)
+        if i < 0 or not self._in_graph[i]:
+            return -1
+        return i
+
+    def has_node(self, node):
+        return self.node_index(node) >= 0
+
+    __contains__ = has_node
+
+    def number_of_nodes(self):
+        return int(self._in_graph.sum())
+
+    def number_of_edges(self):
+        return self.matrix.nnz
+
+    def lengths_from(self, sources, cutoff=None, reverse=False):
+        """
+        Distâncias (len(sources) × n_nós) a partir de cada índice de nó em `sources`.
+        Com `reverse=True`, devolve a distância de cada nó ATÉ a origem.
+        Pares além de `cutoff` ficam com inf.
+        """
+        sources = np.asarray(sources, dtype=np.intp)
+        if not sources.size:
+            return np.empty((0, len(self.node_ids)))
+        graph = self.reverse_matrix if reverse else self.matrix
+        return dijkstra(graph, directed=True, indices=sources,
+                        limit=np.inf if cutoff is None else cutoff)
+
+    def lengths_from_any(self, sources, cutoff=None, reverse=False):
+        """Distância de cada nó à origem mais próxima entre `sources` (multi-origem)."""
+        sources = np.asarray(sources, dtype=np.intp)
+        if not sources.size:
+            return np.full(len(self.node_ids), np.inf)
+        graph = self.reverse_matrix if reverse else self.matrix
+        return dijkstra(graph, directed=True, indices=sources, min_only=True,
+                        limit=np.inf if cutoff is None else cutoff)
+
+    def distance(self, source, target):
+        """Distância entre dois ids de nó (inf se não houver caminho ou nó)."""
+        s = self.node_index(source)
+        t = self.node_index(target)
+        if s < 0 or t < 0:
+            return float("inf")
+        return float(self.lengths_from([s])[0, t])
+
+    def distances(self, pairs):
+        """
+        Consultas em lote: `pairs` é uma lista de (origem, destino) em ids de nó.
+        Agrupa por origem, então cada origem distinta roda um único Dijkstra.
+        """
+        out = np.full(len(pairs), np.inf)
+        by_source = {}
+        for k, (source, target) in enumerate(pairs):
+            s = self.node_index(source)
+            t = self.node_index(target)
+            if s >= 0 and t >= 0:
+                by_source.setdefault(s, []).append((k, t))
+        if not by_source:
+            return out
+        sources = list(by_source)
+        lengths = self.lengths_from(sources)
+        for row, s in enumerate(sources):
+            for k, t in by_source[s]:
+                out[k] = lengths[row, t]
+        return out
@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Motor GRASP para a escolha de estações.
+#
+# Cada iteração tem duas fases:
+#   1. construção gulosa-aleatória com lista restrita de candidatos (RCL) por alpha;
+#   2. busca local por trocas (1-opt: sai uma estação, entra um candidato),
+#      avaliada de forma incremental (delta de visitas), sem re-somar a solução.
+# A restrição é a mesma do GRASP original: duas estações não podem ficar a menos
+# do raio de proximidade uma da outra (em qualquer sentido na rede).
+# As iterações podem ser distribuídas num pool de processos; cada iteração usa
+# uma seed derivada da seed base e do seu número, então o resultado não depende
+# do número de workers (só do orçamento de iterações).
+
+SEED_STRIDE = 1000003
+
+def iteration_seed(base_seed, iteration):
+    return base_seed * SEED_STRIDE + iteration
+
+def construct(visits, conflict, num_stations, alpha, rng):
+    """
+    Fase de construção. `conflict[i, j]` indica que i e j não podem coexistir
+    (a diagonal é True). Devolve (índices escolhidos, contagem de bloqueios).
+    """
+    n = len(visits)
+    blocked = np.zeros(n, dtype=np.int32)
+    selected = []
+    while len(selected) < num_stations:
+        cand = np.flatnonzero(blocked == 0)
+        if not cand.size:
+            break
+        values = visits[cand]
+        vmax, vmin = values.max(), values.min()
+        rcl = cand[values >= vmax - alpha * (vmax - vmin)]
+        k = int(rcl[rng.randrange(len(rcl))])
+        selected.append(k)
+        blocked += conflict[k]
+    return selected, blocked
+
+def local_search(visits, conflict, num_stations, selected, blocked):
+    """
+    Busca local de melhor melhoria. Movimentos:
+      - add: entra um candidato livre enquanto a solução tiver menos de num_stations;
+      - swap: sai s, entra j, quando só s bloqueia j e visits[j] > visits[s].
+    Devolve (selecionados, score).
+    """
+    selected = list(selected)
+    in_solution = np.zeros(len(visits), dtype=bool)
+    in_solution[selected] = True
+    score = float(visits[selected].sum()) if selected else 0.0
+
+    while True:
+        if len(selected) < num_stations:
+            free = np.flatnonzero((blocked == 0) & ~in_solution)
+            if free.size:
+                j = int(free[np.argmax(visits[free])])
+                selected.append(j)
+                in_solution[j] = True
+                blocked += conflict[j]
+                score += visits[j]
+                continue
+
+        best_delta, best_move = 0.0, None
+        for pos, s in enumerate(selected):
+            feasible = np.flatnonzero(((blocked - conflict[s]) == 0) & ~in_solution)
+            if not feasible.size:
+                continue
+            j = int(feasible[np.argmax(visits[feasible])])
+            delta = visits[j] - visits[s]
+            if delta > best_delta:
+                best_delta, best_move = delta, (pos, s, j)
+        if best_move is None:
+            return selected, score
+
+        pos, s, j = best_move
+        selected[pos] = j
+        in_solution[s] = False
+        in_solution[j] = True
+        blocked -= conflict[s]
+        blocked += conflict[j]
+        score += best_delta
+
+def run_iteration(visits, conflict, num_stations, alpha, seed):
+    rng = random.Random(seed)
+    selected, blocked = construct(visits, conflict, num_stations, alpha, rng)
+    return local_search(visits, conflict, num_stations, selected, blocked)
+
+# Estado dos workers do pool: recebem os arrays uma vez, no initializer.
+_worker_args = None
+
+def _init_worker(visits, conflict, num_stations, alpha):
+    global _worker_args
+    _worker_args = (visits, conflict, num_stations, alpha)
+
+def _worker_iteration(iteration, seed):
+    selected, score = run_iteration(*_worker_args, seed)
+    return iteration, selected, score
+
+def grasp(visits, proximity, num_stations, alpha=0.3, iterations=10, time_limit=None,
+          workers=1, base_seed=0):
+    """
+    Executa o GRASP e devolve (índices selecionados, score, iterações executadas).
+
+    `visits`: array com o peso (visitas) de cada candidato.
+    `proximity`: matriz booleana n×n (prox[i, j]: j perto demais de i).
+    `iterations`: orçamento de iterações (0/None = sem limite, só com `time_limit`);
+    `time_limit`: orçamento em segundos (opcional). Ao menos uma iteração sempre roda.
+    `workers`: processos do pool (1 = tudo no processo atual).
+    """
+    if not iterations or iterations < 1:
+        if not time_limit:
+            raise ValueError("GRASP precisa de iterations >= 1 ou de um time_limit")
+        iterations = sys.maxsize
+    visits = np.asarray(visits, dtype=np.float64)
+    conflict = (proximity | proximity.T).astype(np.int32)
+    np.fill_diagonal(conflict, 1)
+    deadline = time.time() + time_limit if time_limit else None
+
+    best = (-1.0, None, [])  # (score, iteração, selecionados)
+    done = 0
+
+    def consider(iteration, selected, score):
+        nonlocal best
+        # Empate: vence a iteração de menor número (independe da ordem de chegada)
+        if score > best[0] or (score == best[0] and iteration < best[1]):
+            best = (score, iteration, selected)
+
+    if workers <= 1:
+        for it in range(iterations):
+            if done and deadline and time.time() > deadline:
+                break
+            selected, score = run_iteration(visits, conflict, num_stations, alpha,
+                                            iteration_seed(base_seed, it))
+            consider(it, selected, score)
+            done += 1
+    else:
+        workers = max(1, min(workers, iterations, os.cpu_count() or 1))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(visits, conflict, num_stations, alpha)) as pool:
+            # Lotes do tamanho do pool: permite parar no orçamento de tempo entre lotes
+            it = 0
+            while it < iterations:
+                if done and deadline and time.time() > deadline:
+                    break
+                batch = range(it, min(it + workers, iterations))
+                futures = [pool.submit(_worker_iteration, i, iteration_seed(base_seed, i)) for i in batch]
+                for fut in futures:
+                    consider(*fut.result())
+                    done += 1
+                it = batch.stop
+
+    return best[2], best[0], done
@@ -0,0 +1,171 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+
+from indice_rede import load_net_index
+
+# Índice geométrico da rede sobre o índice compilado (indice_rede).
+#
+# Todas as lanes viram LineStrings do shapely de uma vez (shapely.linestrings
+# sobre os arrays de shape, sem reparsear o XML) dentro de uma STRtree. As
+# consultas são vetorizadas: lane mais próxima de pontos, lanes num raio e
+# matriz de distâncias entre dois conjuntos de lanes.
+#
+# NodeDistanceBound dá uma cota inferior euclidiana para a distância NA REDE
+# entre nós, usada como pré-filtro antes de qualquer Dijkstra: se até a cota
+# passa do raio, o par não pode estar a menos do raio pela rede.
+
+SHAPELY_2 = int(shapely.__version__.split(".")[0]) >= 2
+
+def shape_distance(shape1, shape2):
+    """Distância mínima entre duas shapes [(x, y), ...] fora do índice (inf com menos de 2 pontos)."""
+    if not shape1 or not shape2 or len(shape1) < 2 or len(shape2) < 2:
+        return float('inf')
+    return float(LineString(shape1).distance(LineString(shape2)))
+
+class LaneGeometryIndex:
+    """LineStrings das lanes (com ao menos 2 pontos) numa STRtree."""
+
+    def __init__(self, index, include_internal=False):
+        ptr = np.asarray(index.array("lane_shape_ptr"))
+        xy = np.asarray(index.array("lane_shape_xy"))
+        counts = np.diff(ptr)
+        all_ids = index.lane_ids
+        keep = counts >= 2
+        if not include_internal:
+            keep &= np.array([not lid.startswith(":") for lid in all_ids], dtype=bool)
+        kept = np.flatnonzero(keep)
+
+        point_lane = np.repeat(np.arange(len(counts)), counts)
+        point_mask = keep[point_lane]
+        # Índices consecutivos 0..n-1 para as lanes mantidas
+        new_pos = np.full(len(counts), -1, dtype=np.intp)
+        new_pos[kept] = np.arange(len(kept))
+        self.geoms = shapely.linestrings(xy[point_mask], indices=new_pos[point_lane[point_mask]]) \
+            if len(kept) else np.empty(0, dtype=object)
+        self.lane_ids = [all_ids[i] for i in kept.tolist()]
+        self._pos = {lid: k for k, lid in enumerate(self.lane_ids)}
+        self.tree = shapely.STRtree(self.geoms)
+
+    def __len__(self):
+        return len(self.lane_ids)
+
+    def positions(self, lanes):
+        return np.fromiter((self._pos.get(lid, -1) for lid in lanes), dtype=np.intp, count=len(lanes))
+
+    def geometry(self, lane_id):
+        k = self._pos.get(lane_id, -1)
+        return self.geoms[k] if k >= 0 else None
+
+    def distance(self, lane1, lane2):
+        """Distância euclidiana entre as lanes (inf se alguma não tiver shape)."""
+        g1, g2 = self.geometry(lane1), self.geometry(lane2)
+        if g1 is None or g2 is None:
+            return float('inf')
+        return float(shapely.distance(g1, g2))
+
+    def pairwise(self, lanes_a, lanes_b=None):
+        """Matriz len(lanes_a) × len(lanes_b) de distâncias euclidianas (inf onde falta shape)."""
+        pa = self.positions(lanes_a)
+        pb = pa if lanes_b is None else self.positions(lanes_b)
+        out = np.full((len(pa), len(pb)), np.inf)
+        ra, rb = np.flatnonzero(pa >= 0), np.flatnonzero(pb >= 0)
+        if ra.size and rb.size:
+            out[np.ix_(ra, rb)] = shapely.distance(self.geoms[pa[ra]][:, None], self.geoms[pb[rb]][None, :])
+        return out
+
+    def nearest(self, points):
+        """Para cada ponto (x, y): (lane mais próxima, distância)."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not len(points) or not len(self):
+            return [None] * len(points), np.full(len(points), np.inf)
+        (src, dst), dist = self.tree.query_nearest(shapely.points(points), return_distance=True, all_matches=False)
+        lanes = [None] * len(points)
+        out = np.full(len(points), np.inf)
+        for i, k, d in zip(src.tolist(), dst.tolist(), dist.tolist()):
+            lanes[i] = self.lane_ids[k]
+            out[i] = d
+        return lanes, out
+
+    def within(self, lanes, radius):
+        """Para cada lane de `lanes`, as lanes do índice a até `radius` (inclusive ela mesma)."""
+        pos = self.positions(lanes)
+        result = [[] for _ in lanes]
+        valid = np.flatnonzero(pos >= 0)
+        if valid.size:
+            src, dst = self.tree.query(self.geoms[pos[valid]], predicate="dwithin", distance=radius)
+            for i, k in zip(valid[src].tolist(), dst.tolist()):
+                result[i].append(self.lane_ids[k])
+        return result
+
+class NodeDistanceBound:
+    """
+    Cota inferior da distância na rede entre dois nós: ratio × distância euclidiana,
+    com ratio = min(peso do arco / distância euclidiana entre as pontas) sobre o grafo.
+    Pela desigualdade triangular, todo caminho mede pelo menos ratio × |xy_u − xy_v|.
+    Se algum nó do grafo não tiver coordenadas, ratio = 0 e nada é podado.
+    """
+
+    def __init__(self, index):
+        xy = self.node_xy = np.asarray(index.array("node_xy"))
+        self.ratio = 0.0
+        src = np.asarray(index.array("graph_src"))
+        dst = np.asarray(index.array("graph_dst"))
+        weight = np.asarray(index.array("graph_weight"))
+        used = np.unique(np.concatenate([src, dst]))
+        if not src.size or np.isnan(xy[used]).any():
+            return
+        d = np.hypot(*(xy[dst] - xy[src]).T)
+        positive = d > 0
+        if positive.any():
+            # Folga relativa para não podar por arredondamento
+            self.ratio = max(0.0, float((weight[positive] / d[positive]).min()) * (1 - 1e-9))
+
+    def candidate_pairs(self, src_nodes, dst_nodes, radius):
+        """
+        Máscara len(src) × len(dst) (posições de nó; −1 = sem nó) dos pares que
+        PODEM estar a menos de `radius` pela rede. Consulta feita numa STRtree
+        dos pontos de destino; sem shapely 2 (ou sem cota), todos os pares passam.
+        """
+        src_nodes = np.asarray(src_nodes, dtype=np.intp)
+        dst_nodes = np.asarray(dst_nodes, dtype=np.intp)
+        mask = np.zeros((len(src_nodes), len(dst_nodes)), dtype=bool)
+        si, di = np.flatnonzero(src_nodes >= 0), np.flatnonzero(dst_nodes >= 0)
+        if not si.size or not di.size:
+            return mask
+        if self.ratio <= 0 or not SHAPELY_2:
+            mask[np.ix_(si, di)] = True
+            return mask
+        tree = shapely.STRtree(shapely.points(self.node_xy[dst_nodes[di]]))
+        a, b = tree.query(shapely.points(self.node_xy[src_nodes[si]]), predicate="dwithin",
+                          distance=radius / self.ratio)
+        mask[si[a], di[b]] = True
+        return mask
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Consultas geométricas sobre as lanes de uma rede SUMO.")
+    ap.add_argument("net_file", nargs="?", default="cologne2.net.xml")
+    ap.add_argument("--lane", help="Lista as lanes a até --radius metros desta lane")
+    ap.add_argument("--point", nargs=2, type=float, metavar=("X", "Y"), help="Lane mais próxima do ponto")
+    ap.add_argument("--radius", type=float, default=100.0)
+    args = ap.parse_args()
+
+    if not os.path.isfile(args.net_file):
+        sys.exit(f"❌ Arquivo de rede não encontrado: {args.net_file}")
+    if not SHAPELY_2:
+        sys.exit("❌ O índice geométrico requer shapely >= 2.0 (pip install -U shapely).")
+    index = load_net_index(args.net_file)
+    geo = LaneGeometryIndex(index)
+    bound = NodeDistanceBound(index)
+    print(f"✅ {len(geo)} lanes na STRtree; cota rede/euclidiana = {bound.ratio:.3f}")
+    if args.point:
+        lanes, dist = geo.nearest([args.point])
+        print(f"   Lane mais próxima de {tuple(args.point)}: {lanes[0]} ({dist[0]:.2f} m)")
+    if args.lane:
+        near = geo.within([args.lane], args.radius)[0]
+        print(f"   {len(near)} lanes a até {args.radius:g} m de {args.lane}: {', '.join(near[:20])}"
+              + (" ..." if len(near) > 20 else ""))
@@ -0,0 +1,353 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import networkx as nx
+
+# Índice compilado da rede SUMO (.net.xml).
+#
+# O .net.xml é lido UMA vez (iterparse, sem montar o DOM inteiro) e gravado como
+# arrays .npy num diretório de cache identificado pelo hash do arquivo de rede.
+# As execuções seguintes (e os workers em paralelo) abrem os arrays com mmap,
+# compartilhando as páginas do SO em vez de cada processo manter a sua árvore XML.
+
+INDEX_VERSION = 3  # v2: coordenadas das junctions (node_xy); v3: velocidade das lanes
+HASH_CHUNK = 1 << 20
+DEFAULT_EDGE_WEIGHT = 1000.0  # peso da edge sem atributo "length" (as do .net.xml do SUMO não têm)
+
+def file_digest(path, cache_dir=None):
+    """
+    SHA-1 do conteúdo de `path`. Se `cache_dir` for informado, memoriza o hash
+    por (tamanho, mtime) para não reler arquivos grandes a cada execução.
+    """
+    st = os.stat(path)
+    memo_file = None
+    if cache_dir:
+        memo_file = os.path.join(cache_dir, f"{os.path.basename(path)}.hash.json")
+        try:
+            with open(memo_file) as f:
+                memo = json.load(f)
+            if memo.get("path") == os.path.abspath(path) and memo.get("size") == st.st_size \
+                    and memo.get("mtime_ns") == st.st_mtime_ns:
+                return memo["sha1"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    if memo_file:
+        _write_json_atomic(memo_file, {
+            "path": os.path.abspath(path), "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns, "sha1": digest
+        })
+    return digest
+
+def _write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _string_array(values):
+    encoded = [v.encode("utf-8") for v in values]
+    width = max((len(v) for v in encoded), default=1) or 1
+    return np.array(encoded, dtype=f"S{width}")
+
+def _decode(array):
+    return [v.decode("utf-8") for v in array.tolist()]
+
+def default_cache_dir(net_file):
+    return os.path.join(os.path.dirname(os.path.abspath(net_file)), ".net_index")
+
+def compile_net_index(net_file, index_dir):
+    """
+    Lê o .net.xml em streaming e grava em `index_dir`:
+      - lanes: id, edge, comprimento, velocidade máxima e shape (ponteiros + coordenadas)
+      - edges: id, nós from/to, peso usado no grafo, flag interna, lanes por edge
+      - grafo ponderado (lista de arcos na ordem de inserção do nx.DiGraph)
+      - coordenadas (x, y) de cada nó do grafo (NaN se a junction não existir)
+    """
+    edge_ids, edge_from, edge_to, edge_weight, edge_internal = [], [], [], [], []
+    edge_lane_ptr = [0]
+    lane_ids, lane_edge, lane_length, lane_speed = [], [], [], []
+    lane_shape_ptr, lane_shape_xy = [0], []
+    node_pos = {}
+    junction_xy = {}
+    # (u, v) -> (peso, edge, reverso). Reproduz o nx.DiGraph: a última escrita vence,
+    # mas a ordem é a da primeira inserção.
+    arcs = {}
+
+    def node(nid):
+        if nid not in node_pos:
+            node_pos[nid] = len(node_pos)
+        return node_pos[nid]
+
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(net_file, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if elem.tag == "junction":
+            junction_xy[elem.attrib.get("id")] = (float(elem.attrib.get("x", "nan")),
+                                                  float(elem.attrib.get("y", "nan")))
+        if elem.tag != "edge":
+            # connections etc. não entram no índice: descarta já
+            root.clear()
+            continue
+        e = len(edge_ids)
+        eid = elem.attrib.get("id")
+        f = elem.attrib.get("from")
+        t = elem.attrib.get("to")
+        internal = elem.attrib.get("function") == "internal"
+        weight = float(elem.attrib.get("length", DEFAULT_EDGE_WEIGHT))
+
+        edge_ids.append(eid)
+        edge_from.append(node(f) if f else -1)
+        edge_to.append(node(t) if t else -1)
+        edge_weight.append(weight)
+        edge_internal.append(internal)
+
+        if f and t:
+            arcs[(node_pos[f], node_pos[t])] = (weight, e, False)
+            if not internal:
+                arcs[(node_pos[t], node_pos[f])] = (weight, e, True)
+
+        for lane in elem.iter("lane"):
+            lane_ids.append(lane.attrib["id"])
+            lane_edge.append(e)
+            lane_length.append(float(lane.attrib.get("length", "0")))
+            lane_speed.append(float(lane.attrib.get("speed", "13.89")))
+            shape_str = lane.attrib.get("shape", "")
+            for point in shape_str.split():
+                x, y = point.split(",")[:2]
+                lane_shape_xy.append((float(x), float(y)))
+            lane_shape_ptr.append(len(lane_shape_xy))
+        edge_lane_ptr.append(len(lane_ids))
+        root.clear()
+
+    arrays = {
+        "node_ids": _string_array(list(node_pos)),
+        "node_xy": np.array([junction_xy.get(nid, (np.nan, np.nan)) for nid in node_pos],
+                            dtype=np.float64).reshape(-1, 2),
+        "edge_ids": _string_array(edge_ids),
+        "edge_from": np.array(edge_from, dtype=np.int32),
+        "edge_to": np.array(edge_to, dtype=np.int32),
+        "edge_weight": np.array(edge_weight, dtype=np.float64),
+        "edge_internal": np.array(edge_internal, dtype=bool),
+        "edge_lane_ptr": np.array(edge_lane_ptr, dtype=np.int64),
+        "lane_ids": _string_array(lane_ids),
+        "lane_edge": np.array(lane_edge, dtype=np.int32),
+        "lane_length": np.array(lane_length, dtype=np.float64),
+        "lane_speed": np.array(lane_speed, dtype=np.float64),
+        "lane_shape_ptr": np.array(lane_shape_ptr, dtype=np.int64),
+        "lane_shape_xy": np.array(lane_shape_xy, dtype=np.float64).reshape(-1, 2),
+        "graph_src": np.array([u for u, _ in arcs], dtype=np.int32),
+        "graph_dst": np.array([v for _, v in arcs], dtype=np.int32),
+        "graph_weight": np.array([a[0] for a in arcs.values()], dtype=np.float64),
+        "graph_edge": np.array([a[1] for a in arcs.values()], dtype=np.int32),
+        "graph_reverse": np.array([a[2] for a in arcs.values()], dtype=bool),
+    }
+
+    os.makedirs(index_dir, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(index_dir, f"{name}.npy"), arr)
+    meta = {
+        "version": INDEX_VERSION,
+        "net_file": os.path.abspath(net_file),
+        "nodes": len(node_pos), "edges": len(edge_ids),
+        "lanes": len(lane_ids), "arcs": len(arcs),
+    }
+    with open(os.path.join(index_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+def load_net_index(net_file, cache_dir=None):
+    """
+    Abre o índice compilado de `net_file`, compilando-o antes se ainda não existir
+    (ou se o .net.xml mudou). A compilação é feita num diretório temporário e
+    renomeada no fim, então workers concorrentes nunca veem um índice pela metade.
+    """
+    cache_dir = cache_dir or default_cache_dir(net_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    digest = file_digest(net_file, cache_dir)
+    index_dir = os.path.join(cache_dir, f"{digest}_v{INDEX_VERSION}")
+
+    if not os.path.isfile(os.path.join(index_dir, "meta.json")):
+        print(f"🧱 Compilando índice da rede {net_file} ...")
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".build_")
+        try:
+            compile_net_index(net_file, tmp_dir)
+            try:
+                os.rename(tmp_dir, index_dir)
+            except OSError:
+                # Outro processo terminou a compilação antes; usa a dele.
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        print(f"💾 Índice da rede salvo em {index_dir}")
+
+    return NetIndex(index_dir, digest)
+
+class NetIndex:
+    """
+    Visão somente-leitura (mmap) de um índice compilado da rede.
+    Os dicionários id -> posição são montados sob demanda na primeira consulta.
+    """
+
+    def __init__(self, index_dir, digest=None):
+        self.index_dir = index_dir
+        self.digest = digest
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        self._arrays = {}
+        self._lane_pos = None
+        self._edge_pos = None
+        self._node_pos = None
+        self._lane_ids = None
+        self._edge_ids = None
+        self._node_ids = None
+
+    def array(self, name):
+        arr = self._arrays.get(name)
+        if arr is None:
+            arr = np.load(os.path.join(self.index_dir, f"{name}.npy"), mmap_mode="r")
+            self._arrays[name] = arr
+        return arr
+
+    # --- Tabelas de ids
+    @property
+    def lane_ids(self):
+        if self._lane_ids is None:
+            self._lane_ids = _decode(self.array("lane_ids"))
+        return self._lane_ids
+
+    @property
+    def edge_ids(self):
+        if self._edge_ids is None:
+            self._edge_ids = _decode(self.array("edge_ids"))
+        return self._edge_ids
+
+    @property
+    def node_ids(self):
+        if self._node_ids is None:
+            self._node_ids = _decode(self.array("node_ids"))
+        return self._node_ids
+
+    def lane_position(self, lane_id):
+        if self._lane_pos is None:
+            self._lane_pos = {lid: i for i, lid in enumerate(self.lane_ids)}
+        return self._lane_pos.get(lane_id, -1)
+
+    def edge_position(self, edge_id):
+        if self._edge_pos is None:
+            self._edge_pos = {eid: i for i, eid in enumerate(self.edge_ids)}
+        return self._edge_pos.get(edge_id, -1)
+
+    def node_position(self, node_id):
+        if self._node_pos is None:
+            self._node_pos = {nid: i for i, nid in enumerate(self.node_ids)}
+        return self._node_pos.get(node_id, -1)
+
+    # --- Consultas pontuais (substituem os ET.parse do controlador)
+    def edge_of_lane(self, lane_id):
+        i = self.lane_position(lane_id)
+        if i < 0:
+            return None
+        return self.edge_ids[int(self.array("lane_edge")[i])]
+
+    def edge_nodes(self, edge_id):
+        e = self.edge_position(edge_id)
+        if e < 0:
+            return None, None
+        f = int(self.array("edge_from")[e])
+        t = int(self.array("edge_to")[e])
+        return (self.node_ids[f] if f >= 0 else None,
+                self.node_ids[t] if t >= 0 else None)
+
+    def lane_length(self, lane_id, default=0.0):
+        i = self.lane_position(lane_id)
+        if i < 0:
+            return default
+        return float(self.array("lane_length")[i])
+
+    def lane_shape(self, lane_id):
+        i = self.lane_position(lane_id)
+        if i < 0:
+            return None
+        ptr = self.array("lane_shape_ptr")
+        xy = self.array("lane_shape_xy")[ptr[i]:ptr[i + 1]]
+        return [tuple(p) for p in xy.tolist()] or None
+
+    def lanes_of_edge(self, edge_id):
+        e = self.edge_position(edge_id)
+        if e < 0:
+            return []
+        ptr = self.array("edge_lane_ptr")
+        return self.lane_ids[ptr[e]:ptr[e + 1]]
+
+    # --- Visões completas
+    def lane_to_edge_dict(self):
+        edge_ids = self.edge_ids
+        return {lid: edge_ids[e] for lid, e in zip(self.lane_ids, self.array("lane_edge").tolist())}
+
+    def edge_nodes_dict(self):
+        nodes = self.node_ids
+        out = {}
+        for eid, f, t in zip(self.edge_ids, self.array("edge_from").tolist(), self.array("edge_to").tolist()):
+            if f >= 0 and t >= 0:
+                out[eid] = (nodes[f], nodes[t])
+        return out
+
+    def lane_length_dict(self):
+        return dict(zip(self.lane_ids, self.array("lane_length").tolist()))
+
+    def graph_edge_ids(self):
+        """Ids das edges da rede que entraram no grafo (têm from e to)."""
+        has_nodes = (np.asarray(self.array("edge_from")) >= 0) & (np.asarray(self.array("edge_to")) >= 0)
+        edge_ids = self.edge_ids
+        return {edge_ids[e] for e in np.flatnonzero(has_nodes).tolist()}
+
+    def to_networkx(self):
+        """Reconstrói o nx.DiGraph equivalente ao antigo create_graph_from_net."""
+        nodes = self.node_ids
+        edge_ids = self.edge_ids
+        graph = nx.DiGraph()
+        graph.add_edges_from(
+            (nodes[u], nodes[v], {"id": f"-{edge_ids[e]}" if rev else edge_ids[e], "weight": w})
+            for u, v, w, e, rev in zip(
+                self.array("graph_src").tolist(), self.array("graph_dst").tolist(),
+                self.array("graph_weight").tolist(), self.array("graph_edge").tolist(),
+                self.array("graph_reverse").tolist()
+            )
+        )
+        return graph
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compila o índice binário de uma rede SUMO (.net.xml).")
+    ap.add_argument("net_file", nargs="?", default="cologne2.net.xml")
+    ap.add_argument("--cache_dir", default=None, help="Diretório do cache (padrão: .net_index ao lado da rede)")
+    args = ap.parse_args()
+
+    if not os.path.isfile(args.net_file):
+        sys.exit(f"❌ Arquivo de rede não encontrado: {args.net_file}")
+    index = load_net_index(args.net_file, args.cache_dir)
+    m = index.meta
+    print(f"✅ Índice pronto: {m['nodes']} nós, {m['edges']} edges, {m['lanes']} lanes, {m['arcs']} arcos → {index.index_dir}")
@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from indice_rede import _string_array
+
+# Ingestão das saídas XML do SUMO (tripinfo, battery-output, chargingstations-output)
+# em arquivos colunares .npz, lendo em streaming (iterparse) com memória limitada.
+#
+#   tripinfo.npz           — uma linha por viagem concluída
+#   battery_vehicles.npz   — agregados por VE (energia, bateria mínima/final, ...)
+#   battery_series_*.npz   — série temporal amostrada a cada --battery_every s,
+#                            gravada em partes de `chunk_rows` linhas; veículos e
+#                            lanes viram códigos inteiros (tabelas em battery_series_dict.npz)
+#   charging_stations.npz / charging_events.npz — totais por estação e recargas
+#
+# Só as tabelas por veículo/estação ficam em memória; o battery-output (que passa
+# de GB com 10k veículos) nunca é carregado inteiro. O diretório da execução é
+# montado num temporário e renomeado no fim, com meta.json com os parâmetros.
+
+INGEST_VERSION = 1
+CHUNK_ROWS = 1_000_000
+TRIPINFO_FLOATS = ("depart", "departDelay", "arrival", "duration", "routeLength",
+                   "waitingTime", "stopTime", "timeLoss")
+BATTERY_SERIES = {"time": np.float32, "vehicle": np.int32, "lane": np.int32,
+                  "capacity": np.float32, "consumed": np.float32, "charged": np.float32,
+                  "speed": np.float32, "x": np.float32, "y": np.float32}
+
+def _top_level(path):
+    """Filhos diretos da raiz, um de cada vez; a raiz é esvaziada depois de cada um."""
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:
+            yield elem
+            root.clear()
+
+def _elements(paths):
+    """_top_level encadeado sobre vários arquivos (ex.: prefixo do warm start + continuação)."""
+    for path in ([paths] if isinstance(paths, str) else paths):
+        yield from _top_level(path)
+
+def _existing(paths):
+    paths = [paths] if isinstance(paths, str) else list(paths or ())
+    return [p for p in paths if p and os.path.isfile(p)]
+
+def _float(elem, key, default=np.nan):
+    value = elem.get(key)
+    try:
+        return float(value) if value not in (None, "") else default
+    except ValueError:
+        return default
+
+class _Codes(dict):
+    """Dicionário string -> código inteiro (codificação por dicionário das colunas de texto)."""
+
+    def code(self, value):
+        c = self.get(value)
+        if c is None:
+            c = self[value] = len(self)
+        return c
+
+    def table(self):
+        return _string_array(list(self))
+
+class ChunkedColumns:
+    """Acumula linhas por coluna e grava partes `<prefix>_NNNN.npz` a cada `chunk_rows`."""
+
+    def __init__(self, directory, prefix, dtypes, chunk_rows=CHUNK_ROWS):
+        self.directory = directory
+        self.prefix = prefix
+        self.dtypes = dtypes
+        self.chunk_rows = chunk_rows
+        self.columns = {name: [] for name in dtypes}
+        self.parts = 0
+        self.rows = 0
+
+    def append(self, **values):
+        for name, column in self.columns.items():
+            column.append(values[name])
+        if len(column) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        n = len(next(iter(self.columns.values())))
+        if not n:
+            return
+        arrays = {name: np.asarray(col, dtype=self.dtypes[name]) for name, col in self.columns.items()}
+        np.savez(os.path.join(self.directory, f"{self.prefix}_{self.parts:04d}.npz"), **arrays)
+        self.columns = {name: [] for name in self.dtypes}
+        self.parts += 1
+        self.rows += n
+
+def ingest_tripinfo(path):
+    """tripinfo-output (um arquivo ou vários, em sequência) -> colunas por viagem."""
+    ids, vtypes = [], _Codes()
+    cols = {key: [] for key in TRIPINFO_FLOATS}
+    vtype, has_battery, consumed, regenerated, capacity_end = [], [], [], [], []
+    for elem in _elements(path):
+        if elem.tag != "tripinfo":
+            continue
+        ids.append(elem.get("id"))
+        vtype.append(vtypes.code(elem.get("vType", "")))
+        for key in TRIPINFO_FLOATS:
+            cols[key].append(_float(elem, key))
+        battery = elem.find("battery")
+        has_battery.append(battery is not None)
+        consumed.append(_float(battery, "totalEnergyConsumed") if battery is not None else np.nan)
+        regenerated.append(_float(battery, "totalEnergyRegenerated") if battery is not None else np.nan)
+        capacity_end.append(_float(battery, "actualBatteryCapacity") if battery is not None else np.nan)
+
+    arrays = {key: np.array(values, dtype=np.float64) for key, values in cols.items()}
+    arrays.update({
+        "ids": _string_array(ids), "vtype": np.array(vtype, dtype=np.int32), "vtypes": vtypes.table(),
+        "has_battery": np.array(has_battery, dtype=bool),
+        "energy_consumed": np.array(consumed, dtype=np.float64),
+        "energy_regenerated": np.array(regenerated, dtype=np.float64),
+        "capacity_end": np.array(capacity_end, dtype=np.float64),
+    })
+    return arrays
+
+def ingest_battery(path, out_dir, sample_every=60.0, chunk_rows=CHUNK_ROWS):
+    """
+    battery-output -> agregados por VE (devolvidos) e série amostrada (gravada
+    em partes em `out_dir`). `sample_every` = 0 desliga a série.
+    """
+    vehicles = _Codes()
+    lanes = _Codes()
+    agg = {key: [] for key in ("first_time", "last_time", "samples", "capacity_start", "capacity_end",
+                               "capacity_min", "capacity_max", "total_consumed", "total_regenerated",
+                               "charged", "charged_stopped", "charged_in_transit")}
+    series = ChunkedColumns(out_dir, "battery_series", BATTERY_SERIES, chunk_rows) if sample_every else None
+    next_sample = 0.0
+
+    for step in _elements(path):
+        if step.tag != "timestep":
+            continue
+        now = _float(step, "time", 0.0)
+        sampled = series is not None and now >= next_sample
+        if sampled:
+            next_sample = (now // sample_every + 1) * sample_every
+        for elem in step:
+            v = vehicles.code(elem.get("id"))
+            capacity = _float(elem, "actualBatteryCapacity")
+            charged = _float(elem, "energyCharged", 0.0)
+            if v == len(agg["samples"]):
+                # Primeiro registro do VE
+                for column in agg.values():
+                    column.append(0.0)
+                agg["samples"][v] = 0
+                agg["first_time"][v] = now
+                agg["capacity_start"][v] = agg["capacity_min"][v] = capacity
+                agg["capacity_max"][v] = _float(elem, "maximumBatteryCapacity")
+            agg["last_time"][v] = now
+            agg["samples"][v] += 1
+            agg["capacity_end"][v] = capacity
+            agg["capacity_min"][v] = min(agg["capacity_min"][v], capacity)
+            agg["total_consumed"][v] = _float(elem, "totalEnergyConsumed", 0.0)
+            agg["total_regenerated"][v] = _float(elem, "totalEnergyRegenerated", 0.0)
+            agg["charged"][v] += charged
+            agg["charged_stopped"][v] += _float(elem, "energyChargedStopped", 0.0)
+            agg["charged_in_transit"][v] += _float(elem, "energyChargedInTransit", 0.0)
+            if sampled:
+                series.append(time=now, vehicle=v, lane=lanes.code(elem.get("lane", "")), capacity=capacity,
+                              consumed=agg["total_consumed"][v], charged=agg["charged"][v],
+                              speed=_float(elem, "speed"), x=_float(elem, "x"), y=_float(elem, "y"))
+
+    if series is not None:
+        series.flush()
+        np.savez(os.path.join(out_dir, "battery_series_dict.npz"), vehicles=vehicles.table(), lanes=lanes.table())
+    arrays = {key: np.array(values, dtype=np.int64 if key == "samples" else np.float64)
+              for key, values in agg.items()}
+    arrays["ids"] = vehicles.table()
+    return arrays
+
+def ingest_charging_stations(path):
+    """
+    chargingstations-output -> totais por estação e uma linha por recarga de veículo.
+    Com vários arquivos, os totais da mesma estação são somados.
+    """
+    stations, total, steps = _Codes(), [], []
+    ev_station, ev_vehicle, ev_energy, ev_begin, ev_end = [], [], [], [], []
+    for elem in _elements(path):
+        if elem.tag != "chargingStation":
+            continue
+        s = stations.code(elem.get("id"))
+        if s == len(total):
+            total.append(0.0)
+            steps.append(0)
+        total[s] += _float(elem, "totalEnergyCharged", 0.0)
+        steps[s] += int(_float(elem, "chargingSteps", 0))
+        for vehicle in elem.iter("vehicle"):
+            ev_station.append(s)
+            ev_vehicle.append(vehicle.get("id"))
+            ev_energy.append(_float(vehicle, "totalEnergyChargedIntoVehicle", 0.0))
+            ev_begin.append(_float(vehicle, "chargingBegin"))
+            ev_end.append(_float(vehicle, "chargingEnd"))
+    return (
+        {"ids": stations.table(), "total_energy": np.array(total, dtype=np.float64),
+         "charging_steps": np.array(steps, dtype=np.int64)},
+        {"station": np.array(ev_station, dtype=np.int32), "vehicle": _string_array(ev_vehicle),
+         "energy": np.array(ev_energy, dtype=np.float64), "begin": np.array(ev_begin, dtype=np.float64),
+         "end": np.array(ev_end, dtype=np.float64)},
+    )
+
+def _mean(values):
+    values = values[~np.isnan(values)]
+    return float(values.mean()) if values.size else 0.0
+
+def derived_metrics(trips=None, battery=None, stations=None):
+    """
+    Métricas para a linha de resultados:
+      E_consumo / E_regen (kWh) — energia dos VEs (battery-output; senão tripinfo)
+      E_recarga (kWh)           — energia recarregada (battery-output; senão chargingstations)
+      T_atraso / T_atraso_ve (s) — timeLoss médio de todas as viagens / só dos VEs
+      N_chegadas                 — viagens concluídas
+    """
+    metrics = {}
+    if battery is not None and len(battery["ids"]):
+        metrics["E_consumo"] = float(battery["total_consumed"].sum()) / 1000.0
+        metrics["E_regen"] = float(battery["total_regenerated"].sum()) / 1000.0
+        metrics["E_recarga"] = float(battery["charged"].sum()) / 1000.0
+    elif trips is not None:
+        metrics["E_consumo"] = float(np.nansum(trips["energy_consumed"])) / 1000.0
+        metrics["E_regen"] = float(np.nansum(trips["energy_regenerated"])) / 1000.0
+    if "E_recarga" not in metrics and stations is not None:
+        metrics["E_recarga"] = float(stations["total_energy"].sum()) / 1000.0
+    if trips is not None:
+        metrics["T_atraso"] = _mean(trips["timeLoss"])
+        metrics["T_atraso_ve"] = _mean(trips["timeLoss"][trips["has_battery"]])
+        metrics["N_chegadas"] = int(len(trips["ids"]))
+    return metrics
+
+def ingest_run(outputs, run_dir, params=None, battery_every=60.0, chunk_rows=CHUNK_ROWS):
+    """
+    `outputs`: {"tripinfo": ..., "battery": ..., "chargingstations": ...}; cada valor
+    é um caminho ou uma lista de caminhos lidos em sequência (arquivos ausentes são
+    ignorados). Grava as tabelas em `run_dir` e devolve as métricas.
+    """
+    parent = os.path.dirname(os.path.abspath(run_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".ingest_")
+    try:
+        trips = battery = stations = None
+        path = _existing(outputs.get("tripinfo"))
+        if path:
+            trips = ingest_tripinfo(path)
+            np.savez(os.path.join(tmp_dir, "tripinfo.npz"), **trips)
+        path = _existing(outputs.get("battery"))
+        if path:
+            battery = ingest_battery(path, tmp_dir, battery_every, chunk_rows)
+            np.savez(os.path.join(tmp_dir, "battery_vehicles.npz"), **battery)
+        path = _existing(outputs.get("chargingstations"))
+        if path:
+            stations, events = ingest_charging_stations(path)
+            np.savez(os.path.join(tmp_dir, "charging_stations.npz"), **stations)
+            np.savez(os.path.join(tmp_dir, "charging_events.npz"), **events)
+
+        metrics = derived_metrics(trips, battery, stations)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({"version": INGEST_VERSION, "params": params or {}, "battery_every": battery_every,
+                       "sources": {k: [os.path.abspath(p) for p in _existing(v)] for k, v in outputs.items()},
+                       "metrics": metrics}, f, indent=1)
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.replace(tmp_dir, run_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return metrics
+
+def load_run(run_dir):
+    """{tabela: {coluna: array}} de uma execução ingerida; a série da bateria vem concatenada."""
+    tables = {}
+    parts = []
+    for name in sorted(os.listdir(run_dir)):
+        if not name.endswith(".npz"):
+            continue
+        with np.load(os.path.join(run_dir, name)) as data:
+            arrays = {k: data[k] for k in data.files}
+        if name.startswith("battery_series_") and name != "battery_series_dict.npz":
+            parts.append(arrays)
+        else:
+            tables[name[:-4]] = arrays
+    if parts:
+        tables["battery_series"] = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    return tables
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Converte as saídas XML do SUMO em tabelas colunares (.npz).")
+    ap.add_argument("--tripinfo", nargs="+")
+    ap.add_argument("--battery", nargs="+")
+    ap.add_argument("--chargingstations", nargs="+")
+    ap.add_argument("--out_dir", required=True, help="Diretório da execução ingerida")
+    ap.add_argument("--battery_every", type=float, default=60.0,
+                    help="Amostragem (s) da série de bateria (0 = só agregados por VE)")
+    args = ap.parse_args()
+
+    outputs = {"tripinfo": args.tripinfo, "battery": args.battery, "chargingstations": args.chargingstations}
+    for path in [p for paths in outputs.values() if paths for p in paths]:
+        if not os.path.isfile(path):
+            sys.exit(f"❌ Arquivo não encontrado: {path}")
+    metrics = ingest_run(outputs, args.out_dir, battery_every=args.battery_every)
+    print(f"✅ Saídas ingeridas em {args.out_dir}")
+    for key, value in metrics.items():
+        print(f"   {key}: {value:.3f}" if isinstance(value, float) else f"   {key}: {value}")
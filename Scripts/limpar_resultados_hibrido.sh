@@ -60,6 +60,7 @@ DIRS_TO_CLEAN=(
     "./output_servidor1"
     "./output_servidor2"
     "./output_servidor3"
+    "./output_agendador"
 )
 
 FILES_TO_CLEAN=(
@@ -80,6 +81,8 @@ TEMP_PATTERNS=(
     "./edges_*.txt"
     "./*.log"
     "./tripinfo*.xml"
+    "./battery*.xml"
+    "./chargingstations*.xml"
     "./summary*.xml"
     "./fcd*.xml"
     "./detector*.xml"
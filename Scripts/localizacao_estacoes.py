@@ -0,0 +1,121 @@
+import heapq
+
+import numpy as np
+
+# Seleção de estações como problema de localização, sobre uma matriz
+# candidato × demanda de distâncias na rede (inf = sem caminho). A demanda é
+# cada lane visitada, com peso igual às suas visitas.
+#
+#   celf    — máxima cobertura: escolhe as estações que cobrem (distância
+#             <= raio) o maior peso de demanda. A cobertura é submodular, então
+#             o ganho marginal de um candidato só diminui: o ganho calculado numa
+#             rodada anterior é cota superior, e só o topo do heap é reavaliado
+#             (lazy greedy / CELF).
+#   pmedian — p-medianas: minimiza a soma da distância de cada demanda até a
+#             estação mais próxima, ponderada pelas visitas. Construção gulosa e
+#             busca local por trocas (sai uma estação, entra um candidato); todas
+#             as trocas são avaliadas de uma vez em NumPy a partir da 1ª e da 2ª
+#             estação mais próxima de cada demanda.
+
+def finite_distances(dist, unreachable=None):
+    """Troca inf pela penalidade `unreachable` (padrão: 2× a maior distância finita)."""
+    dist = np.asarray(dist, dtype=np.float64)
+    finite = np.isfinite(dist)
+    if unreachable is None:
+        unreachable = 2.0 * float(dist[finite].max()) if finite.any() else 1.0
+        unreachable = max(unreachable, 1.0)
+    return np.where(finite, dist, unreachable), unreachable
+
+def celf(weights, dist, num_stations, radius):
+    """
+    Máxima cobertura com avaliação preguiçosa. Devolve (índices dos candidatos,
+    peso coberto, avaliações de ganho). Para antes de `num_stations` se nenhum
+    candidato cobre demanda nova. Empates: menor índice de candidato.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    cover = [np.flatnonzero(row <= radius) for row in np.asarray(dist)]
+    covered = np.zeros(len(weights), dtype=bool)
+    # (-ganho, candidato, nº de estações quando o ganho foi calculado)
+    heap = [(-float(weights[c].sum()), k, 0) for k, c in enumerate(cover)]
+    heapq.heapify(heap)
+    selected, total, evaluations = [], 0.0, len(heap)
+    while heap and len(selected) < num_stations:
+        neg_gain, k, stamp = heapq.heappop(heap)
+        if stamp == len(selected):
+            # Ganho atual e ainda no topo: nenhum outro pode ser melhor
+            if neg_gain >= 0:
+                break
+            selected.append(k)
+            total -= neg_gain
+            covered[cover[k]] = True
+            continue
+        c = cover[k]
+        gain = float(weights[c[~covered[c]]].sum())
+        evaluations += 1
+        heapq.heappush(heap, (-gain, k, len(selected)))
+    return selected, total, evaluations
+
+def _nearest_two(dist, selected, unreachable):
+    """Para cada demanda: posição (em `selected`) da estação mais próxima, e as distâncias à 1ª e à 2ª."""
+    ds = dist[selected]
+    cols = np.arange(ds.shape[1])
+    if len(selected) == 1:
+        return np.zeros(ds.shape[1], dtype=np.intp), ds[0], np.full(ds.shape[1], unreachable)
+    two = np.argpartition(ds, 1, axis=0)[:2]
+    first = np.where(ds[two[0], cols] <= ds[two[1], cols], two[0], two[1])
+    second = np.where(first == two[0], two[1], two[0])
+    return first, ds[first, cols], ds[second, cols]
+
+def pmedian_cost(weights, dist, selected):
+    return float(np.asarray(weights) @ dist[selected].min(axis=0)) if len(selected) else float("inf")
+
+def pmedian(weights, dist, num_stations, unreachable=None, max_swaps=None, tol=1e-9):
+    """
+    p-medianas. Devolve (índices dos candidatos, custo ponderado, trocas feitas).
+    `dist` pode ter inf (sem caminho): vira a penalidade `unreachable`.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    dist, unreachable = finite_distances(dist, unreachable)
+    n = dist.shape[0]
+    p = min(num_stations, n)
+    if p <= 0:
+        return [], float("inf"), 0
+
+    # Construção gulosa: entra o candidato que mais reduz o custo
+    selected = []
+    current = np.full(dist.shape[1], unreachable)
+    for _ in range(p):
+        cost = np.minimum(dist, current) @ weights
+        cost[selected] = np.inf
+        k = int(np.argmin(cost))
+        selected.append(k)
+        current = np.minimum(current, dist[k])
+
+    # Trocas de melhor melhoria. Para o candidato c entrando no lugar da estação r:
+    #   delta = Σ_d w·(min(dist_c, d1) − d1) + Σ_{d: mais próxima = r} w·(min(dist_c, d2) − min(dist_c, d1))
+    swaps = 0
+    in_solution = np.zeros(n, dtype=bool)
+    in_solution[selected] = True
+    while max_swaps is None or swaps < max_swaps:
+        nearest, d1, d2 = _nearest_two(dist, selected, unreachable)
+        base = float(weights @ d1)
+        m1 = np.minimum(dist, d1)
+        add = (m1 - d1) @ weights
+        extra = (np.minimum(dist, d2) - m1) * weights
+        order = np.argsort(nearest, kind="stable")
+        counts = np.bincount(nearest, minlength=p)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        by_station = np.zeros((n, p))
+        used = counts > 0
+        if used.any():
+            by_station[:, used] = np.add.reduceat(extra[:, order], starts[used], axis=1)
+        delta = add[:, None] + by_station
+        delta[in_solution] = np.inf
+        c, r = np.unravel_index(int(np.argmin(delta)), delta.shape)
+        if not delta[c, r] < -tol * max(base, 1.0):
+            return selected, base, swaps
+        in_solution[selected[r]] = False
+        in_solution[c] = True
+        selected[r] = int(c)
+        swaps += 1
+    return selected, pmedian_cost(weights, dist, selected), swaps
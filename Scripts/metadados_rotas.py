@@ -0,0 +1,132 @@
+import os
+import sys
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from indice_rede import file_digest, _string_array, _decode
+
+# Metadados compactos de um arquivo de rotas (.rou.xml).
+#
+# O arquivo é lido em streaming (iterparse) e cada veículo vira uma linha em
+# arrays: id, tipo, horário de partida e edges de origem/destino. O resultado é
+# guardado num .npz em .route_meta/, ao lado do arquivo de rotas, identificado
+# pelo hash do conteúdo; as execuções seguintes só abrem o .npz.
+
+META_VERSION = 1
+
+def default_cache_dir(route_file):
+    return os.path.join(os.path.dirname(os.path.abspath(route_file)), ".route_meta")
+
+def _parse_depart(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan  # "triggered", "containerTriggered" etc.
+
+def extract_route_metadata(route_file):
+    """
+    Percorre o arquivo de rotas e devolve um dict de arrays, na ordem do arquivo.
+    Rotas nomeadas (<route id=...> no topo) guardam só a primeira e a última edge.
+    """
+    ids, types, departs, origins, destinations = [], [], [], [], []
+    named_routes = {}
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(route_file, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        if elem.tag == "route":
+            edges = elem.get("edges", "").split()
+            if edges:
+                named_routes[elem.get("id")] = (edges[0], edges[-1])
+        elif elem.tag == "vehicle":
+            route = elem.find("route")
+            if route is not None:
+                edges = route.get("edges", "").split()
+                ends = (edges[0], edges[-1]) if edges else ("", "")
+            else:
+                ends = named_routes.get(elem.get("route"), ("", ""))
+            ids.append(elem.get("id"))
+            types.append(elem.get("type", ""))
+            departs.append(_parse_depart(elem.get("depart")))
+            origins.append(ends[0])
+            destinations.append(ends[1])
+        root.clear()
+
+    return {
+        "ids": _string_array(ids),
+        "types": _string_array(types),
+        "depart": np.array(departs, dtype=np.float64),
+        "from_edge": _string_array(origins),
+        "to_edge": _string_array(destinations),
+    }
+
+def load_route_metadata(route_file, cache_dir=None):
+    """Abre (ou extrai e grava) os metadados de `route_file`."""
+    cache_dir = cache_dir or default_cache_dir(route_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    digest = file_digest(route_file, cache_dir)
+    cache_file = os.path.join(cache_dir, f"{digest}_v{META_VERSION}.npz")
+
+    if not os.path.isfile(cache_file):
+        arrays = extract_route_metadata(route_file)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, cache_file)
+
+    with np.load(cache_file) as data:
+        return RouteMetadata({k: data[k] for k in data.files}, digest)
+
+class RouteMetadata:
+    """Arrays de metadados dos veículos de um arquivo de rotas."""
+
+    def __init__(self, arrays, digest=None):
+        self.arrays = arrays
+        self.digest = digest
+        self.depart = arrays["depart"]
+
+    def __len__(self):
+        return len(self.depart)
+
+    def vehicle_ids(self, mask=None):
+        ids = self.arrays["ids"]
+        return _decode(ids if mask is None else ids[mask])
+
+    def type_mask(self, vtype):
+        return self.arrays["types"] == vtype.encode("utf-8")
+
+    def vehicles_of_type(self, vtype):
+        """(ids, horários de partida) dos veículos de `vtype`, na ordem do arquivo."""
+        mask = self.type_mask(vtype)
+        return self.vehicle_ids(mask), self.depart[mask]
+
+    def origins(self, mask=None):
+        edges = self.arrays["from_edge"]
+        return _decode(edges if mask is None else edges[mask])
+
+    def destinations(self, mask=None):
+        edges = self.arrays["to_edge"]
+        return _decode(edges if mask is None else edges[mask])
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Extrai (e guarda em cache) os metadados de um arquivo de rotas.")
+    ap.add_argument("route_file")
+    ap.add_argument("--cache_dir", default=None, help="Diretório do cache (padrão: .route_meta ao lado das rotas)")
+    args = ap.parse_args()
+
+    if not os.path.isfile(args.route_file):
+        sys.exit(f"❌ Arquivo de rotas não encontrado: {args.route_file}")
+    meta = load_route_metadata(args.route_file, args.cache_dir)
+    types, counts = np.unique(meta.arrays["types"], return_counts=True)
+    print(f"✅ {len(meta)} veículos; tipos: " +
+          ", ".join(f"{t.decode() or '(sem tipo)'}={c}" for t, c in zip(types.tolist(), counts.tolist())))
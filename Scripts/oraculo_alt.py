@@ -0,0 +1,221 @@
+import sys
+import time
+import heapq
+import argparse
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from indice_rede import load_net_index
+
+# Oráculo de tempo de viagem ponto a ponto com A* + landmarks (ALT).
+#
+# Os landmarks e as distâncias de/para cada um são calculados UMA vez com o
+# tempo de viagem em fluxo livre (comprimento / velocidade máxima da lane). Os
+# pesos atuais (tempo de viagem de cada edge no SUMO) são trocados em lote com
+# update_weights e nunca ficam abaixo do fluxo livre, então a heurística
+# continua admissível e consistente sem recalcular os landmarks.
+#
+# O grafo é o mesmo do índice da rede (arcos, sentidos e nós), só que com tempo
+# de viagem no lugar do comprimento.
+
+MIN_WEIGHT = 1e-6  # arcos de peso zero somem da matriz esparsa do scipy
+
+def free_flow_times(index):
+    """Tempo de fluxo livre de cada edge: menor comprimento / velocidade entre as suas lanes."""
+    ptr = np.asarray(index.array("edge_lane_ptr"))
+    length = np.asarray(index.array("lane_length"))
+    speed = np.maximum(np.asarray(index.array("lane_speed")), 0.1)
+    out = np.zeros(len(ptr) - 1)
+    has_lanes = np.diff(ptr) > 0
+    if has_lanes.any():
+        out[has_lanes] = np.minimum.reduceat(length / speed, ptr[:-1][has_lanes])
+    return np.maximum(out, MIN_WEIGHT)
+
+class ALTOracle:
+    """
+    A* com landmarks sobre o grafo da rede, em tempo de viagem (s). Nós são
+    posições do índice (ver node_index); consultas devolvem inf sem caminho.
+    """
+
+    def __init__(self, index, num_landmarks=8, seed=0):
+        self.index = index
+        self.node_ids = index.node_ids
+        self._node_pos = {n: i for i, n in enumerate(self.node_ids)}
+        n = len(self.node_ids)
+        src = np.asarray(index.array("graph_src"), dtype=np.intp)
+        dst = np.asarray(index.array("graph_dst"), dtype=np.intp)
+        arc_edge = np.asarray(index.array("graph_edge"), dtype=np.intp)
+
+        # Arcos ordenados pela origem: vizinhos de u em [indptr[u], indptr[u+1])
+        order = np.argsort(src, kind="stable")
+        self.arc_dst = dst[order]
+        self.arc_edge = arc_edge[order]
+        self.indptr = np.searchsorted(src[order], np.arange(n + 1))
+        self.graph_edges = np.unique(arc_edge)
+        self.free_flow = free_flow_times(index)
+        self.min_weight = self.free_flow[self.arc_edge]
+        self.weight = self.min_weight.copy()
+        self._in_graph = np.zeros(n, dtype=bool)
+        self._in_graph[src] = True
+        self._in_graph[dst] = True
+
+        # Listas Python: o laço do A* indexa elemento a elemento
+        self._indptr = self.indptr.tolist()
+        self._dst = self.arc_dst.tolist()
+        self._w = self.weight.tolist()
+        self._potentials = {}
+
+        self.landmarks, self.d_from, self.d_to = self._select_landmarks(num_landmarks, seed)
+        self.queries = 0
+        self.settled = 0
+        self.updates = 0
+
+    def _select_landmarks(self, k, seed):
+        """
+        Seleção "farthest": cada landmark novo é o nó mais distante (ida + volta,
+        fluxo livre) dos já escolhidos; o primeiro parte de um nó sorteado.
+        """
+        n = len(self.node_ids)
+        nodes = np.flatnonzero(self._in_graph)
+        if not nodes.size or k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty((0, n)), np.empty((0, n))
+        forward = csr_matrix((self.min_weight, self.arc_dst, self.indptr), shape=(n, n))
+        reverse = forward.T.tocsr()
+
+        def farthest(dist):
+            dist = np.where(np.isfinite(dist), dist, -1.0)[nodes]
+            return int(nodes[np.argmax(dist)])
+
+        rng = np.random.default_rng(seed)
+        start = int(rng.choice(nodes))
+        landmarks = [farthest(dijkstra(forward, indices=start) + dijkstra(reverse, indices=start))]
+        d_from = [dijkstra(forward, indices=landmarks[0])]
+        d_to = [dijkstra(reverse, indices=landmarks[0])]
+        while len(landmarks) < min(k, nodes.size):
+            spread = np.min(np.array(d_from) + np.array(d_to), axis=0)
+            spread[landmarks] = -1.0
+            candidate = farthest(spread)
+            if candidate in landmarks:
+                break
+            landmarks.append(candidate)
+            d_from.append(dijkstra(forward, indices=candidate))
+            d_to.append(dijkstra(reverse, indices=candidate))
+        return np.array(landmarks, dtype=np.intp), np.array(d_from), np.array(d_to)
+
+    def node_index(self, node):
+        i = self._node_pos.get(node, -1)
+        if i < 0 or not self._in_graph[i]:
+            return -1
+        return i
+
+    def update_weights(self, edge_times):
+        """
+        Troca os pesos em lote. `edge_times`: tempo atual de cada edge do índice
+        (NaN = desconhecido). Fica sempre >= fluxo livre, o que mantém a
+        heurística admissível.
+        """
+        edge_times = np.nan_to_num(np.asarray(edge_times, dtype=np.float64), nan=0.0)
+        self.weight = np.maximum(edge_times[self.arc_edge], self.min_weight)
+        self._w = self.weight.tolist()
+        self.updates += 1
+
+    def potential(self, target):
+        """Cota inferior de tempo de cada nó até `target` (lista, cacheada por alvo)."""
+        h = self._potentials.get(target)
+        if h is None:
+            with np.errstate(invalid="ignore"):
+                h = np.maximum(self.d_from[:, [target]] - self.d_from, self.d_to - self.d_to[:, [target]])
+            h = np.where(np.isnan(h), 0.0, h).max(axis=0, initial=0.0)
+            h = self._potentials[target] = h.tolist()
+        return h
+
+    def query(self, source, target, bound=float("inf")):
+        """Tempo de viagem atual de `source` a `target`; inf se passar de `bound` ou não houver caminho."""
+        self.queries += 1
+        h = self.potential(target)
+        if h[source] > bound:
+            return float("inf")
+        indptr, dst, w = self._indptr, self._dst, self._w
+        dist = {source: 0.0}
+        done = set()
+        heap = [(h[source], source)]
+        found = float("inf")
+        while heap:
+            f, u = heapq.heappop(heap)
+            if u == target:
+                found = dist[u]
+                break
+            if f > bound:
+                break
+            if u in done:
+                continue
+            done.add(u)
+            du = dist[u]
+            for k in range(indptr[u], indptr[u + 1]):
+                v = dst[k]
+                nd = du + w[k]
+                if nd < dist.get(v, float("inf")) and h[v] != float("inf"):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd + h[v], v))
+        self.settled += len(done)
+        return found
+
+    def nearest(self, source, targets, extra=None):
+        """
+        Alvo de menor tempo + `extra[k]` (custo fixo por alvo, ex.: espera na
+        estação). Os alvos são visitados pela cota inferior e a busca para quando
+        a cota já não bate o melhor custo. Devolve (k, custo) ou (None, inf).
+        """
+        extra = np.zeros(len(targets)) if extra is None else np.asarray(extra, dtype=np.float64)
+        lower = np.array([self.potential(t)[source] if t >= 0 else np.inf for t in targets]) + extra
+        best, best_k = float("inf"), None
+        for k in np.argsort(lower, kind="stable").tolist():
+            if not lower[k] < best:
+                break
+            cost = self.query(source, targets[k], bound=best - extra[k]) + extra[k]
+            if cost < best:
+                best, best_k = cost, k
+        return best_k, best
+
+    def stats(self):
+        return {"landmarks": len(self.landmarks), "queries": self.queries,
+                "settled": self.settled, "updates": self.updates}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Confere o oráculo ALT contra Dijkstra e mede a latência das consultas.")
+    ap.add_argument("net_file", nargs="?", default="cologne2.net.xml")
+    ap.add_argument("--landmarks", type=int, default=8)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--congestion", type=float, default=3.0,
+                    help="Fator máximo sorteado sobre o fluxo livre para simular congestionamento")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    index = load_net_index(args.net_file)
+    t0 = time.perf_counter()
+    oracle = ALTOracle(index, args.landmarks, args.seed)
+    print(f"✅ {len(oracle.landmarks)} landmarks em {time.perf_counter() - t0:.2f}s")
+
+    rng = np.random.default_rng(args.seed)
+    times = oracle.free_flow * rng.uniform(1.0, args.congestion, len(oracle.free_flow))
+    oracle.update_weights(times)
+    n = len(oracle.node_ids)
+    live = csr_matrix((oracle.weight, oracle.arc_dst, oracle.indptr), shape=(n, n))
+    nodes = np.flatnonzero(oracle._in_graph)
+    if not nodes.size:
+        sys.exit("❌ Grafo vazio.")
+    pairs = rng.choice(nodes, size=(args.queries, 2))
+
+    worst, elapsed = 0.0, 0.0
+    for s, t in pairs.tolist():
+        t0 = time.perf_counter()
+        got = oracle.query(s, t)
+        elapsed += time.perf_counter() - t0
+        want = dijkstra(live, indices=s)[t]
+        if got != want:
+            worst = max(worst, abs(got - want) if np.isfinite(got) and np.isfinite(want) else np.inf)
+    print(f"   Maior erro contra Dijkstra: {worst:.3g}s")
+    print(f"   {args.queries} consultas: {elapsed / args.queries * 1000:.2f} ms e "
+          f"{oracle.settled / max(oracle.queries, 1):.1f} nós fechados (de {nodes.size}) por consulta")
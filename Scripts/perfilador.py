@@ -0,0 +1,248 @@
+import os
+import json
+import math
+import time
+import contextlib
+from collections import Counter
+
+# Instrumentação opcional do controlador.
+#
+# Três modos (--profile):
+#   off    — NullProfiler: tudo vira no-op, custo praticamente zero;
+#   full   — cronometra cada fase de todo passo, conta cada chamada TraCI por
+#            tipo (proxy no módulo traci/libsumo) e monta histogramas por passo;
+#   sample — só cronometra 1 a cada N passos (--profile_every) e extrapola os
+#            totais; não instala o proxy, então serve para varreduras em produção.
+# O perfil sai em JSON (completo); o controlador grava o resumo no banco de
+# resultados, de onde sai o perfil_execucoes.csv.
+
+PROFILE_MODES = ("off", "full", "sample")
+TRACI_DOMAINS = ("vehicle", "simulation", "parkingarea", "lane", "edge", "route",
+                 "vehicletype", "chargingstation", "junction", "person", "poi", "polygon")
+TRACI_FUNCTIONS = ("simulationStep", "start", "close", "load")
+
+class Histogram:
+    """Histograma em baldes log2 (limite superior de cada balde em segundos)."""
+
+    def __init__(self, smallest=1e-6):
+        self.smallest = smallest
+        self.counts = Counter()
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        bucket = 0 if value <= self.smallest else math.ceil(math.log2(value / self.smallest))
+        self.counts[bucket] += 1
+        self.n += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Limite superior do balde que contém o quantil q (aproximado)."""
+        if not self.n:
+            return 0.0
+        target = q * self.n
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return self.smallest * 2 ** bucket
+        return self.max
+
+    def to_dict(self):
+        return {
+            "n": self.n, "total": self.total, "max": self.max,
+            "mean": self.total / self.n if self.n else 0.0,
+            "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+            "buckets": {f"<={self.smallest * 2 ** b:.6g}": c for b, c in sorted(self.counts.items())},
+        }
+
+class _CountingDomain:
+    """Proxy de um domínio TraCI (traci.vehicle etc.): conta as chamadas por método."""
+
+    def __init__(self, name, domain, calls):
+        self._name = name
+        self._domain = domain
+        self._calls = calls
+        self._wrapped = {}
+
+    def __getattr__(self, attr):
+        fn = self._wrapped.get(attr)
+        if fn is None:
+            target = getattr(self._domain, attr)
+            if not callable(target):
+                return target
+            key = f"{self._name}.{attr}"
+            calls = self._calls
+
+            def fn(*args, **kwargs):
+                calls[key] += 1
+                return target(*args, **kwargs)
+            self._wrapped[attr] = fn
+        return fn
+
+class _CountingBackend:
+    """Proxy do módulo traci/libsumo; exceções, constantes etc. passam direto."""
+
+    def __init__(self, backend, calls):
+        self._backend = backend
+        self._domains = {}
+        self._calls = calls
+
+    def __getattr__(self, attr):
+        if attr in TRACI_DOMAINS:
+            domain = self._domains.get(attr)
+            if domain is None:
+                domain = self._domains[attr] = _CountingDomain(attr, getattr(self._backend, attr), self._calls)
+            return domain
+        target = getattr(self._backend, attr)
+        if attr in TRACI_FUNCTIONS:
+            calls = self._calls
+
+            def fn(*args, **kwargs):
+                calls[attr] += 1
+                return target(*args, **kwargs)
+            return fn
+        return target
+
+class NullProfiler:
+    """Perfilador desligado: mesma interface, nenhuma medição."""
+
+    enabled = False
+    _null = contextlib.nullcontext()
+
+    def instrument(self, backend):
+        return backend
+
+    def begin_step(self):
+        pass
+
+    def end_step(self):
+        pass
+
+    def phase(self, name):
+        return self._null
+
+    def add_time(self, name, seconds):
+        pass
+
+    def cache(self, name, hit, count=1):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+class Profiler(NullProfiler):
+    """
+    Fases do laço (`with profiler.phase("nome")`), contadores de chamadas TraCI,
+    histogramas por passo e taxas de acerto de cache.
+    """
+
+    enabled = True
+
+    def __init__(self, mode="full", sample_every=100):
+        self.mode = mode
+        self.sample_every = max(1, int(sample_every)) if mode == "sample" else 1
+        self.phases = {}
+        self.calls = Counter()
+        self.counters = Counter()
+        self.caches = {}
+        self.step_hist = Histogram()
+        self.calls_hist = Histogram(smallest=1)
+        self.steps = 0
+        self.sampled_steps = 0
+        self._timing = True
+        self._in_step = False
+        self._step_t0 = None
+        self._step_calls = 0
+        self._t_created = time.perf_counter()
+
+    def instrument(self, backend):
+        """No modo full, devolve um proxy do backend que conta as chamadas."""
+        if self.mode != "full":
+            return backend
+        return _CountingBackend(backend, self.calls)
+
+    def begin_step(self):
+        self._timing = self.steps % self.sample_every == 0
+        self._in_step = True
+        self.steps += 1
+        if self._timing:
+            self.sampled_steps += 1
+            self._step_calls = sum(self.calls.values())
+            self._step_t0 = time.perf_counter()
+
+    def end_step(self):
+        if self._timing and self._step_t0 is not None:
+            self.step_hist.add(time.perf_counter() - self._step_t0)
+            if self.mode == "full":
+                self.calls_hist.add(sum(self.calls.values()) - self._step_calls)
+        # Fora do laço (setup, fechamento, seleção) tudo é cronometrado
+        self._timing = True
+        self._in_step = False
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def phase(self, name):
+        if not self._timing:
+            return self._null
+        return self._timed(name)
+
+    def add_time(self, name, seconds):
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = [0.0, 0, self._in_step]
+        entry[0] += seconds
+        entry[1] += 1
+
+    def cache(self, name, hit, count=1):
+        entry = self.caches.get(name)
+        if entry is None:
+            entry = self.caches[name] = [0, 0]
+        entry[0 if hit else 1] += count
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def to_dict(self):
+        scale = self.steps / self.sampled_steps if self.sampled_steps else 1.0
+        phases = {}
+        for name, (total, n, per_step) in sorted(self.phases.items(), key=lambda kv: -kv[1][0]):
+            # Só as fases do laço são amostradas; as de fora entram com o tempo medido
+            phases[name] = {"total_s": total * (scale if per_step else 1.0), "measured_s": total,
+                            "calls": n, "mean_s": total / n if n else 0.0, "per_step": per_step}
+        return {
+            "mode": self.mode, "sample_every": self.sample_every,
+            "steps": self.steps, "sampled_steps": self.sampled_steps,
+            "wall_s": time.perf_counter() - self._t_created,
+            "phases": phases,
+            "traci_calls": dict(self.calls.most_common()),
+            "traci_calls_total": sum(self.calls.values()),
+            "counters": dict(self.counters),
+            "caches": {name: {"hits": h, "misses": m, "hit_rate": h / (h + m) if h + m else None}
+                       for name, (h, m) in self.caches.items()},
+            "step_time": self.step_hist.to_dict(),
+            "step_traci_calls": self.calls_hist.to_dict() if self.mode == "full" else None,
+        }
+
+    def save(self, json_file, extra=None):
+        """Grava o perfil completo em JSON (o resumo vai para o banco de resultados)."""
+        data = self.to_dict()
+        if extra:
+            data = dict(extra, **data)
+        os.makedirs(os.path.dirname(json_file) or ".", exist_ok=True)
+        with open(json_file, "w") as f:
+            json.dump(data, f, indent=1)
+        return json_file
+
+def make_profiler(mode, sample_every=100):
+    if mode in (None, "off"):
+        return NullProfiler()
+    return Profiler(mode, sample_every)
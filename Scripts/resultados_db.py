@@ -0,0 +1,441 @@
+import os
+import csv
+import json
+import math
+import time
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+
+# Banco de resultados das execuções (SQLite em modo WAL).
+#
+#   runs            — uma linha por second_run: configuração (heuristic, ER, VE,
+#                     TR, rep), seed, arquivos e o resto dos parâmetros em JSON
+#   metrics         — métricas da execução (run_simulation + ingestão), uma por linha
+#   profiles        — perfil de tempo (--profile) de qualquer modo; ligado à
+#                     execução quando é de um second_run
+#   profile_phases  — tempo total e chamadas de cada fase do perfil
+#
+# Vários controladores escrevem ao mesmo tempo: cada escrita é uma transação
+# BEGIN IMMEDIATE (o SQLite serializa), e a leitura não bloqueia por causa do WAL.
+# resultados_execucoes.csv e perfil_execucoes.csv continuam existindo, mas são
+# exportados do banco (arquivo temporário + rename), nunca anexados.
+
+SCHEMA_VERSION = 1
+DB_NAME = "resultados.sqlite"
+BUSY_TIMEOUT_S = 120
+CONFIG_COLUMNS = ("heuristic", "ER", "VE", "TR", "rep")
+INFO_COLUMNS = ("seed", "route_file", "add_file", "station_choice", "backend")
+CSV_TAIL = ("route_file", "add_file", "station_choice")  # colunas finais do CSV legado
+PROFILE_COLUMNS = ("method", "mode", "route_file", "ER", "rep", "backend", "graph_backend")
+PROFILE_SUMMARY = ("profile_mode", "steps", "wall_s", "traci_calls", "step_p50_ms", "step_p99_ms")
+# Valores críticos da t de Student (bicaudal, 95%) por graus de liberdade
+T95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+       2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+       2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+T95_LARGE = ((40, 2.021), (60, 2.000), (120, 1.980))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    heuristic TEXT, ER INTEGER, VE INTEGER, TR REAL, rep INTEGER,
+    seed INTEGER, route_file TEXT, add_file TEXT, station_choice TEXT, backend TEXT,
+    params TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (heuristic, ER, VE, TR, rep);
+-- value sem tipo declarado: inteiros continuam inteiros no CSV exportado
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value,
+    UNIQUE (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS metrics_name ON metrics (name, run_id);
+CREATE TABLE IF NOT EXISTS profiles (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs (id) ON DELETE SET NULL,
+    created TEXT NOT NULL,
+    method TEXT, mode TEXT, route_file TEXT, ER INTEGER, rep INTEGER, backend TEXT, graph_backend TEXT,
+    profile_mode TEXT, steps INTEGER, wall_s REAL, traci_calls INTEGER, step_p50_ms REAL, step_p99_ms REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS profiles_config ON profiles (method, mode, route_file, ER);
+CREATE TABLE IF NOT EXISTS profile_phases (
+    profile_id INTEGER NOT NULL REFERENCES profiles (id) ON DELETE CASCADE,
+    phase TEXT NOT NULL,
+    total_s REAL, calls INTEGER, per_step INTEGER,
+    PRIMARY KEY (profile_id, phase)
+);
+"""
+
+def t_critical(df):
+    if df <= 0:
+        return float("nan")
+    if df <= len(T95):
+        return T95[df - 1]
+    for limit, value in T95_LARGE:
+        if df <= limit:
+            return value
+    return 1.960
+
+def _number(text):
+    """Texto do CSV -> int/float; None se vazio ou não numérico."""
+    if text is None or text == "":
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+def run_exists(path, **config):
+    """
+    Há uma execução com essa configuração (colunas de `runs`)? Só leitura, sem
+    criar o banco: o agendador usa para conferir a saída de cada second_run.
+    """
+    unknown = set(config) - set(CONFIG_COLUMNS + INFO_COLUMNS)
+    if unknown:
+        raise ValueError(f"Colunas desconhecidas: {sorted(unknown)}")
+    if not os.path.isfile(path):
+        return False
+    conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_S)
+    try:
+        where = " AND ".join(f"{col} = ?" for col in config) or "1"
+        row = conn.execute(f"SELECT 1 FROM runs WHERE {where} LIMIT 1", tuple(config.values())).fetchone()
+    except sqlite3.OperationalError:
+        return False  # banco ainda sem esquema
+    finally:
+        conn.close()
+    return row is not None
+
+def _write_csv_atomic(path, fieldnames, rows):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", suffix=".csv", dir=directory)
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+class ResultsStore:
+    """
+    Banco de resultados. `add_run`/`add_profile` acumulam num lote que `flush`
+    (ou a saída do `with`) grava numa única transação. Na primeira abertura, as
+    linhas de `legacy_csv` (resultados_execucoes.csv de antes do banco) são importadas.
+    """
+
+    def __init__(self, path, legacy_csv=None, legacy_profiles_csv=None):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_S, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self._pending_runs = []
+        self._pending_profiles = []
+        # executescript faz COMMIT implícito: o esquema (idempotente) fica fora da transação
+        self.conn.executescript(SCHEMA)
+        with self._write():
+            if self._meta("schema_version") is None:
+                self._set_meta("schema_version", SCHEMA_VERSION)
+                if legacy_csv and os.path.isfile(legacy_csv):
+                    ids = self._insert_runs([self._run_from_csv(row) for row in self._read_csv(legacy_csv)])
+                    print(f"🗃️  {len(ids)} linha(s) de {legacy_csv} importadas para {path}")
+                if legacy_profiles_csv and os.path.isfile(legacy_profiles_csv):
+                    rows = self._read_csv(legacy_profiles_csv)
+                    self._insert_profiles([self._profile_from_csv(row) for row in rows])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    # --- Transações
+    @contextlib.contextmanager
+    def _write(self):
+        """BEGIN IMMEDIATE ... COMMIT (ROLLBACK em exceção); espera o lock até BUSY_TIMEOUT_S."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # --- Execuções
+    def add_run(self, row, params=None):
+        """
+        `row`: a linha de resultados do controlador. Configuração e colunas de
+        INFO_COLUMNS viram colunas; os demais valores numéricos, métricas; o
+        resto vai para `params` (JSON).
+        """
+        row = dict(row)
+        params = dict(params or {})
+        run = {col: row.pop(col, None) for col in CONFIG_COLUMNS}
+        for col in INFO_COLUMNS:
+            run[col] = row.pop(col, params.pop(col, None))
+        metrics = {}
+        for name, value in row.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics[name] = value
+            elif value is not None:
+                params[name] = value
+        run["params"] = json.dumps(params, sort_keys=True) if params else None
+        self._pending_runs.append((run, metrics))
+        return len(self._pending_runs) - 1
+
+    def add_profile(self, data, extra=None, run_id=None):
+        """`data`: Profiler.to_dict(); `extra`: método, modo, rota, ER... da execução."""
+        extra = dict(extra or {})
+        profile = {col: extra.get(col) for col in PROFILE_COLUMNS}
+        profile.update({
+            "run_id": run_id, "profile_mode": data.get("mode"), "steps": data.get("steps"),
+            "wall_s": round(data.get("wall_s", 0.0), 3), "traci_calls": data.get("traci_calls_total"),
+            "step_p50_ms": round(data["step_time"]["p50"] * 1000, 3) if data.get("step_time") else None,
+            "step_p99_ms": round(data["step_time"]["p99"] * 1000, 3) if data.get("step_time") else None,
+            "data": json.dumps(dict(extra, **data)),
+        })
+        phases = [(name, round(ph["total_s"], 6), ph.get("calls"), int(bool(ph.get("per_step"))))
+                  for name, ph in data.get("phases", {}).items()]
+        self._pending_profiles.append((profile, phases))
+
+    def flush(self):
+        """Grava o lote pendente numa transação; devolve os ids das execuções na ordem de add_run."""
+        if not self._pending_runs and not self._pending_profiles:
+            return []
+        runs, profiles = self._pending_runs, self._pending_profiles
+        with self._write():
+            ids = self._insert_runs(runs)
+            self._insert_profiles(profiles)
+        self._pending_runs, self._pending_profiles = [], []
+        return ids
+
+    def _insert_runs(self, runs):
+        created = _now()
+        cols = ("created",) + CONFIG_COLUMNS + INFO_COLUMNS + ("params",)
+        sql = f"INSERT INTO runs ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        ids, metric_rows = [], []
+        for run, metrics in runs:
+            run_id = self.conn.execute(sql, (created,) + tuple(run.get(c) for c in cols[1:])).lastrowid
+            ids.append(run_id)
+            metric_rows.extend((run_id, name, value) for name, value in metrics.items())
+        self.conn.executemany("INSERT INTO metrics (run_id, name, value) VALUES (?, ?, ?)", metric_rows)
+        return ids
+
+    def _insert_profiles(self, profiles):
+        created = _now()
+        cols = ("run_id",) + PROFILE_COLUMNS + PROFILE_SUMMARY + ("data",)
+        sql = (f"INSERT INTO profiles (created, {', '.join(cols)}) "
+               f"VALUES (?, {', '.join('?' * len(cols))})")
+        phase_rows = []
+        for profile, phases in profiles:
+            profile_id = self.conn.execute(sql, (created,) + tuple(profile.get(c) for c in cols)).lastrowid
+            phase_rows.extend((profile_id,) + phase for phase in phases)
+        self.conn.executemany("INSERT INTO profile_phases (profile_id, phase, total_s, calls, per_step) "
+                              "VALUES (?, ?, ?, ?, ?)", phase_rows)
+
+    # --- Importação de CSVs antigos
+    @staticmethod
+    def _read_csv(path):
+        with open(path, newline="") as f:
+            return list(csv.DictReader(f))
+
+    @staticmethod
+    def _run_from_csv(row):
+        run = {col: _number(row.get(col)) for col in CONFIG_COLUMNS + ("seed",)}
+        run["heuristic"] = row.get("heuristic") or None
+        params = {}
+        for col in INFO_COLUMNS:
+            if col != "seed":
+                run[col] = row.get(col) or None
+        metrics = {}
+        for name, text in row.items():
+            if name in CONFIG_COLUMNS or name in INFO_COLUMNS or name is None:
+                continue
+            value = _number(text)
+            if value is not None:
+                metrics[name] = value
+            elif text:
+                params[name] = text
+        run["params"] = json.dumps(params, sort_keys=True) if params else None
+        return run, metrics
+
+    @staticmethod
+    def _profile_from_csv(row):
+        # No CSV antigo a coluna "mode" é o modo do perfilador (o do controlador se perdia)
+        profile = {col: _number(row.get(col)) if col in ("ER", "rep") else row.get(col) or None
+                   for col in PROFILE_COLUMNS}
+        profile["mode"] = None
+        profile["profile_mode"] = row.get("mode") or None
+        for col in ("steps", "wall_s", "traci_calls", "step_p50_ms", "step_p99_ms"):
+            profile[col] = _number(row.get(col))
+        phases = [(name[2:], _number(text), None, None) for name, text in row.items()
+                  if name and name.startswith("t_") and _number(text) is not None]
+        return profile, phases
+
+    def import_csv(self, path, batch=1000):
+        """Importa as linhas de um resultados_execucoes.csv em lotes de `batch`."""
+        rows = [self._run_from_csv(row) for row in self._read_csv(path)]
+        for i in range(0, len(rows), batch):
+            with self._write():
+                self._insert_runs(rows[i:i + batch])
+        return len(rows)
+
+    # --- Consultas
+    def metric_names(self):
+        """Métricas na ordem em que apareceram pela primeira vez."""
+        return [r[0] for r in self.conn.execute(
+            "SELECT name FROM metrics GROUP BY name ORDER BY MIN(rowid)")]
+
+    def aggregate(self, metric, by=CONFIG_COLUMNS[:4]):
+        """
+        Média, desvio e IC 95% (t de Student) de `metric` por configuração
+        (`by` ⊆ colunas de configuração/INFO_COLUMNS).
+        """
+        by = list(by)
+        unknown = set(by) - set(CONFIG_COLUMNS + INFO_COLUMNS)
+        if unknown:
+            raise ValueError(f"Colunas de agrupamento desconhecidas: {sorted(unknown)}")
+        group = ", ".join(f"r.{c}" for c in by)
+        sql = (f"SELECT {group + ', ' if by else ''}COUNT(m.value), AVG(m.value), SUM(m.value * m.value), "
+               f"MIN(m.value), MAX(m.value) "
+               f"FROM runs r JOIN metrics m ON m.run_id = r.id AND m.name = ? "
+               f"{'GROUP BY ' + group + ' ORDER BY ' + group if by else ''}")
+        out = []
+        for row in self.conn.execute(sql, (metric,)):
+            n, mean, sumsq, lo, hi = row[len(by):]
+            std = math.sqrt(max(0.0, (sumsq - n * mean * mean) / (n - 1))) if n > 1 else float("nan")
+            half = t_critical(n - 1) * std / math.sqrt(n) if n > 1 else float("nan")
+            out.append(dict(zip(by, row[:len(by)]), metric=metric, n=n, mean=mean, std=std,
+                            ci95_low=mean - half, ci95_high=mean + half, min=lo, max=hi))
+        return out
+
+    def phase_summary(self, by=("method", "mode")):
+        """Tempo médio de cada fase dos perfis, por método/modo."""
+        by = list(by)
+        unknown = set(by) - set(PROFILE_COLUMNS + ("profile_mode",))
+        if unknown:
+            raise ValueError(f"Colunas de agrupamento desconhecidas: {sorted(unknown)}")
+        group = ", ".join(f"p.{c}" for c in by)
+        sql = (f"SELECT {group}, ph.phase, COUNT(*), AVG(ph.total_s), SUM(ph.total_s) "
+               f"FROM profiles p JOIN profile_phases ph ON ph.profile_id = p.id "
+               f"GROUP BY {group}, ph.phase ORDER BY {group}, SUM(ph.total_s) DESC")
+        return [dict(zip(by + ["phase", "n", "mean_s", "total_s"], row)) for row in self.conn.execute(sql)]
+
+    # --- Exportação
+    def run_rows(self):
+        """Linhas no formato do resultados_execucoes.csv (configuração, métricas, arquivos)."""
+        names = self.metric_names()
+        metrics = {}
+        for run_id, name, value in self.conn.execute("SELECT run_id, name, value FROM metrics"):
+            metrics.setdefault(run_id, {})[name] = value
+        cols = ("id",) + CONFIG_COLUMNS + CSV_TAIL
+        rows = []
+        for values in self.conn.execute(f"SELECT {', '.join(cols)} FROM runs ORDER BY id"):
+            row = dict(zip(cols, values))
+            row.update(metrics.get(row.pop("id"), {}))
+            rows.append(row)
+        return list(CONFIG_COLUMNS) + names + list(CSV_TAIL), rows
+
+    def profile_rows(self):
+        """Linhas-resumo dos perfis (uma coluna t_<fase> por fase)."""
+        phases = {}
+        names = []
+        for profile_id, phase, total in self.conn.execute(
+                "SELECT profile_id, phase, total_s FROM profile_phases ORDER BY rowid"):
+            phases.setdefault(profile_id, {})[f"t_{phase}"] = round(total, 3)
+            if f"t_{phase}" not in names:
+                names.append(f"t_{phase}")
+        cols = ("id",) + PROFILE_COLUMNS + PROFILE_SUMMARY
+        rows = []
+        for values in self.conn.execute(f"SELECT {', '.join(cols)} FROM profiles ORDER BY id"):
+            row = dict(zip(cols, values))
+            row.update(phases.get(row.pop("id"), {}))
+            rows.append(row)
+        return list(PROFILE_COLUMNS + PROFILE_SUMMARY) + names, rows
+
+    def export_csv(self, path=None, profiles_path=None):
+        """
+        Reescreve os CSVs a partir do banco (temporário + rename). Roda com o lock
+        de escrita: o último exportador sempre vê todas as linhas já gravadas.
+        """
+        with self._write():
+            if path:
+                _write_csv_atomic(path, *self.run_rows())
+            if profiles_path:
+                _write_csv_atomic(profiles_path, *self.profile_rows())
+
+def _format(value, digits=3):
+    if isinstance(value, float):
+        return "nan" if math.isnan(value) else f"{value:.{digits}f}"
+    return str(value)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Consulta, exporta e importa o banco de resultados (resultados.sqlite).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ap_sum = sub.add_parser("resumo", help="Média e IC 95% das métricas por configuração")
+    ap_sum.add_argument("db")
+    ap_sum.add_argument("--metrics", nargs="+", default=["T_espera", "D_estacao"])
+    ap_sum.add_argument("--by", nargs="*", default=list(CONFIG_COLUMNS[:4]))
+    ap_ph = sub.add_parser("fases", help="Tempo médio por fase dos perfis")
+    ap_ph.add_argument("db")
+    ap_ph.add_argument("--by", nargs="+", default=["method", "mode"])
+    ap_exp = sub.add_parser("exportar", help="Reescreve os CSVs a partir do banco")
+    ap_exp.add_argument("db")
+    ap_exp.add_argument("--csv", default=None, help="Padrão: resultados_execucoes.csv ao lado do banco")
+    ap_exp.add_argument("--perfis", default=None, help="Padrão: perfil_execucoes.csv ao lado do banco")
+    ap_imp = sub.add_parser("importar", help="Importa resultados_execucoes.csv (ex.: de outros servidores)")
+    ap_imp.add_argument("db")
+    ap_imp.add_argument("csvs", nargs="+")
+    args = ap.parse_args()
+
+    with ResultsStore(args.db) as store:
+        if args.cmd == "resumo":
+            for metric in args.metrics:
+                rows = store.aggregate(metric, args.by)
+                print(f"\n📊 {metric} ({len(rows)} configurações)")
+                header = args.by + ["n", "média", "desvio", "IC95 inf", "IC95 sup"]
+                print(" | ".join(f"{h:>10}" for h in header))
+                for r in rows:
+                    values = [r[c] for c in args.by] + [r["n"], r["mean"], r["std"], r["ci95_low"], r["ci95_high"]]
+                    print(" | ".join(f"{_format(v):>10}" for v in values))
+        elif args.cmd == "fases":
+            for r in store.phase_summary(args.by):
+                print(" | ".join(f"{_format(r[c]):>16}" for c in args.by + ["phase", "n", "mean_s", "total_s"]))
+        elif args.cmd == "exportar":
+            base = os.path.dirname(os.path.abspath(args.db))
+            csv_file = args.csv or os.path.join(base, "resultados_execucoes.csv")
+            profiles_file = args.perfis or os.path.join(base, "perfil_execucoes.csv")
+            store.export_csv(csv_file, profiles_file)
+            print(f"📈 Exportado: {csv_file}, {profiles_file}")
+        elif args.cmd == "importar":
+            for path in args.csvs:
+                print(f"🗃️  {store.import_csv(path)} linha(s) importadas de {path}")
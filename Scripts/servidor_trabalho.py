@@ -0,0 +1,315 @@
+import os
+import sys
+import gc
+import json
+import time
+import errno
+import signal
+import socket
+import argparse
+import selectors
+import traceback
+
+# Servidor de trabalho (fork-server) do controlador.
+#
+# `serve` importa o controlador (networkx, shapely, scipy, traci...), abre o
+# índice da rede e monta os grafos UMA vez; cada job recebido pelo socket Unix
+# roda controlador_pa_opt.main(argv) num fork, que herda tudo isso por
+# copy-on-write em vez de pagar a partida do interpretador e a montagem do grafo.
+#
+# `submit` é o cliente: manda argv + diretório de trabalho, passa o próprio
+# stdout ao servidor (SCM_RIGHTS) para a saída do job sair onde sairia a do
+# controlador, e termina com o código de saída do job. Se o cliente morre, o
+# job é encerrado.
+#
+# O ambiente (SUMO_HOME etc.) é o do servidor, não o do cliente.
+
+DEFAULT_SOCKET = "controlador.sock"
+CONTROLLER_MODULE = "controlador_pa_opt"
+POLL_SEC = 0.2
+
+def _read_line(conn, buf=b""):
+    while b"\n" not in buf:
+        chunk = conn.recv(65536)
+        if not chunk:
+            raise ConnectionError("conexão encerrada antes do fim da mensagem")
+        buf += chunk
+    line, _, _ = buf.partition(b"\n")
+    return json.loads(line)
+
+def _send(conn, obj):
+    conn.sendall((json.dumps(obj) + "\n").encode())
+
+# --- Cliente
+def submit(socket_path, argv, cwd=None, out_fd=None):
+    """Roda um job no servidor e devolve a resposta ({"rc", "seconds", "pid"})."""
+    out_fd = sys.stdout.fileno() if out_fd is None else out_fd
+    sys.stdout.flush()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        request = json.dumps({"argv": list(argv), "cwd": cwd or os.getcwd()}).encode() + b"\n"
+        socket.send_fds(conn, [request], [out_fd])
+        return _read_line(conn)
+
+def request_shutdown(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        _send(conn, {"cmd": "shutdown"})
+        return _read_line(conn)
+
+# --- Servidor
+class WorkServer:
+    """Pré-carrega o controlador e a rede; atende cada job num fork (até `max_jobs` ao mesmo tempo)."""
+
+    def __init__(self, socket_path, net_files, graph_backends, max_jobs=1):
+        self.socket_path = os.path.abspath(socket_path)
+        self.net_files = [os.path.abspath(p) for p in net_files]
+        self.graph_backends = graph_backends
+        self.max_jobs = max(1, max_jobs)
+        self.ctrl = None
+        self.signatures = {}
+        self.queue = []     # (conn, request, fd) aguardando vaga
+        self.running = {}   # pid -> (conn, início)
+        self.selector = selectors.DefaultSelector()
+        self.listener = None
+        self.stopping = False
+        self.jobs = 0
+
+    def preload(self):
+        t0 = time.perf_counter()
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import importlib
+        self.ctrl = importlib.import_module(CONTROLLER_MODULE)
+        try:
+            import libsumo  # noqa: F401  (só carrega a biblioteca; nenhuma simulação é iniciada)
+        except ImportError:
+            pass
+        for net_file in self.net_files:
+            self._load_net(net_file)
+        # Objetos pré-carregados fora do GC: os forks não tocam nas páginas deles à toa
+        gc.collect()
+        gc.freeze()
+        print(f"✅ Controlador e {len(self.net_files)} rede(s) pré-carregados em {time.perf_counter() - t0:.2f}s")
+
+    def _load_net(self, net_file):
+        ctrl = self.ctrl
+        index = ctrl.get_net_index(net_file)
+        # Dicionários id -> posição montados já no pai
+        index.lane_position(""), index.edge_position(""), index.node_position("")
+        for backend in self.graph_backends:
+            ctrl.get_graph(net_file, backend)
+        if ctrl.indice_geometrico.SHAPELY_2:
+            ctrl.get_geometry_index(net_file)
+            ctrl.get_distance_bound(net_file)
+        st = os.stat(net_file)
+        self.signatures[net_file] = (st.st_mtime_ns, st.st_size)
+        print(f"🧱 Rede {net_file}: {len(index.lane_ids)} lanes, grafos {', '.join(self.graph_backends)}")
+
+    def _refresh_changed_nets(self):
+        for net_file, signature in list(self.signatures.items()):
+            try:
+                st = os.stat(net_file)
+            except OSError:
+                continue
+            if (st.st_mtime_ns, st.st_size) != signature:
+                print(f"♻️  {net_file} mudou no disco: recarregando")
+                gc.unfreeze()
+                self.ctrl.forget_net(net_file)
+                self._load_net(net_file)
+                gc.collect()
+                gc.freeze()
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(self.socket_path)
+                sys.exit(f"❌ Já existe um servidor atendendo em {self.socket_path}")
+            except OSError:
+                os.remove(self.socket_path)  # socket órfão de um servidor que caiu
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        self.listener.listen(64)
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        signal.signal(signal.SIGTERM, self._stop_signal)
+        signal.signal(signal.SIGINT, self._stop_signal)
+        print(f"📡 Servidor de trabalho em {self.socket_path} (até {self.max_jobs} job(s) em paralelo)", flush=True)
+        try:
+            while not (self.stopping and not self.running and not self.queue):
+                for key, _ in self.selector.select(timeout=POLL_SEC):
+                    if key.fileobj is self.listener:
+                        self._accept()
+                    else:
+                        self._client_gone(key.fileobj, key.data)
+                self._reap()
+                self._launch()
+        finally:
+            self.selector.close()
+            self.listener.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        print(f"👋 Servidor encerrado após {self.jobs} job(s).")
+
+    def _stop_signal(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        for conn, _, fd in self.queue:
+            os.close(fd)
+            conn.close()
+        self.queue.clear()
+        for pid in self.running:
+            os.kill(pid, signal.SIGTERM)
+
+    def _accept(self):
+        conn, _ = self.listener.accept()
+        conn.settimeout(5)
+        try:
+            msg, fds, _, _ = socket.recv_fds(conn, 65536, 1)
+            request = _read_line(conn, msg)
+        except (OSError, ValueError, ConnectionError) as e:
+            print(f"⚠️  Pedido inválido: {e}")
+            conn.close()
+            return
+        if request.get("cmd") == "shutdown":
+            _send(conn, {"ok": True, "running": len(self.running)})
+            conn.close()
+            self.stopping = True
+            return
+        if not fds or self.stopping:
+            for fd in fds:
+                os.close(fd)
+            _send(conn, {"rc": 1, "error": "servidor encerrando" if self.stopping else "sem descritor de saída"})
+            conn.close()
+            return
+        conn.settimeout(None)
+        self.queue.append((conn, request, fds[0]))
+
+    def _launch(self):
+        while self.queue and len(self.running) < self.max_jobs and not self.stopping:
+            conn, request, fd = self.queue.pop(0)
+            self._refresh_changed_nets()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                self._run_child(request, fd)  # não retorna
+            os.close(fd)
+            self.running[pid] = (conn, time.time())
+            self.selector.register(conn, selectors.EVENT_READ, pid)
+            self.jobs += 1
+
+    def _run_child(self, request, fd):
+        code = 1
+        try:
+            self.selector.close()
+            self.listener.close()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            os.dup2(fd, 1)
+            os.dup2(fd, 2)
+            os.close(fd)
+            os.chdir(request["cwd"])
+            argv = [str(a) for a in request["argv"]]
+            sys.argv = [self.ctrl.__file__] + argv
+            try:
+                self.ctrl.main(argv)
+                code = 0
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    code = e.code or 0
+                else:
+                    print(e.code, file=sys.stderr)
+                    code = 1
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    def _reap(self):
+        while self.running:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            conn, t0 = self.running.pop(pid, (None, None))
+            if conn is None:
+                continue
+            rc = os.waitstatus_to_exitcode(status)
+            if conn.fileno() in self.selector.get_map():
+                self.selector.unregister(conn)
+            try:
+                _send(conn, {"rc": rc, "seconds": round(time.time() - t0, 3), "pid": pid})
+            except OSError as e:
+                if e.errno not in (errno.EPIPE, errno.ECONNRESET):
+                    raise
+            conn.close()
+
+    def _client_gone(self, conn, pid):
+        """Conexão de um job em andamento ficou legível: só pode ser o cliente fechando."""
+        try:
+            data = conn.recv(1)
+        except OSError:
+            data = b""
+        if not data:
+            self.selector.unregister(conn)
+            if pid in self.running:
+                print(f"⏹️  Cliente do job {pid} desconectou: encerrando o job")
+                os.kill(pid, signal.SIGTERM)
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fork-server do controlador: pré-carrega rede e grafo, roda jobs em forks.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ap_serve = sub.add_parser("serve", help="Sobe o servidor")
+    ap_serve.add_argument("--socket", default=DEFAULT_SOCKET)
+    ap_serve.add_argument("--net_file", nargs="+", default=["cologne2.net.xml"], help="Redes a pré-carregar")
+    ap_serve.add_argument("--graph_backend", nargs="+", choices=["networkx", "csr"], default=["networkx"],
+                          help="Grafos a pré-montar (os jobs com outro backend montam o seu)")
+    ap_serve.add_argument("--max_jobs", type=int, default=1, help="Jobs simultâneos (cada um é um fork)")
+    ap_submit = sub.add_parser("submit", help="Roda um job: argumentos do controlador depois de --")
+    ap_submit.add_argument("--socket", default=DEFAULT_SOCKET)
+    ap_submit.add_argument("controller_args", nargs=argparse.REMAINDER)
+    ap_stop = sub.add_parser("stop", help="Encerra o servidor depois dos jobs em andamento")
+    ap_stop.add_argument("--socket", default=DEFAULT_SOCKET)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "serve":
+        if os.environ.get("PYTHONHASHSEED") != "0":
+            # A ordem de iteração dos sets do controlador depende disso; os forks herdam a do servidor
+            os.execve(sys.executable, [sys.executable] + sys.argv, dict(os.environ, PYTHONHASHSEED="0"))
+        server = WorkServer(args.socket, args.net_file, args.graph_backend, args.max_jobs)
+        server.preload()
+        server.serve()
+        return 0
+
+    if args.cmd == "stop":
+        try:
+            reply = request_shutdown(args.socket)
+        except OSError as e:
+            sys.exit(f"❌ Servidor de trabalho indisponível em {args.socket}: {e}")
+        print(f"👋 Servidor encerrando ({reply.get('running', 0)} job(s) em andamento)")
+        return 0
+
+    controller_args = args.controller_args[1:] if args.controller_args[:1] == ["--"] else args.controller_args
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        reply = submit(args.socket, controller_args)
+    except KeyboardInterrupt:
+        return 130
+    except OSError as e:
+        sys.exit(f"❌ Servidor de trabalho indisponível em {args.socket}: {e}")
+    if reply.get("error"):
+        print(f"❌ {reply['error']}", file=sys.stderr)
+    return reply.get("rc", 1)
+
+if __name__ == "__main__":
+    sys.exit(main())
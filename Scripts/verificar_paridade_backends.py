@@ -0,0 +1,120 @@
+import os
+import sys
+import csv
+import shutil
+import random
+import argparse
+import tempfile
+import subprocess
+
+import definir_eletricos
+from visitas_faixas import load_lane_visits
+
+# Verifica se os backends traci e libsumo do controlador produzem exatamente os
+# mesmos resultados (lane_visits, .add.xml e métricas do second_run) numa rede
+# pequena gerada localmente, com seed fixa.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER = os.path.join(SCRIPT_DIR, "controlador_pa_opt.py")
+
+SUMOCFG = """<?xml version="1.0" encoding="UTF-8"?>
+<configuration>
+    <input>
+        <net-file value="cologne2.net.xml"/>
+    </input>
+</configuration>
+"""
+
+def build_scenario(work_dir, grid, trips, ev_fraction, seed):
+    """Gera rede em grade, viagens aleatórias e o arquivo de rotas com VEs."""
+    sumo_home = os.environ["SUMO_HOME"]
+    net_file = os.path.join(work_dir, "cologne2.net.xml")
+    subprocess.run([
+        os.path.join(sumo_home, "bin", "netgenerate"), "--grid",
+        "--grid.number", str(grid), "--grid.length", "150",
+        "--default.lanenumber", "2", "-o", net_file
+    ], check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([
+        sys.executable, os.path.join(sumo_home, "tools", "randomTrips.py"),
+        "-n", net_file, "-r", os.path.join(work_dir, "rotas.rou.xml"),
+        "-o", os.path.join(work_dir, "trips.trips.xml"),
+        "-e", str(trips), "-p", "1.0", "--vehicle-class", "passenger",
+        "--prefix", "", "--seed", str(seed)
+    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(os.path.join(work_dir, "cologne.sumocfg"), "w") as f:
+        f.write(SUMOCFG)
+    with open(os.path.join(work_dir, "cologne.poly.xml"), "w") as f:
+        f.write("<additional/>\n")
+
+    route_file = f"rotas_{ev_fraction * 100:.0f}_0_mod.rou.xml"
+    random.seed(seed)
+    definir_eletricos.definir_eletricos(os.path.join(work_dir, "rotas.rou.xml"),
+                                        os.path.join(work_dir, route_file), ev_fraction)
+    return route_file
+
+def run_backend(scenario_dir, run_dir, backend, route_file, method, er, seed):
+    shutil.copytree(scenario_dir, run_dir)
+    base_name = route_file.replace("_mod.rou.xml", "")
+    common = ["--route_file", route_file, "--method", method, "--er", str(er),
+              "--seed", str(seed), "--threads", "1", "--out_dir", "output", "--backend", backend]
+    env = dict(os.environ, PYTHONHASHSEED="0")
+    for extra in (["--mode", "first_run"],
+                  ["--mode", "second_run", "--tr_min", "0.2",
+                   "--add_file", f"output/parking_areas_{method}_{base_name}_er{er}.add.xml"]):
+        with open(os.path.join(run_dir, f"{backend}_{extra[1]}.log"), "w") as log:
+            subprocess.run([sys.executable, CONTROLLER] + common + extra, cwd=run_dir,
+                           env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+
+    lane_visits = load_lane_visits(os.path.join(run_dir, "output", f"lane_visits_{base_name}.npz")).totals_dict()
+    with open(os.path.join(run_dir, "output", f"parking_areas_{method}_{base_name}_er{er}.add.xml"), "rb") as f:
+        add_xml = f.read()
+    with open(os.path.join(run_dir, "output", "resultados_execucoes.csv")) as f:
+        row = list(csv.DictReader(f))[-1]
+    metrics = {k: row[k] for k in ("T_espera", "D_estacao", "N_teleport")}
+    return lane_visits, add_xml, metrics
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Teste de paridade entre os backends traci e libsumo.")
+    ap.add_argument("--grid", type=int, default=5, help="Nº de junções por lado da grade")
+    ap.add_argument("--trips", type=int, default=200)
+    ap.add_argument("--ev", type=float, default=0.5, help="Fração de veículos elétricos")
+    ap.add_argument("--method", choices=["random", "greedy", "grasp"], default="greedy")
+    ap.add_argument("--er", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--keep", action="store_true", help="Mantém o diretório de trabalho")
+    args = ap.parse_args()
+
+    if "SUMO_HOME" not in os.environ:
+        sys.exit("Declare a variável de ambiente 'SUMO_HOME'")
+
+    work_dir = tempfile.mkdtemp(prefix="paridade_backends_")
+    try:
+        scenario_dir = os.path.join(work_dir, "cenario")
+        os.makedirs(os.path.join(scenario_dir, "output"))
+        route_file = build_scenario(scenario_dir, args.grid, args.trips, args.ev, args.seed)
+
+        results = {}
+        for backend in ("traci", "libsumo"):
+            print(f"🚀 Rodando backend {backend} ...")
+            results[backend] = run_backend(scenario_dir, os.path.join(work_dir, backend), backend,
+                                           route_file, args.method, args.er, args.seed)
+
+        (v_traci, add_traci, m_traci), (v_lib, add_lib, m_lib) = results["traci"], results["libsumo"]
+        failures = []
+        if v_traci != v_lib:
+            failures.append(f"lane_visits diferentes ({len(v_traci)} vs {len(v_lib)} lanes)")
+        if add_traci != add_lib:
+            failures.append(".add.xml diferentes")
+        if m_traci != m_lib:
+            failures.append(f"métricas diferentes: traci={m_traci} libsumo={m_lib}")
+
+        if failures:
+            for msg in failures:
+                print(f"❌ {msg}")
+            sys.exit(1)
+        print(f"✅ Paridade OK: {len(v_traci)} lanes visitadas, métricas {m_traci}")
+    finally:
+        if args.keep:
+            print(f"📁 Diretório de trabalho mantido em {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,185 @@
+import os
+import sys
+import argparse
+import tempfile
+
+import numpy as np
+
+# Contagem de visitas dos VEs por lane (e, opcionalmente, por janela de tempo).
+#
+# Cada lane vira um índice inteiro (a posição no índice compilado da rede) e as
+# visitas são acumuladas numa matriz lanes × janelas com np.add.at, em lotes,
+# em vez de um dict de strings incrementado veículo a veículo. O resultado é
+# gravado em .npz (só as lanes visitadas) e pode ser somado entre réplicas.
+# A ordem da primeira visita é preservada: os métodos de seleção desempatam
+# pela ordem de inserção do antigo dict lane_visits.
+
+class LaneVisits:
+    """
+    Visitas consolidadas: `lane_ids` (ordem da primeira visita) e `counts`
+    (len(lane_ids) × janelas). `bin_seconds` = 0 significa uma janela só.
+    """
+
+    def __init__(self, lane_ids, counts, bin_seconds=0.0):
+        self.lane_ids = list(lane_ids)
+        self.counts = np.asarray(counts, dtype=np.int64).reshape(len(self.lane_ids), -1)
+        self.bin_seconds = float(bin_seconds)
+
+    def __len__(self):
+        return len(self.lane_ids)
+
+    @property
+    def num_bins(self):
+        return self.counts.shape[1]
+
+    def totals(self, start=None, end=None):
+        """Total por lane; com `start`/`end` (s), só as janelas nesse intervalo."""
+        counts = self.counts
+        if self.bin_seconds and (start is not None or end is not None):
+            first = int(start // self.bin_seconds) if start is not None else 0
+            last = int(np.ceil(end / self.bin_seconds)) if end is not None else self.num_bins
+            counts = counts[:, first:last]
+        return counts.sum(axis=1)
+
+    def totals_dict(self, start=None, end=None):
+        """{lane: visitas} na ordem da primeira visita, sem as lanes zeradas."""
+        totals = self.totals(start, end).tolist()
+        return {lane: int(c) for lane, c in zip(self.lane_ids, totals) if c}
+
+    def save(self, path):
+        """Grava em .npz de forma atômica (arquivo temporário + rename)."""
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".npz")
+        encoded = [lane.encode("utf-8") for lane in self.lane_ids]
+        width = max((len(v) for v in encoded), default=1) or 1
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, lane_ids=np.array(encoded, dtype=f"S{width}"), counts=self.counts,
+                     bin_seconds=np.float64(self.bin_seconds))
+        os.replace(tmp, path)
+        return path
+
+def load_lane_visits(path):
+    with np.load(path) as data:
+        lane_ids = [v.decode("utf-8") for v in data["lane_ids"].tolist()]
+        return LaneVisits(lane_ids, data["counts"], float(data["bin_seconds"]))
+
+def merge_lane_visits(items):
+    """
+    Soma visitas de várias réplicas (objetos LaneVisits ou caminhos .npz).
+    As lanes ficam na ordem da primeira réplica em que aparecem; todas precisam
+    usar a mesma largura de janela.
+    """
+    items = [load_lane_visits(it) if isinstance(it, str) else it for it in items]
+    if not items:
+        return LaneVisits([], np.zeros((0, 1)))
+    bin_seconds = items[0].bin_seconds
+    if any(it.bin_seconds != bin_seconds for it in items):
+        raise ValueError("Réplicas com larguras de janela diferentes não podem ser somadas.")
+
+    position = {}
+    for it in items:
+        for lane in it.lane_ids:
+            position.setdefault(lane, len(position))
+    counts = np.zeros((len(position), max(it.num_bins for it in items)), dtype=np.int64)
+    for it in items:
+        rows = np.fromiter((position[lane] for lane in it.lane_ids), dtype=np.intp, count=len(it))
+        counts[rows, :it.num_bins] += it.counts
+    return LaneVisits(list(position), counts, bin_seconds)
+
+class LaneVisitAccumulator:
+    """
+    Acumula visitas durante a simulação. `add` só enfileira (lane, janela);
+    a soma na matriz é feita em lote a cada `batch` visitas ou no `result`.
+    Lanes fora do índice da rede ganham linhas extras no fim da matriz.
+    """
+
+    def __init__(self, index, bin_seconds=0.0, batch=8192):
+        self.index = index
+        self.bin_seconds = float(bin_seconds or 0.0)
+        self.batch = batch
+        self.lane_ids = list(index.lane_ids)
+        self._extra = {}
+        n = len(self.lane_ids)
+        self.counts = np.zeros((n, 1), dtype=np.int64)
+        self.first_seen = np.full(n, -1, dtype=np.int64)
+        self._seq = 0
+        self._lanes = []
+        self._bins = []
+
+    def _lane_index(self, lane_id):
+        i = self.index.lane_position(lane_id)
+        if i >= 0:
+            return i
+        i = self._extra.get(lane_id)
+        if i is None:
+            i = self._extra[lane_id] = len(self.lane_ids)
+            self.lane_ids.append(lane_id)
+        return i
+
+    def add(self, lane_id, now):
+        self._lanes.append(self._lane_index(lane_id))
+        self._bins.append(int(now // self.bin_seconds) if self.bin_seconds else 0)
+        if len(self._lanes) >= self.batch:
+            self._apply()
+
+    def _apply(self):
+        if not self._lanes:
+            return
+        lanes = np.asarray(self._lanes, dtype=np.intp)
+        bins = np.asarray(self._bins, dtype=np.intp)
+        self._lanes, self._bins = [], []
+
+        rows, cols = self.counts.shape
+        need_rows, need_cols = len(self.lane_ids), int(bins.max()) + 1
+        if need_rows > rows or need_cols > cols:
+            # Janelas novas: dobra as colunas para não realocar a cada janela
+            grown = np.zeros((max(rows, need_rows), cols if need_cols <= cols else max(need_cols, 2 * cols)),
+                             dtype=np.int64)
+            grown[:rows, :cols] = self.counts
+            self.counts = grown
+            first_seen = np.full(grown.shape[0], -1, dtype=np.int64)
+            first_seen[:rows] = self.first_seen
+            self.first_seen = first_seen
+
+        uniq, first = np.unique(lanes, return_index=True)
+        new = self.first_seen[uniq] < 0
+        self.first_seen[uniq[new]] = self._seq + first[new]
+        self._seq += len(lanes)
+        np.add.at(self.counts, (lanes, bins), 1)
+
+    def result(self):
+        """LaneVisits só com as lanes visitadas, na ordem da primeira visita."""
+        self._apply()
+        visited = np.flatnonzero(self.first_seen >= 0)
+        order = visited[np.argsort(self.first_seen[visited], kind="stable")]
+        used_bins = int(np.flatnonzero(self.counts.any(axis=0)).max()) + 1 if order.size else 1
+        return LaneVisits([self.lane_ids[i] for i in order.tolist()], self.counts[order, :used_bins],
+                          self.bin_seconds)
+
+    def flush(self, path):
+        """Grava o estado parcial (checkpoint) sem interromper a acumulação."""
+        return self.result().save(path)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Inspeciona ou soma arquivos de visitas por lane (.npz).")
+    ap.add_argument("files", nargs="+", help="Arquivos lane_visits_*.npz")
+    ap.add_argument("--merge", metavar="SAIDA", help="Soma as réplicas e grava o resultado em SAIDA (.npz)")
+    ap.add_argument("--top", type=int, default=10, help="Quantas lanes mais visitadas listar")
+    args = ap.parse_args()
+
+    for path in args.files:
+        if not os.path.isfile(path):
+            sys.exit(f"❌ Arquivo não encontrado: {path}")
+    try:
+        visits = merge_lane_visits(args.files)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+    totals = visits.totals()
+    print(f"✅ {len(args.files)} arquivo(s): {len(visits)} lanes visitadas, {int(totals.sum())} visitas, "
+          f"{visits.num_bins} janela(s)" + (f" de {visits.bin_seconds:.0f}s" if visits.bin_seconds else ""))
+    for k in np.argsort(-totals, kind="stable")[:args.top].tolist():
+        print(f"   {visits.lane_ids[k]}: {int(totals[k])}")
+    if args.merge:
+        visits.save(args.merge)
+        print(f"💾 Visitas somadas salvas em {args.merge}")